@@ -0,0 +1,162 @@
+"""
+Speed and tokens-per-chunk distribution of the markdown splitters:
+the previous MarkdownHeaderTextSplitter + RecursiveCharacterTextSplitter
+pair with a 2500 character budget against MarkdownTokenSplitter with a
+token budget of the e5 tokenizer:
+
+    python benchmarks/chunk_splitters.py --limit 500
+    python benchmarks/chunk_splitters.py --synthetic 1 --output split.json
+
+Documents are read from the configured processed documents storage
+(StorageBackend and collection env variables) or generated by
+benchmarks/synthetic_corpus.py. Tokens of every chunk are counted with
+the e5 tokenizer, special tokens included, as the embedding model sees
+them: chunks over 512 tokens are truncated by the model.
+"""
+
+from itertools import islice
+import json
+from pathlib import Path
+import time
+from typing import Any, Dict, List, Optional
+
+import click
+from langchain_core.documents import Document
+from langchain_text_splitters import (
+    MarkdownHeaderTextSplitter,
+    RecursiveCharacterTextSplitter,
+)
+import numpy as np
+from transformers import AutoTokenizer
+
+from financial_data.preprocessing.split import (
+    SPLIT_CONFIG,
+    TOKENIZER_PATH,
+    MarkdownTokenSplitter,
+)
+from financial_data.storages import initialize_storage
+from synthetic_corpus import iter_raw_documents
+
+
+MODEL_MAX_TOKENS = 512
+HISTOGRAM_BIN = 64
+
+
+class CharacterChunkSplitter:
+    """
+    The splitter used before MarkdownTokenSplitter.
+    """
+
+    def __init__(self, chunk_size: int = 2500) -> None:
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            separators=["."],
+            chunk_size=chunk_size,
+            chunk_overlap=int(0.15 * chunk_size),
+        )
+
+    def split(self, text: str) -> List[Document]:
+        md_splitter = MarkdownHeaderTextSplitter(**SPLIT_CONFIG)
+        documents = md_splitter.split_text(text)
+        return self.text_splitter.split_documents(documents)
+
+
+def load_documents(limit: Optional[int], synthetic: Optional[int]) -> List[str]:
+    if synthetic:
+        documents = (content for _, content in iter_raw_documents(synthetic))
+    else:
+        document_storage = initialize_storage("document")
+        documents = (
+            document["content"]
+            for document in document_storage.iter_processed_documents(
+                projection=["content"]
+            )
+        )
+    return list(islice(documents, limit))
+
+
+def describe(token_counts: List[int]) -> Dict[str, Any]:
+    counts = np.array(token_counts)
+    histogram = np.bincount(counts // HISTOGRAM_BIN)
+    return {
+        "chunks": len(counts),
+        "mean": round(float(counts.mean()), 1),
+        "p5": int(np.percentile(counts, 5)),
+        "p50": int(np.percentile(counts, 50)),
+        "p95": int(np.percentile(counts, 95)),
+        "max": int(counts.max()),
+        "truncated_ratio": round(float(np.mean(counts > MODEL_MAX_TOKENS)), 4),
+        "histogram": {
+            f"{number * HISTOGRAM_BIN}-{(number + 1) * HISTOGRAM_BIN - 1}": int(
+                count
+            )
+            for number, count in enumerate(histogram)
+            if count
+        },
+    }
+
+
+def run_splitter(
+    splitter: Any, documents: List[str], tokenizer: Any
+) -> Dict[str, Any]:
+    start = time.perf_counter()
+    chunks = [chunk for text in documents for chunk in splitter.split(text)]
+    elapsed = time.perf_counter() - start
+    encodings = tokenizer.backend_tokenizer.encode_batch(
+        [chunk.page_content for chunk in chunks]
+    )
+    return {
+        "seconds": round(elapsed, 3),
+        "documents_per_second": round(len(documents) / elapsed, 1),
+        **describe([len(encoding.ids) for encoding in encodings]),
+    }
+
+
+@click.command()
+@click.option("--limit", type=int, default=None, help="Documents to split")
+@click.option(
+    "--synthetic",
+    type=int,
+    default=None,
+    help="Split the synthetic corpus of this scale instead of storage",
+)
+@click.option(
+    "--output", type=click.Path(dir_okay=False, path_type=Path), default=None
+)
+def main(
+    limit: Optional[int], synthetic: Optional[int], output: Optional[Path]
+) -> None:
+    documents = load_documents(limit, synthetic)
+    tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_PATH)
+    splitters = {
+        "characters (2500)": CharacterChunkSplitter(),
+        "tokens (480)": MarkdownTokenSplitter(tokenizer),
+    }
+    results = {
+        name: run_splitter(splitter, documents, tokenizer)
+        for name, splitter in splitters.items()
+    }
+
+    click.echo(f"{len(documents)} documents")
+    click.echo(
+        f"{'splitter':<20}{'docs/s':>10}{'chunks':>9}{'mean':>8}{'p5':>6}"
+        f"{'p50':>6}{'p95':>6}{'max':>7}{'> 512':>8}"
+    )
+    for name, result in results.items():
+        click.echo(
+            f"{name:<20}{result['documents_per_second']:>10.1f}"
+            f"{result['chunks']:>9}{result['mean']:>8.1f}{result['p5']:>6}"
+            f"{result['p50']:>6}{result['p95']:>6}{result['max']:>7}"
+            f"{result['truncated_ratio']:>8.1%}"
+        )
+    for name, result in results.items():
+        click.echo(f"\n{name}, tokens per chunk:")
+        width = max(result["histogram"].values())
+        for bin_range, count in result["histogram"].items():
+            bar = "#" * max(1, round(40 * count / width))
+            click.echo(f"{bin_range:>10} {count:>7} {bar}")
+    if output is not None:
+        output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Chunks per second of EDA token statistics: the per-chunk
+tokenizer.tokenize loop against batched fast-tokenizer lengths,
+and full statistics in one process against a process pool:
+
+    python benchmarks/eda_tokenizer.py --workers 8
+
+Chunks are read from the configured chunk storage
+(StorageBackend and collection env variables).
+"""
+
+from itertools import islice
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+import click
+from langchain_core.documents import Document
+from transformers import AutoTokenizer
+
+from financial_data.evaluate.eda import (
+    DEFAULT_TOKENIZER_BATCH_SIZE,
+    MODEL_PATH,
+    count_tokens,
+    iter_statistics,
+)
+from financial_data.storages import initialize_storage
+from financial_data.utils.batch import batched
+
+
+def load_chunks(limit: Optional[int]) -> List[Document]:
+    chunk_storage = initialize_storage("chunk")
+    chunks = chunk_storage.iter_chunks(
+        projection=["page_content", "metadata.source_name"]
+    )
+    return list(islice(chunks, limit))
+
+
+def get_cases(
+    chunks: List[Document], batch_size: int, workers: int
+) -> Dict[str, Callable[[], List[int]]]:
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
+    texts = [chunk.page_content for chunk in chunks]
+    return {
+        "tokens: loop": lambda: [
+            len(tokenizer.tokenize(text)) for text in texts
+        ],
+        "tokens: batched": lambda: [
+            count
+            for batch in batched(texts, batch_size)
+            for count in count_tokens(tokenizer, batch)
+        ],
+        "statistics: 1 process": lambda: [
+            metric["tokens"]
+            for metric in iter_statistics(chunks, batch_size=batch_size)
+        ],
+        f"statistics: {workers} processes": lambda: [
+            metric["tokens"]
+            for metric in iter_statistics(
+                chunks, batch_size=batch_size, workers=workers
+            )
+        ],
+    }
+
+
+@click.command()
+@click.option("--limit", type=int, default=None, help="Use first N chunks")
+@click.option("--batch-size", type=int, default=DEFAULT_TOKENIZER_BATCH_SIZE)
+@click.option("--workers", type=int, default=os.cpu_count() or 1)
+def main(limit: Optional[int], batch_size: int, workers: int) -> None:
+    chunks = load_chunks(limit)
+    if not chunks:
+        raise click.ClickException("No chunks in the chunk storage")
+    click.echo(f"{len(chunks)} chunks")
+    click.echo(f"{'case':<26}{'time, s':>10}{'chunks/s':>12}")
+    expected = None
+    for name, case in get_cases(chunks, batch_size, workers).items():
+        start = time.perf_counter()
+        token_counts = case()
+        elapsed = time.perf_counter() - start
+        click.echo(f"{name:<26}{elapsed:>10.2f}{len(chunks) / elapsed:>12.0f}")
+        if expected is None:
+            expected = token_counts
+        elif token_counts != expected:
+            raise click.ClickException(f"{name}: token counts differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Parse time and memory per page of the full BeautifulSoup tree
+(html.parser) against targeted lxml extraction on saved course pages:
+
+    python benchmarks/html_parsing.py --source bcs ./data/http_cache/bodies
+
+Pages are whole html documents, e.g. bodies kept by the collectors'
+HTTP cache.
+"""
+
+from pathlib import Path
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import click
+from requests import Response
+
+from financial_data.collect import bcs, tinkoff
+from financial_data.utils.parsing import (
+    extract_hrefs,
+    load_content,
+    load_elements,
+)
+
+
+def make_response(content: bytes) -> Response:
+    response = Response()
+    response._content = content
+    response.status_code = 200
+    return response
+
+
+def get_cases(source: str) -> Dict[str, Callable[[Response], object]]:
+    if source == "bcs":
+        attrs = {"data-id": bcs.COURSE_DATA_ID, "class": bcs.COURSE_DATA_CLASS}
+        selectors = [("div", attrs)]
+    else:
+        selectors = [
+            (tag, {"class": item_class})
+            for tag, item_class in zip(
+                tinkoff.COURSE_DATA_TAGS, tinkoff.COURSE_DATA_CLASSES
+            )
+        ]
+    return {
+        "full tree: content": lambda response: [
+            load_content(response).find(name, attrs)
+            for name, attrs in selectors
+        ],
+        "targeted: content": lambda response: [
+            load_elements(response, selectors).find(name, attrs)
+            for name, attrs in selectors
+        ],
+        "full tree: hrefs": lambda response: [
+            elem.get("href") for elem in load_content(response).find_all("a")
+        ],
+        "targeted: hrefs": extract_hrefs,
+    }
+
+
+def measure(
+    case: Callable[[Response], object], pages: List[bytes]
+) -> Tuple[List[float], List[int]]:
+    times, peaks = [], []
+    for page in pages:
+        response = make_response(page)
+        tracemalloc.start()
+        start = time.perf_counter()
+        case(response)
+        times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return times, peaks
+
+
+@click.command()
+@click.argument(
+    "pages_dir", type=click.Path(exists=True, file_okay=False, path_type=Path)
+)
+@click.option("--source", type=click.Choice(["bcs", "tinkoff"]), default="bcs")
+def main(pages_dir: Path, source: str) -> None:
+    pages = [
+        file.read_bytes()
+        for file in sorted(pages_dir.iterdir())
+        if file.suffix == ".html"
+    ]
+    if not pages:
+        raise click.ClickException(f"No html pages in {pages_dir}")
+    click.echo(
+        f"{len(pages)} pages, "
+        f"{statistics.mean(len(page) for page in pages) / 1024:.1f} KiB avg"
+    )
+    click.echo(
+        f"{'case':<22}{'mean, ms':>10}{'p95, ms':>10}{'peak mem, KiB':>16}"
+    )
+    for name, case in get_cases(source).items():
+        times, peaks = measure(case, pages)
+        p95 = sorted(times)[int(0.95 * (len(times) - 1))]
+        click.echo(
+            f"{name:<22}{statistics.mean(times) * 1000:>10.2f}"
+            f"{p95 * 1000:>10.2f}{statistics.mean(peaks) / 1024:>16.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Import time of the pipeline and of every stage entry point, each
+measured in a fresh interpreter. Fails when an import exceeds the
+budget or loads one of the heavy dependencies, which stages must
+import on first use:
+
+    python benchmarks/import_time.py --budget 1.0
+"""
+
+import json
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import click
+
+
+ENTRY_POINTS = [
+    ("financial_data.main", None),
+    ("financial_data.collect.bcs", "parse_bcs_courses"),
+    ("financial_data.collect.tinkoff", "parse_tinkoff_courses"),
+    ("financial_data.preprocessing.html2txt", "html2txt"),
+    ("financial_data.preprocessing.pdf2txt", "pdf2txt"),
+    ("financial_data.preprocessing.create_config", "create_configs"),
+    ("financial_data.preprocessing.clear_txt", "clear_txt"),
+    ("financial_data.preprocessing.thrd_party", "process_3d_party_data"),
+    ("financial_data.preprocessing.split", "split_documents"),
+    ("financial_data.preprocessing.dedup", "dedup_chunks"),
+    ("financial_data.preprocessing.index", "index_chunks"),
+    (
+        "financial_data.evaluate.data_quality",
+        "collect_data_quality_metrics",
+    ),
+    ("financial_data.evaluate.eda", "collect_eda_metrics"),
+]
+HEAVY_MODULES = [
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "langchain_huggingface",
+    "langchain_community",
+    "langchain_text_splitters",
+    "pymupdf",
+    "pymupdf4llm",
+    "nltk",
+    "numpy",
+]
+
+MEASURE_CODE = """
+import json, sys, time
+start = time.perf_counter()
+module = __import__({module!r}, fromlist=["_"])
+{attribute_check}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy}}))
+"""
+
+
+def measure(module: str, attribute: Optional[str]) -> Tuple[float, List[str]]:
+    code = MEASURE_CODE.format(
+        module=module,
+        attribute_check=f"getattr(module, {attribute!r})" if attribute else "",
+        heavy=HEAVY_MODULES,
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise click.ClickException(f"Can't import {module}:\n{result.stderr}")
+    output = json.loads(result.stdout.strip().splitlines()[-1])
+    return output["elapsed"], output["heavy"]
+
+
+@click.command()
+@click.option("--budget", type=float, default=1.0, help="Seconds per import")
+@click.option("--repeat", type=int, default=3, help="Best of N runs")
+def main(budget: float, repeat: int) -> None:
+    click.echo(f"{'entry point':<66}{'import, s':>10}")
+    failures: Dict[str, str] = {}
+    for module, attribute in ENTRY_POINTS:
+        name = f"{module}:{attribute}" if attribute else module
+        runs = [measure(module, attribute) for _ in range(repeat)]
+        elapsed = min(run[0] for run in runs)
+        heavy = runs[0][1]
+        click.echo(f"{name:<66}{elapsed:>10.3f}")
+        if elapsed > budget:
+            failures[name] = f"{elapsed:.3f}s is over {budget:.3f}s budget"
+        elif heavy:
+            failures[name] = f"imports {', '.join(heavy)}"
+    if failures:
+        raise click.ClickException(
+            "\n".join(f"{name}: {reason}" for name, reason in failures.items())
+        )
+    click.echo(f"All imports within {budget:.3f}s budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Throughput, latency and peak memory of the pipeline stages on the
+synthetic corpus (benchmarks/synthetic_corpus.py) at 1x, 10x or 100x
+of the current corpus size:
+
+    python benchmarks/pipeline_stages.py --scale 10 --repeat 5 \\
+        --output results/stages_10x.json
+
+The corpus is stored in a temporary SQLite database, which stands in
+for Mongo, so runs don't need a server and are comparable between
+machines. Every stage starts from the storage state left by the
+previous stages: before each repeat the database is restored from the
+snapshot taken after the previous stage, and the index and embedding
+cache directories are removed, so every repeat is a cold run.
+
+Each repeat runs in its own process, peak RSS is the maximum of the
+stage process and its pool workers. Latency percentiles are taken
+over repeats, throughput is input items per second of the median run.
+"""
+
+from contextlib import closing
+from dataclasses import asdict, dataclass
+from datetime import datetime
+import importlib
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import platform
+from queue import Empty
+import resource
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+import numpy as np
+
+from synthetic_corpus import iter_raw_documents, write_codex
+
+
+COLLECTIONS = {
+    "RawDocumentCollectionName": "raw_documents",
+    "ProcessedDocumentCollectionName": "processed_documents",
+    "ChunkCollectionName": "chunks",
+    "MetricsCollectionName": "metrics",
+    "ConfigCollectionName": "configs",
+}
+
+# (stage, "module:function", input items)
+STAGES = [
+    (
+        "create_configs",
+        "financial_data.preprocessing.create_config:create_configs",
+        "raw_documents",
+    ),
+    (
+        "clear_txt",
+        "financial_data.preprocessing.clear_txt:clear_txt",
+        "raw_documents",
+    ),
+    (
+        "process_3d_party_data",
+        "financial_data.preprocessing.thrd_party:process_3d_party_data",
+        "codex_articles",
+    ),
+    (
+        "split_documents",
+        "financial_data.preprocessing.split:split_documents",
+        "processed_documents",
+    ),
+    (
+        "dedup_chunks",
+        "financial_data.preprocessing.dedup:dedup_chunks",
+        "chunks",
+    ),
+    (
+        "collect_data_quality_metrics",
+        "financial_data.evaluate.data_quality:collect_data_quality_metrics",
+        "raw_documents",
+    ),
+    (
+        "collect_eda_metrics",
+        "financial_data.evaluate.eda:collect_eda_metrics",
+        "chunks",
+    ),
+    (
+        "index_chunks",
+        "financial_data.preprocessing.index:index_chunks",
+        "chunks",
+    ),
+]
+COLD_DIRS = ["data/index", "data/embedding_cache"]
+
+
+@dataclass
+class StageResult:
+    stage: str
+    unit: str
+    items_in: int
+    items_out: Dict[str, int]
+    repeats: int
+    throughput: float
+    latency_p50: float
+    latency_p95: float
+    latency_max: float
+    cpu_p50: float
+    peak_rss_mb: float
+
+
+def count_items(codex_articles: int) -> Dict[str, int]:
+    from financial_data.storages import initialize_storage
+
+    document_storage = initialize_storage("document")
+    chunk_storage = initialize_storage("chunk")
+    return {
+        "raw_documents": sum(
+            1 for _ in document_storage.iter_raw_documents(projection=["_id"])
+        ),
+        "processed_documents": sum(
+            1
+            for _ in document_storage.iter_processed_documents(
+                projection=["_id"]
+            )
+        ),
+        "chunks": sum(1 for _ in chunk_storage.iter_chunk_ids()),
+        "codex_articles": codex_articles,
+    }
+
+
+def seed_documents(scale: int, seed: int) -> int:
+    from financial_data.storages import initialize_storage
+
+    document_storage = initialize_storage("document")
+    documents = 0
+    for source_name, content in iter_raw_documents(scale, seed):
+        document_storage.set_raw_document(source_name, content)
+        documents += 1
+    return documents
+
+
+def run_in_process(
+    db_path: Path, target: str, args: Tuple = ()
+) -> Dict[str, Any]:
+    """
+    Run target ("module:function" or a function of this module) in a
+    fresh process against db_path.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=_child, args=(str(db_path), target, args, queue)
+    )
+    process.start()
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except Empty:
+            # Killed processes (e.g. by the OOM killer) report nothing
+            if not process.is_alive():
+                result = {"error": f"exit code {process.exitcode}"}
+                break
+    process.join()
+    if "error" in result:
+        raise RuntimeError(f"{target} failed: {result['error']}")
+    return result
+
+
+def _child(db_path: str, target: str, args: Tuple, queue: Any) -> None:
+    os.environ["SQLitePath"] = db_path
+    try:
+        if ":" in target:
+            module_name, function_name = target.split(":")
+            function = getattr(
+                importlib.import_module(module_name), function_name
+            )
+        else:
+            function = globals()[target]
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        value = function(*args)
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - start_cpu
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        queue.put(
+            {
+                "value": value,
+                "wall": wall,
+                "cpu": cpu + children.ru_utime + children.ru_stime,
+                # ru_maxrss is in kilobytes on Linux
+                "peak_rss_mb": max(own.ru_maxrss, children.ru_maxrss) / 1024,
+            }
+        )
+    except Exception as e:
+        queue.put({"error": repr(e)})
+    return None
+
+
+def copy_database(source: Path, destination: Path) -> None:
+    """
+    Consistent copy with the SQLite backup API, WAL content included.
+    """
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{destination}{suffix}").unlink(missing_ok=True)
+    with closing(sqlite3.connect(source)) as src, closing(
+        sqlite3.connect(destination)
+    ) as dst:
+        src.backup(dst)
+    return None
+
+
+def benchmark_stage(
+    stage: str,
+    target: str,
+    unit: str,
+    snapshot: Path,
+    work_db: Path,
+    repeat: int,
+    codex_articles: int,
+) -> StageResult:
+    items_in = run_in_process(snapshot, "count_items", (codex_articles,))
+    runs = []
+    for _ in range(repeat):
+        copy_database(snapshot, work_db)
+        for directory in COLD_DIRS:
+            shutil.rmtree(directory, ignore_errors=True)
+        runs.append(run_in_process(work_db, target))
+    items_out = run_in_process(work_db, "count_items", (codex_articles,))
+
+    latencies = np.array([run["wall"] for run in runs])
+    p50 = float(np.percentile(latencies, 50))
+    return StageResult(
+        stage=stage,
+        unit=unit,
+        items_in=items_in["value"][unit],
+        items_out={
+            name: count
+            for name, count in items_out["value"].items()
+            if name != "codex_articles"
+        },
+        repeats=repeat,
+        throughput=round(items_in["value"][unit] / p50, 2) if p50 else 0.0,
+        latency_p50=round(p50, 4),
+        latency_p95=round(float(np.percentile(latencies, 95)), 4),
+        latency_max=round(float(latencies.max()), 4),
+        cpu_p50=round(float(np.median([run["cpu"] for run in runs])), 4),
+        peak_rss_mb=round(max(run["peak_rss_mb"] for run in runs), 1),
+    )
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option(
+    "--scale",
+    type=click.Choice(["1", "10", "100"]),
+    default="1",
+    show_default=True,
+    help="Corpus size relative to the current one",
+)
+@click.option("--seed", default=0, show_default=True)
+@click.option("--repeat", default=3, show_default=True, help="Runs per stage")
+@click.option(
+    "--skip",
+    multiple=True,
+    type=click.Choice([stage for stage, _, _ in STAGES]),
+    help="Stages to skip, e.g. the ones which need the embedding model",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=Path("pipeline_stages.json"),
+    show_default=True,
+)
+def main(
+    scale: str, seed: int, repeat: int, skip: List[str], output: Path
+) -> None:
+    output = output.resolve()
+    scale = int(scale)
+    os.environ.update(COLLECTIONS)
+    os.environ["StorageBackend"] = "sqlite"
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(tmp_dir)
+        # Stages read and write ./data relative to the working directory
+        os.chdir(work_dir)
+        start = time.perf_counter()
+        codex_articles = write_codex(
+            work_dir / "data" / "3d_party" / "codex.json", scale, seed
+        )
+        snapshot = work_dir / "snapshot_0.sqlite3"
+        documents = run_in_process(snapshot, "seed_documents", (scale, seed))
+        click.echo(
+            f"Seeded {documents['value']} documents and {codex_articles} "
+            f"codex articles in {time.perf_counter() - start:.1f}s"
+        )
+
+        work_db = work_dir / "work.sqlite3"
+        stages = [stage for stage in STAGES if stage[0] not in skip]
+        for number, (stage, target, unit) in enumerate(stages, start=1):
+            result = benchmark_stage(
+                stage, target, unit, snapshot, work_db, repeat, codex_articles
+            )
+            results.append(result)
+            click.echo(
+                f"{stage:<32}{result.items_in:>8} {unit:<20}"
+                f"p50 {result.latency_p50:>8.3f}s  "
+                f"{result.throughput:>10.1f}/s  "
+                f"{result.peak_rss_mb:>8.1f} MB"
+            )
+            # The last repeat is the input of the next stage
+            next_snapshot = work_dir / f"snapshot_{number}.sqlite3"
+            copy_database(work_db, next_snapshot)
+            snapshot.unlink()
+            snapshot = next_snapshot
+
+    report = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "scale": scale,
+        "seed": seed,
+        "repeat": repeat,
+        "corpus": {
+            "raw_documents": documents["value"],
+            "codex_articles": codex_articles,
+        },
+        "stages": [asdict(result) for result in results],
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    click.echo(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
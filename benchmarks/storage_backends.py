@@ -0,0 +1,132 @@
+"""
+Compare Mongo and SQLite storage backends on the pipeline stages
+that move data through storages.
+
+Raw documents are seeded from a directory of markdown/txt files
+(for example, an export of the raw documents collection), then
+every stage is timed on each backend:
+
+    python benchmarks/storage_backends.py ./data/bench_corpus --with-eda
+
+Mongo connection is read from MongoHost/MongoPort, the benchmark
+uses its own database which is dropped afterwards.
+"""
+
+import os
+from pathlib import Path
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+import click
+
+from financial_data.evaluate import (
+    collect_data_quality_metrics,
+    collect_eda_metrics,
+)
+from financial_data.mongo_pool import get_client
+from financial_data.preprocessing import (
+    clear_txt,
+    create_configs,
+    index_chunks,
+    split_documents,
+)
+from financial_data.storages import initialize_storage
+
+
+COLLECTIONS = {
+    "RawDocumentCollectionName": "raw_documents",
+    "ProcessedDocumentCollectionName": "processed_documents",
+    "ChunkCollectionName": "chunks",
+    "MetricsCollectionName": "metrics",
+    "ConfigCollectionName": "configs",
+}
+
+
+def load_corpus(corpus_dir: Path) -> List[Tuple[str, str]]:
+    """
+    Files are grouped by source: <corpus_dir>/<source_name>/<file>.
+    """
+    corpus = []
+    for source_dir in sorted(corpus_dir.iterdir()):
+        if not source_dir.is_dir():
+            continue
+        for file in sorted(source_dir.iterdir()):
+            if file.suffix in (".md", ".txt"):
+                corpus.append((source_dir.name, file.read_text()))
+    return corpus
+
+
+def seed(corpus: List[Tuple[str, str]]) -> None:
+    document_storage = initialize_storage("document")
+    for source_name, content in corpus:
+        document_storage.set_raw_document(source_name, content)
+    return None
+
+
+def run_stages(
+    stages: List[Tuple[str, Callable[[], None]]],
+) -> Dict[str, float]:
+    timings = {}
+    for name, stage in stages:
+        start = time.perf_counter()
+        stage()
+        timings[name] = time.perf_counter() - start
+    timings["total"] = sum(timings.values())
+    return timings
+
+
+@click.command()
+@click.argument(
+    "corpus_dir", type=click.Path(exists=True, file_okay=False, path_type=Path)
+)
+@click.option("--with-eda", is_flag=True, help="Also time collect_eda_metrics")
+@click.option("--with-index", is_flag=True, help="Also time index_chunks")
+@click.option("--mongo-db", default="financial_data_bench", show_default=True)
+def main(
+    corpus_dir: Path, with_eda: bool, with_index: bool, mongo_db: str
+) -> None:
+    for name, value in COLLECTIONS.items():
+        os.environ.setdefault(name, value)
+    corpus = load_corpus(corpus_dir)
+    stages = [
+        ("seed", lambda: seed(corpus)),
+        ("create_configs", create_configs),
+        ("clear_txt", clear_txt),
+        ("split_documents", split_documents),
+        ("collect_data_quality_metrics", collect_data_quality_metrics),
+    ]
+    if with_eda:
+        stages.append(("collect_eda_metrics", collect_eda_metrics))
+    if with_index:
+        stages.append(("index_chunks", index_chunks))
+
+    results = {}
+    os.environ["StorageBackend"] = "mongo"
+    os.environ["DBName"] = mongo_db
+    client = get_client(os.getenv("MongoHost"), int(os.getenv("MongoPort")))
+    client.drop_database(mongo_db)
+    try:
+        results["mongo"] = run_stages(stages)
+    finally:
+        client.drop_database(mongo_db)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["StorageBackend"] = "sqlite"
+        os.environ["SQLitePath"] = str(Path(tmp_dir) / "bench.sqlite3")
+        results["sqlite"] = run_stages(stages)
+
+    click.echo(f"{len(corpus)} documents from {corpus_dir}")
+    click.echo(f"{'stage':<32}{'mongo, s':>12}{'sqlite, s':>12}{'speedup':>10}")
+    for stage in results["mongo"]:
+        mongo_time = results["mongo"][stage]
+        sqlite_time = results["sqlite"][stage]
+        speedup = mongo_time / sqlite_time if sqlite_time else float("inf")
+        click.echo(
+            f"{stage:<32}{mongo_time:>12.3f}{sqlite_time:>12.3f}"
+            f"{speedup:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Seeded generator of a synthetic corpus shaped like ours: markdown
+textbooks, BCS and Tinkoff lessons after html2txt and codex JSON.
+
+Scale 1 is about the current corpus (~11k chunks), documents are
+multiplied for bigger scales, their size stays the same. The same
+seed and scale always give the same corpus.
+"""
+
+import json
+from pathlib import Path
+import random
+from typing import Dict, Iterator, List, Tuple
+
+TEXTBOOKS = 4
+TEXTBOOK_CHAPTERS = 35
+TEXTBOOK_SECTIONS = 8
+TEXTBOOK_PARAGRAPHS = (20, 40)
+BCS_LESSONS = 300
+TINKOFF_LESSONS = 150
+CODEX_ARTICLES = 400
+OTHER_CODEX_ARTICLES = 1200
+
+RELEVANT_CODEX = "Уголовный кодекс (УК РФ)"
+OTHER_CODEXES = [
+    "Гражданский кодекс (ГК РФ)",
+    "Налоговый кодекс (НК РФ)",
+    "Трудовой кодекс (ТК РФ)",
+]
+
+EN_WORDS = (
+    "market bond yield interest rate inflation bank money supply demand "
+    "price equity risk return portfolio dividend capital asset liability "
+    "credit loan deposit exchange currency investor firm government tax "
+    "policy output growth cost revenue profit share fund reserve debt"
+).split()
+RU_WORDS = (
+    "рынок облигация доходность ставка инфляция банк деньги спрос "
+    "предложение цена акция риск портфель дивиденд капитал актив "
+    "кредит вклад биржа валюта инвестор компания налог брокер фонд "
+    "купон эмитент индекс счет сделка комиссия срок погашение"
+).split()
+
+
+def iter_raw_documents(
+    scale: int = 1, seed: int = 0
+) -> Iterator[Tuple[str, str]]:
+    """
+    (source name, markdown content) pairs, documents are generated
+    one at a time so that big scales don't have to fit in memory.
+    """
+    rng = random.Random(seed)
+    for i in range(TEXTBOOKS * scale):
+        yield f"textbook_{i}", make_textbook(rng)
+    for _ in range(BCS_LESSONS * scale):
+        yield "bcs", make_bcs_lesson(rng)
+    for _ in range(TINKOFF_LESSONS * scale):
+        yield "tinkoff", make_tinkoff_lesson(rng)
+
+
+def write_codex(path: Path, scale: int = 1, seed: int = 0) -> int:
+    """
+    Write codex JSON array article by article, returns article count.
+    """
+    rng = random.Random(seed + 1)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(path, "w") as f:
+        f.write("[")
+        for article in iter_codex_articles(rng, scale):
+            if count:
+                f.write(",\n")
+            f.write(json.dumps(article, ensure_ascii=False))
+            count += 1
+        f.write("]")
+    return count
+
+
+def make_sentence(rng: random.Random, words: List[str]) -> str:
+    sentence = " ".join(rng.choices(words, k=rng.randint(6, 20)))
+    return sentence.capitalize() + "."
+
+
+def make_paragraph(rng: random.Random, words: List[str]) -> str:
+    return " ".join(make_sentence(rng, words) for _ in range(rng.randint(3, 8)))
+
+
+def make_textbook(rng: random.Random) -> str:
+    lines = ["Copyright page", "www.openstax.org", ""]
+    for chapter in range(1, TEXTBOOK_CHAPTERS + 1):
+        lines.append(f"# Chapter {chapter} {make_sentence(rng, EN_WORDS)}")
+        for section in range(1, TEXTBOOK_SECTIONS + 1):
+            lines.append(f"## {chapter}.{section} {rng.choice(EN_WORDS)}")
+            for _ in range(rng.randint(*TEXTBOOK_PARAGRAPHS)):
+                lines.append(make_paragraph(rng, EN_WORDS))
+                lines.append("")
+            if rng.random() < 0.3:
+                lines.extend(
+                    f"- {make_sentence(rng, EN_WORDS)}" for _ in range(4)
+                )
+            if rng.random() < 0.2:
+                lines.append(f"**FIGURE {chapter}.{section}** Figure caption")
+                lines.append(f"_Source: http://example.org/{chapter}_")
+            lines.append("-----")
+    return "\n".join(lines)
+
+
+def make_bcs_lesson(rng: random.Random) -> str:
+    lines = ["Меню", "Войти", f"# {make_sentence(rng, RU_WORDS)}"]
+    lines.extend(["Обсудить  Нравится", "Поделиться", ""])
+    for _ in range(rng.randint(3, 6)):
+        lines.append(f"## {make_sentence(rng, RU_WORDS)}")
+        for _ in range(rng.randint(2, 4)):
+            lines.append(make_paragraph(rng, RU_WORDS))
+            lines.append("")
+        lines.append("**БКС Мир инвестиций**")
+    lines.extend(["Жмите «Далее»", "Подписаться на рассылку"])
+    return "\n".join(lines)
+
+
+def make_tinkoff_lesson(rng: random.Random) -> str:
+    lines = ["Т—Ж", f"# {make_sentence(rng, RU_WORDS)}", ""]
+    for _ in range(rng.randint(4, 8)):
+        lines.append(f"## {make_sentence(rng, RU_WORDS)}")
+        for _ in range(rng.randint(2, 4)):
+            lines.append(make_paragraph(rng, RU_WORDS + EN_WORDS[:5]))
+            lines.append("")
+        for number in range(1, rng.randint(2, 5)):
+            lines.append(f"{number}. {make_sentence(rng, RU_WORDS)}")
+    lines.extend(["##  Что дальше", make_paragraph(rng, RU_WORDS)])
+    return "\n".join(lines)
+
+
+def iter_codex_articles(
+    rng: random.Random, scale: int
+) -> Iterator[Dict[str, str]]:
+    for i in range(CODEX_ARTICLES * scale):
+        yield make_codex_article(rng, RELEVANT_CODEX, i)
+    for i in range(OTHER_CODEX_ARTICLES * scale):
+        yield make_codex_article(rng, rng.choice(OTHER_CODEXES), i)
+
+
+def make_codex_article(
+    rng: random.Random, name_codex: str, number: int
+) -> Dict[str, str]:
+    return {
+        "name_codex": name_codex,
+        "name_article": f"Статья {number}. {make_sentence(rng, RU_WORDS)}",
+        "content_article": "\n".join(
+            make_paragraph(rng, RU_WORDS) for _ in range(rng.randint(2, 6))
+        ),
+    }
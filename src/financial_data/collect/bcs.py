@@ -1,11 +1,13 @@
 import json
 from pathlib import Path
-import time
 from typing import Dict, List, Optional, Tuple
 
-import requests
+from requests import Response
 
-from ..utils.parsing import load_content
+from ..utils.parsing import extract_hrefs, load_elements
+from ..utils.telemetry import record_items, tracked
+from .fetch import DEFAULT_CONCURRENCY, Fetcher
+from .http_cache import HttpCache
 
 
 BASE_URL = "https://bcs-express.ru"
@@ -14,27 +16,52 @@ REQUEST_PARAMS_PATH = Path("./configs/bks_params.json")
 COURSES_DATA_URL = "https://api.bcs.ru/learning/v1/courses?limit=4"
 COURSE_DATA_ID = "content"
 COURSE_DATA_CLASS = "TjB6 KSLV Ncpb ZKPa"
+# bcs blocks by ip on aggressive crawling
+BCS_RPS = 1.0
 
 
-def parse_bcs_courses() -> None:
+@tracked
+def parse_bcs_courses(
+    rps: float = BCS_RPS, concurrency: int = DEFAULT_CONCURRENCY
+) -> None:
     cookies, headers = load_request_params()
-    timeout = 1.0
-    courses_links = get_courses_links()
-    course_part_links = []
-    for course_link in courses_links:
-        time.sleep(timeout)
-        course_part_links.append(
-            get_course_parts_links(course_link, cookies, headers)
-        )
-    for i in range(len(course_part_links)):
-        for j, course_part_link in enumerate(course_part_links[i]):
-            time.sleep(timeout)
-            course_part_content = parse_course_part(
-                course_part_link, cookies, headers
-            )
-            if course_part_content:
-                with open(OUTPUT_DIR / f"{i}_{j}.html", "w") as f:
-                    f.write(course_part_content)
+    cache = HttpCache()
+    with Fetcher(
+        rps=rps,
+        concurrency=concurrency,
+        cookies=cookies,
+        headers=headers,
+        cache=cache,
+    ) as fetcher:
+        courses_links = get_courses_links(fetcher)
+        course_part_links = [
+            get_course_parts_links(response) if response else []
+            for response in fetcher.get_many(courses_links)
+        ]
+        positions = [
+            (i, j)
+            for i in range(len(course_part_links))
+            for j in range(len(course_part_links[i]))
+        ]
+        urls = [course_part_links[i][j] for i, j in positions]
+        responses = fetcher.get_many(urls)
+    written = 0
+    for (i, j), url, response in zip(positions, urls, responses):
+        output_file = OUTPUT_DIR / f"{i}_{j}.html"
+        # Positions shift when lessons are added, so an unchanged page
+        # is skipped only if its own text is in the file
+        if response is None or (
+            response.unchanged and cache.is_output_current(url, output_file)
+        ):
+            continue
+        course_part_content = parse_course_part(response)
+        if course_part_content:
+            with open(output_file, "w") as f:
+                f.write(course_part_content)
+            cache.set_output(url, output_file, course_part_content)
+            written += 1
+    cache.save()
+    record_items(items_in=len(positions), items_out=written)
     return None
 
 
@@ -44,29 +71,21 @@ def load_request_params() -> Tuple[Dict[str, str], Dict[str, str]]:
     return request_params["cookies"], request_params["headers"]
 
 
-def get_courses_links() -> List[str]:
-    response = requests.get(COURSES_DATA_URL)
+def get_courses_links(fetcher: Fetcher) -> List[str]:
+    response = fetcher.get(COURSES_DATA_URL)
     data = response.json()["data"]
     return [item["url"] for item in data]
 
 
-def get_course_parts_links(
-    course_link: str, cookies: Dict[str, str], headers: Dict[str, str]
-) -> List[str]:
-    response = requests.get(course_link, cookies=cookies, headers=headers)
-    soup = load_content(response)
-    hrefs = [elem["href"] for elem in soup.find_all("a")]
+def get_course_parts_links(response: Response) -> List[str]:
+    hrefs = extract_hrefs(response)
     return list(filter(lambda x: BASE_URL in x, hrefs))
 
 
-def parse_course_part(
-    course_part_link: str, cookies: Dict[str, str], headers: Dict[str, str]
-) -> Optional[str]:
-    response = requests.get(course_part_link, cookies=cookies, headers=headers)
-    soup = load_content(response)
-    div_tag = soup.find(
-        "div", {"data-id": COURSE_DATA_ID, "class": COURSE_DATA_CLASS}
-    )
+def parse_course_part(response: Response) -> Optional[str]:
+    attrs = {"data-id": COURSE_DATA_ID, "class": COURSE_DATA_CLASS}
+    soup = load_elements(response, [("div", attrs)])
+    div_tag = soup.find("div", attrs)
     content = None
     if div_tag:
         content = div_tag.prettify()
@@ -0,0 +1,216 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..utils.log import get_logger
+from .http_cache import HttpCache
+
+
+log = get_logger(__name__)
+
+DEFAULT_RPS = 2.0
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MAX_RETRIES = 3
+RETRY_STATUSES = {429, 502, 503, 504}
+BACKOFF_BASE = 1.0
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: on average `rate` acquisitions per second
+    with bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(
+                        self.capacity,
+                        self.tokens + (now - self.updated) * self.rate,
+                    )
+                    self.updated = now
+                    if self.tokens >= 1.0:
+                        self.tokens -= 1.0
+                        return None
+                    wait = (1.0 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stop handing out tokens for `seconds`, e.g. after Retry-After.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+        return None
+
+
+class Fetcher:
+    """
+    Concurrent HTTP client for the collectors: one keep-alive session,
+    per-host rate limiting and retries which honour Retry-After.
+
+    With a cache, requests are conditional. Every returned response has
+    an `unchanged` flag which is set when the server answered
+    304 Not Modified (the body is then loaded from the cache) or sent
+    the same body as last time. The cache is saved by its owner once
+    the responses are processed.
+    """
+
+    def __init__(
+        self,
+        rps: float = DEFAULT_RPS,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        cookies: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        cache: Optional[HttpCache] = None,
+    ) -> None:
+        self.rps = rps
+        self.cache = cache
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=concurrency, pool_maxsize=concurrency
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if cookies:
+            self.session.cookies.update(cookies)
+        if headers:
+            self.session.headers.update(headers)
+        self._limiters: Dict[str, TokenBucket] = {}
+        self._limiters_lock = threading.Lock()
+
+    def __enter__(self) -> "Fetcher":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+        return None
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        response = self._get(url, **kwargs)
+        response.unchanged = False
+        if self.cache is None or not response.ok:
+            return response
+        if response.status_code == 304:
+            response._content = self.cache.load_body(url)
+            response.unchanged = True
+            self.cache.mark_revalidated()
+        else:
+            response.unchanged = not self.cache.store(url, response)
+        return response
+
+    def _get(self, url: str, **kwargs: Any) -> requests.Response:
+        """
+        Rate-limited GET. 429 and 5xx gateway responses are retried after
+        Retry-After (or exponential backoff), connection errors as well.
+        """
+        limiter = self._get_limiter(url)
+        kwargs.setdefault("timeout", self.timeout)
+        if self.cache is not None:
+            kwargs["headers"] = {
+                **kwargs.get("headers", {}),
+                **self.cache.conditional_headers(url),
+            }
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            try:
+                response = self.session.get(url, **kwargs)
+            except requests.ConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(BACKOFF_BASE * 2**attempt)
+                continue
+            if (
+                response.status_code not in RETRY_STATUSES
+                or attempt == self.max_retries
+            ):
+                return response
+            delay = get_retry_after(response)
+            if delay is None:
+                delay = BACKOFF_BASE * 2**attempt
+            log.warning(
+                f"{url} answered {response.status_code}, retry in {delay:.1f}s"
+            )
+            limiter.pause(delay)
+        return response
+
+    def get_many(
+        self, urls: List[str], **kwargs: Any
+    ) -> List[Optional[requests.Response]]:
+        """
+        Fetch urls concurrently. Responses keep the order of urls,
+        a url that failed to load gets None.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return list(
+                pool.map(lambda url: self._get_or_none(url, **kwargs), urls)
+            )
+
+    def _get_or_none(
+        self, url: str, **kwargs: Any
+    ) -> Optional[requests.Response]:
+        try:
+            response = self.get(url, **kwargs)
+            response.raise_for_status()
+            return response
+        except requests.RequestException as e:
+            log.error(f"Failed to fetch {url}: {e}")
+            return None
+
+    def _get_limiter(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        with self._limiters_lock:
+            if host not in self._limiters:
+                self._limiters[host] = TokenBucket(self.rps)
+            return self._limiters[host]
+
+
+def get_retry_after(response: requests.Response) -> Optional[float]:
+    """
+    Retry-After header in seconds, it may be a number or an HTTP date.
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,150 @@
+import fcntl
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+from typing import Any, Dict, Set
+
+from requests import Response
+
+from ..utils.hashing import content_digest
+from ..utils.log import get_logger
+
+
+log = get_logger(__name__)
+
+CACHE_DIR = Path("./data/http_cache")
+
+
+class HttpCache:
+    """
+    Persistent response cache for the collectors keyed by url.
+
+    For every url it keeps ETag, Last-Modified, a digest of the body
+    and the body itself, so unchanged pages can be revalidated with
+    a conditional request and served from disk. Files written from
+    a page are recorded as its outputs with a digest of their text:
+    an unchanged page may skip the write only if its output file
+    still holds that text.
+
+    Collectors running at the same time share the cache directory,
+    every cache saves only the entries it changed.
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.bodies_dir = self.cache_dir / "bodies"
+        self.index_path = self.cache_dir / "index.json"
+        os.makedirs(self.bodies_dir, exist_ok=True)
+        self.entries = self._load_index()
+        # Urls whose entries were changed since the index was read
+        self.changed: Set[str] = set()
+        self.revalidated = 0
+        self.downloaded_bytes = 0
+        self._lock = threading.Lock()
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        with self._lock:
+            entry = self.entries.get(url)
+        if entry is None or not self._body_path(url).exists():
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def load_body(self, url: str) -> bytes:
+        with open(self._body_path(url), "rb") as f:
+            return f.read()
+
+    def store(self, url: str, response: Response) -> bool:
+        """
+        Remember validators and body of a full response.
+        Returns whether the body differs from the cached one.
+        """
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            self.downloaded_bytes += len(body)
+            previous = self.entries.get(url, {})
+            changed = previous.get("digest") != digest
+            self.entries[url] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "digest": digest,
+                "outputs": {} if changed else previous.get("outputs", {}),
+            }
+            self.changed.add(url)
+        if changed or not self._body_path(url).exists():
+            with open(self._body_path(url), "wb") as f:
+                f.write(body)
+        return changed
+
+    def is_output_current(self, url: str, output_path: Path) -> bool:
+        """
+        Whether output_path was written from url and still holds
+        the text written then.
+        """
+        with self._lock:
+            outputs = self.entries.get(url, {}).get("outputs", {})
+            digest = outputs.get(str(output_path))
+        if digest is None or not output_path.exists():
+            return False
+        with open(output_path, "r") as f:
+            return content_digest(f.read()) == digest
+
+    def set_output(self, url: str, output_path: Path, content: str) -> None:
+        with self._lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                entry.setdefault("outputs", {})[str(output_path)] = (
+                    content_digest(content)
+                )
+                self.changed.add(url)
+        return None
+
+    def mark_revalidated(self) -> None:
+        with self._lock:
+            self.revalidated += 1
+        return None
+
+    def save(self) -> None:
+        """
+        Write the index. Collectors save it after their output files
+        are written, so a crash before that can't mark pages whose
+        outputs are stale as unchanged.
+
+        The index is read again under a file lock and only changed
+        entries are replaced, so entries saved by another collector
+        in the meantime are kept.
+        """
+        with open(self.cache_dir / "index.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self._lock:
+                entries = self._load_index()
+                entries.update({url: self.entries[url] for url in self.changed})
+                with tempfile.NamedTemporaryFile(
+                    "w", dir=self.cache_dir, suffix=".tmp", delete=False
+                ) as f:
+                    json.dump(entries, f)
+                os.replace(f.name, self.index_path)
+                self.entries = entries
+                self.changed = set()
+        log.info(
+            f"HTTP cache: {self.revalidated} pages not modified, "
+            f"{self.downloaded_bytes} bytes downloaded"
+        )
+        return None
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        if not self.index_path.exists():
+            return {}
+        with open(self.index_path, "r") as f:
+            return json.load(f)
+
+    def _body_path(self, url: str) -> Path:
+        return self.bodies_dir / f"{content_digest(url)}.html"
@@ -1,9 +1,12 @@
 from pathlib import Path
 from typing import List
 
-import requests
+from requests import Response
 
-from ..utils.parsing import load_content
+from ..utils.parsing import load_content, load_elements
+from ..utils.telemetry import record_items, tracked
+from .fetch import DEFAULT_CONCURRENCY, DEFAULT_RPS, Fetcher
+from .http_cache import HttpCache
 
 
 OUTPUT_DIR = Path("./data/courses/tinkoff")
@@ -20,22 +23,48 @@ COURSE_DATA_CLASSES = [
 ]
 
 
-def parse_tinkoff_courses() -> None:
-    courses_links = get_courses_links()
-    courses_parts_links = [
-        get_course_parts_links(course_link) for course_link in courses_links
-    ]
-    for i in range(len(courses_parts_links)):
-        for j, course_part_link in enumerate(courses_parts_links[i]):
-            course_content = parse_course_part(course_part_link)
-            if course_content:
-                with open(OUTPUT_DIR / f"{i}_{j}.html", "w") as f:
-                    f.write(course_content)
+@tracked
+def parse_tinkoff_courses(
+    rps: float = DEFAULT_RPS, concurrency: int = DEFAULT_CONCURRENCY
+) -> None:
+    cache = HttpCache()
+    with Fetcher(rps=rps, concurrency=concurrency, cache=cache) as fetcher:
+        courses_links = get_courses_links(fetcher)
+        courses_parts_links = [
+            get_course_parts_links(response) if response else []
+            for response in fetcher.get_many(
+                [BASE_URL + course_link for course_link in courses_links]
+            )
+        ]
+        positions = [
+            (i, j)
+            for i in range(len(courses_parts_links))
+            for j in range(len(courses_parts_links[i]))
+        ]
+        urls = [BASE_URL + courses_parts_links[i][j] for i, j in positions]
+        responses = fetcher.get_many(urls)
+    written = 0
+    for (i, j), url, response in zip(positions, urls, responses):
+        output_file = OUTPUT_DIR / f"{i}_{j}.html"
+        # Positions shift when lessons are added, so an unchanged page
+        # is skipped only if its own text is in the file
+        if response is None or (
+            response.unchanged and cache.is_output_current(url, output_file)
+        ):
+            continue
+        course_content = parse_course_part(response)
+        if course_content:
+            with open(output_file, "w") as f:
+                f.write(course_content)
+            cache.set_output(url, output_file, course_content)
+            written += 1
+    cache.save()
+    record_items(items_in=len(positions), items_out=written)
     return None
 
 
-def get_courses_links() -> List[str]:
-    response = requests.get(COURSES_URL)
+def get_courses_links(fetcher: Fetcher) -> List[str]:
+    response = fetcher.get(COURSES_URL)
     soup = load_content(response)
     h2_tag = soup.find("h2", {"class": COURSES_CLASS}, string=COURSES_TEXT)
     parent_div = h2_tag.find_parent("div")
@@ -44,17 +73,21 @@ def get_courses_links() -> List[str]:
     return [link["href"] for link in links]
 
 
-def get_course_parts_links(course_href: str) -> List[str]:
-    response = requests.get(BASE_URL + course_href)
-    soup = load_content(response)
+def get_course_parts_links(response: Response) -> List[str]:
+    soup = load_elements(response, [("div", {"class": LESSON_CARD_CLASS})])
     course_parts = soup.find_all("div", {"class": LESSON_CARD_CLASS})
     course_parts_links = [part.find("a")["href"] for part in course_parts]
     return course_parts_links
 
 
-def parse_course_part(course_part_link: str) -> str:
-    response = requests.get(BASE_URL + course_part_link)
-    soup = load_content(response)
+def parse_course_part(response: Response) -> str:
+    soup = load_elements(
+        response,
+        [
+            (tag, {"class": item_class})
+            for tag, item_class in zip(COURSE_DATA_TAGS, COURSE_DATA_CLASSES)
+        ],
+    )
     course_content = ""
     for tag, item_class in zip(COURSE_DATA_TAGS, COURSE_DATA_CLASSES):
         element = soup.find(tag, {"class": item_class})
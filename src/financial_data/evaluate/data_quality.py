@@ -1,140 +1,242 @@
-from collections import defaultdict
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
+import os
 import re
-from typing import Any, Dict
+from typing import Any, Dict, Iterator, List
 
 from ..storages import initialize_storage
+from ..utils.batch import batched
 from ..utils.log import get_logger
+from ..utils.telemetry import record_items, tracked
 
 
 log = get_logger(__name__)
 
-
-def collect_data_quality_metrics() -> None:
-    """Основная функция для сбора метрик и сохранения в БД."""
+MAX_HEADING_LEVEL = 8
+DEFAULT_RANGE_CHARS = 1_000_000
+DOCUMENTS_PER_WINDOW = 64
+
+# Шаблоны не переходят через "\n", поэтому их можно считать
+# по диапазонам строк целиком
+BULLET_POINT = re.compile(r"[•·-][^\S\n]+\w+")
+NUMBERED_LIST = re.compile(r"^\d+\.[^\S\n]+\w+", re.MULTILINE)
+SPECIAL_CHAR = re.compile(r"[^a-zA-Zа-яА-Я0-9\s.,!?-]")
+HEADING = re.compile(
+    r"^(#{1,%d})(?:[^\S\n]|$)" % MAX_HEADING_LEVEL, re.MULTILINE
+)
+DECORATIVE_LINE = re.compile(r"^[-_=*•·]+$")
+DECORATIVE_CHARS = "-_=*•·"
+
+
+@dataclass
+class QualityStats:
+    """
+    Частичные метрики диапазона строк документа. Метрики диапазонов
+    складываются через merge, итоговые метрики считаются в to_metrics.
+    """
+
+    lines: int = 0
+    line_chars: int = 0
+    non_empty_lines: int = 0
+    words: int = 0
+    word_chars: int = 0
+    decorative_lines: int = 0
+    short_lines: int = 0
+    long_lines: int = 0
+    bullet_points: int = 0
+    numbered_lists: int = 0
+    special_chars: int = 0
+    headings: List[int] = field(default_factory=lambda: [0] * MAX_HEADING_LEVEL)
+    line_counts: Counter = field(default_factory=Counter)
+
+    def merge(self, other: "QualityStats") -> "QualityStats":
+        self.lines += other.lines
+        self.line_chars += other.line_chars
+        self.non_empty_lines += other.non_empty_lines
+        self.words += other.words
+        self.word_chars += other.word_chars
+        self.decorative_lines += other.decorative_lines
+        self.short_lines += other.short_lines
+        self.long_lines += other.long_lines
+        self.bullet_points += other.bullet_points
+        self.numbered_lists += other.numbered_lists
+        self.special_chars += other.special_chars
+        self.headings = [
+            count + other_count
+            for count, other_count in zip(self.headings, other.headings)
+        ]
+        self.line_counts.update(other.line_counts)
+        return self
+
+    def to_metrics(self) -> Dict[str, Any]:
+        # Строки разделены "\n", которые тоже входят в длину текста
+        total_chars = self.line_chars + max(self.lines - 1, 0)
+        duplicates = sum(1 for count in self.line_counts.values() if count > 1)
+        metrics = {
+            "total_chars": total_chars,
+            "total_words": self.words,
+            "total_lines": self.lines,
+            "non_empty_lines": self.non_empty_lines,
+            "avg_word_length": round(
+                self.word_chars / self.words if self.words else 0, 2
+            ),
+            "duplicate_lines_ratio": _ratio(duplicates, self.lines),
+            "decorative_lines_ratio": _ratio(self.decorative_lines, self.lines),
+            "short_lines_ratio": _ratio(self.short_lines, self.lines),
+            "long_lines_ratio": _ratio(self.long_lines, self.lines),
+            "bullet_points_count": self.bullet_points,
+            "numbered_lists_count": self.numbered_lists,
+            "special_chars_ratio": _ratio(self.special_chars, total_chars),
+        }
+        for level, count in enumerate(self.headings, start=1):
+            metrics[f"h{level}_tags_count"] = count
+        return metrics
+
+
+@tracked
+def collect_data_quality_metrics(
+    range_chars: int = DEFAULT_RANGE_CHARS,
+) -> None:
+    """
+    Основная функция для сбора метрик и сохранения в БД.
+
+    Метрики каждого сырого документа заменяют метрики прошлого запуска
+    только после того, как все новые метрики записаны; при ошибке
+    остаются прежние метрики, а ошибка пробрасывается дальше.
+    Документы длиннее range_chars символов делятся на диапазоны строк,
+    которые считаются параллельно в DataQualityWorkers процессах
+    (по умолчанию по числу CPU).
+    """
+    workers = int(os.getenv("DataQualityWorkers", os.cpu_count() or 1))
     document_storage = initialize_storage("document")
     metrics_storage = initialize_storage("metric")
 
-    try:
-        documents = document_storage.get_raw_documents()
-        for document in documents:
-            document_text = document["content"]
-            metrics = calculate_document_metrics(document_text)
-            metrics["source_name"] = document["source_name"]
-            metrics_storage.set_metric(metrics)
+    documents = document_storage.iter_raw_documents(
+        projection=["source_name", "content"]
+    )
+    processed, replaced = metrics_storage.replace_metrics(
+        "data_quality", iter_document_metrics(documents, workers, range_chars)
+    )
 
-        log.info(f"Successfully processed {len(documents)} documents")
-    except Exception as e:
-        log.error(f"Error processing documents: {e}")
+    record_items(items_in=processed, items_out=processed)
+    log.info(
+        f"Successfully processed {processed} documents, "
+        f"replaced {replaced} metrics"
+    )
     return None
 
 
-def calculate_document_metrics(content: str) -> Dict[str, Any]:
-    """Расчет метрик для одного документа."""
-    metrics = {
-        "metric_type": "data_quality",
-        "timestamp": datetime.now(),
-    }
-
-    text_metrics = analyze_text_quality(content)
-    metrics.update(text_metrics)
-    structure_metrics = analyze_document_structure(content)
-    metrics.update(structure_metrics)
+def iter_document_metrics(
+    documents: Iterator[Dict[str, Any]],
+    workers: int = 1,
+    range_chars: int = DEFAULT_RANGE_CHARS,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Метрики документов в порядке документов. Диапазоны строк всех
+    документов окна считаются в пуле и собираются обратно по документам.
+    """
+    if workers <= 1:
+        for document in documents:
+            metrics = calculate_document_metrics(document["content"])
+            metrics["source_name"] = document["source_name"]
+            yield metrics
+        return None
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for window in batched(documents, DOCUMENTS_PER_WINDOW):
+            ranges = [
+                split_line_ranges(document["content"], range_chars)
+                for document in window
+            ]
+            partials = pool.map(
+                analyze_lines,
+                [
+                    line_range
+                    for doc_ranges in ranges
+                    for line_range in doc_ranges
+                ],
+                chunksize=max(1, len(window) // workers),
+            )
+            for document, doc_ranges in zip(window, ranges):
+                stats = QualityStats()
+                for _ in doc_ranges:
+                    stats.merge(next(partials))
+                metrics = _with_header(stats.to_metrics())
+                metrics["source_name"] = document["source_name"]
+                yield metrics
+    return None
 
-    return metrics
 
+def calculate_document_metrics(content: str) -> Dict[str, Any]:
+    """Расчет метрик для одного документа за один проход по строкам."""
+    return _with_header(analyze_lines(content).to_metrics())
 
-def analyze_text_quality(text: str) -> Dict[str, float]:
-    """Анализ качества текстового содержимого."""
-    metrics = {}
 
-    # Разбиваем на строки и слова
+def analyze_lines(text: str) -> QualityStats:
+    """
+    Частичные метрики текста или диапазона строк. Строки проходятся
+    один раз, шаблоны форматирования считаются по всему диапазону.
+    """
     lines = text.split("\n")
     words = text.split()
-
-    # Базовые метрики
-    metrics["total_chars"] = len(text)
-    metrics["total_words"] = len(words)
-    metrics["total_lines"] = len(lines)
-    metrics["non_empty_lines"] = len([line for line in lines if line.strip()])
-
-    # Анализ слов
-    avg_word_length = (
-        sum(len(word) for word in words) / len(words) if words else 0
+    stats = QualityStats(
+        lines=len(lines),
+        line_chars=len(text) - len(lines) + 1,
+        words=len(words),
+        word_chars=sum(map(len, words)),
+        bullet_points=len(BULLET_POINT.findall(text)),
+        numbered_lists=len(NUMBERED_LIST.findall(text)),
+        special_chars=len(SPECIAL_CHAR.findall(text)),
     )
-    metrics["avg_word_length"] = round(avg_word_length, 2)
-
-    # Анализ строк
-    duplicate_lines = defaultdict(int)
-    non_letter_lines = []
-    short_lines = []
-    long_lines = []
+    for heading in HEADING.findall(text):
+        stats.headings[len(heading) - 1] += 1
 
+    line_counts = stats.line_counts
     for line in lines:
         line = line.strip()
-        if line:
-            # Подсчет дубликатов
-            duplicate_lines[line] += 1
-
-            # Проверка на декоративные линии
-            if re.match(r"^[-_=*•·]+$", line):
-                non_letter_lines.append(line)
-
-            # Анализ длины строк
-            if len(line) < 5:
-                short_lines.append(line)
-            elif len(line) > 200:
-                long_lines.append(line)
-
-    metrics["duplicate_lines_ratio"] = round(
-        (
-            len([line for line, count in duplicate_lines.items() if count > 1])
-            / len(lines)
-            if lines
-            else 0
-        ),
-        3,
-    )
-    metrics["decorative_lines_ratio"] = round(
-        len(non_letter_lines) / len(lines) if lines else 0, 3
-    )
-    metrics["short_lines_ratio"] = round(
-        len(short_lines) / len(lines) if lines else 0, 3
-    )
-    metrics["long_lines_ratio"] = round(
-        len(long_lines) / len(lines) if lines else 0, 3
-    )
-
-    # Анализ форматирования
-    metrics["bullet_points_count"] = len(re.findall(r"[•·-]\s+\w+", text))
-    metrics["numbered_lists_count"] = len(
-        re.findall(r"^\d+\.\s+\w+", text, re.MULTILINE)
-    )
-
-    # Анализ пунктуации и специальных символов
-    metrics["special_chars_ratio"] = round(
-        (
-            len(re.findall(r"[^a-zA-Zа-яА-Я0-9\s.,!?-]", text)) / len(text)
-            if text
-            else 0
-        ),
-        3,
-    )
-
-    return metrics
-
-
-def analyze_document_structure(content: str) -> Dict[str, int]:
-    """Анализ структуры документа."""
-    # Подсчет md тегов в тексте
-    metrics = {
-        f"h{i}_tags_count": len(
-            re.findall(r"^(?:#{i}\s)", content, re.MULTILINE)
-        )
-        for i in range(1, 9)  # до h8
+        if not line:
+            continue
+        stats.non_empty_lines += 1
+        line_counts[line] += 1
+        if line[0] in DECORATIVE_CHARS and DECORATIVE_LINE.match(line):
+            stats.decorative_lines += 1
+        if len(line) < 5:
+            stats.short_lines += 1
+        elif len(line) > 200:
+            stats.long_lines += 1
+    return stats
+
+
+def split_line_ranges(text: str, range_chars: int) -> List[str]:
+    """
+    Деление текста на диапазоны строк примерно по range_chars символов.
+    Диапазоны разделены "\\n", который не входит ни в один из них,
+    поэтому строки диапазонов вместе дают строки всего текста.
+    """
+    ranges = []
+    start = 0
+    while len(text) - start > range_chars:
+        end = text.find("\n", start + range_chars)
+        if end == -1:
+            break
+        ranges.append(text[start:end])
+        start = end + 1
+    ranges.append(text[start:])
+    return ranges
+
+
+def _with_header(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "metric_type": "data_quality",
+        "timestamp": datetime.now(),
+        **metrics,
     }
 
-    return metrics
+
+def _ratio(count: int, total: int) -> float:
+    return round(count / total if total else 0, 3)
 
 
 if __name__ == "__main__":
@@ -1,49 +1,163 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from collections import Counter
-from typing import List, Dict
+import os
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Tuple
 
 from langchain_core.documents import Document
-from transformers import AutoTokenizer
-
-from financial_data.utils.text_processer import TextProcesser
 
 from ..storages import initialize_storage
+from ..utils.batch import batched
+from ..utils.log import get_logger
+from ..utils.telemetry import record_items, tracked
+
+
+log = get_logger(__name__)
+
+# transformers and NLTK are slow to import, they are loaded
+# by the first worker which computes statistics
+if TYPE_CHECKING:
+    from financial_data.utils.text_processer import TextProcesser
+
+MODEL_PATH = "intfloat/multilingual-e5-small"
+DEFAULT_TOKENIZER_BATCH_SIZE = 256
+
+# Tokenizer and text processer of the current process, so that every
+# pool worker loads them once
+_workers_state: Dict[str, Tuple[Any, "TextProcesser"]] = {}
 
 
+@tracked
 def collect_eda_metrics() -> None:
+    """
+    Collect EDA metrics of every chunk. Metrics of the previous run
+    are replaced once all new metrics are written, and kept if the
+    collection fails. Chunks are processed by EdaWorkers processes
+    (CPU count by default).
+    """
+    workers = int(os.getenv("EdaWorkers", os.cpu_count() or 1))
     chunk_storage = initialize_storage("chunk")
     metric_storage = initialize_storage("metric")
-    documents = chunk_storage.get_chunks()
-    stats = collect_statistics(documents)
-    for stat in stats:
-        metric_storage.set_metric(stat)
+    documents = chunk_storage.iter_chunks(
+        projection=["page_content", "metadata.source_name"]
+    )
+    inserted, deleted = metric_storage.replace_metrics(
+        "eda", iter_statistics(documents, workers=workers)
+    )
+    record_items(items_in=inserted, items_out=inserted)
+    log.info(f"Written {inserted} EDA metrics, replaced {deleted}")
     return None
 
 
 def collect_statistics(
-    documents: List[Document],
-    model_path: str = "intfloat/multilingual-e5-small",
+    documents: Iterable[Document],
+    model_path: str = MODEL_PATH,
+    batch_size: int = DEFAULT_TOKENIZER_BATCH_SIZE,
+    workers: int = 1,
 ) -> List[Dict[str, any]]:
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
-    text_processer = TextProcesser()
-    metrics = []
-    for doc in documents:
-        text = doc.page_content
+    return list(iter_statistics(documents, model_path, batch_size, workers))
+
+
+def iter_statistics(
+    documents: Iterable[Document],
+    model_path: str = MODEL_PATH,
+    batch_size: int = DEFAULT_TOKENIZER_BATCH_SIZE,
+    workers: int = 1,
+) -> Iterator[Dict[str, any]]:
+    """
+    Statistics of every document in the order of documents.
+
+    Documents are tokenized batch_size at a time. With more than one
+    worker batches are processed in a process pool, at most two batches
+    per worker are in flight.
+    """
+    batches = (
+        [(doc.metadata["source_name"], doc.page_content) for doc in batch]
+        for batch in batched(documents, batch_size)
+    )
+    if workers <= 1:
+        for batch in batches:
+            yield from compute_batch_statistics(batch, model_path)
+        return None
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker
+    ) as pool:
+        for window in batched(batches, workers * 2):
+            results = pool.map(
+                compute_batch_statistics, window, [model_path] * len(window)
+            )
+            for statistics in results:
+                yield from statistics
+    return None
+
 
-        tokens = tokenizer.tokenize(text)
+def compute_batch_statistics(
+    batch: List[Tuple[str, str]], model_path: str = MODEL_PATH
+) -> List[Dict[str, any]]:
+    """
+    Statistics of (source name, text) pairs.
+    """
+    tokenizer, text_processer = _get_worker_state(model_path)
+    texts = [text for _, text in batch]
+    token_counts = count_tokens(tokenizer, texts)
+    batch_words = text_processer.process_texts(texts)
+    statistics = []
+    for (source_name, text), tokens, words in zip(
+        batch, token_counts, batch_words
+    ):
         sentences = text.split(".")
-        words = text_processer.process_text(text)
         word_frequency = Counter(words)
         most_common_words = word_frequency.most_common(5)
+        languages = Counter(
+            text_processer.detect_language(word) for word in words
+        )
 
         metric = {
-            "source_name": doc.metadata["source_name"],
+            "source_name": source_name,
             "metric_type": "eda",
             "timestamp": datetime.now(),
-            "tokens": len(tokens),
+            "tokens": tokens,
             "sentences": len(sentences),
             "words": len(words),
+            "words_ru": languages["ru"],
+            "words_en": languages["en"],
             "most_common_words": most_common_words,
         }
-        metrics.append(metric)
-    return metrics
+        statistics.append(metric)
+    return statistics
+
+
+def count_tokens(tokenizer: Any, texts: List[str]) -> List[int]:
+    """
+    Number of tokens of every text, the same as len(tokenizer.tokenize(text)).
+
+    A fast tokenizer encodes the whole batch in Rust and only lengths
+    are taken from the encodings, token strings are never built.
+    """
+    if not getattr(tokenizer, "is_fast", False):
+        return [len(tokenizer.tokenize(text)) for text in texts]
+    encodings = tokenizer.backend_tokenizer.encode_batch(
+        texts, add_special_tokens=False
+    )
+    return [len(encoding.ids) for encoding in encodings]
+
+
+def _get_worker_state(model_path: str) -> Tuple[Any, "TextProcesser"]:
+    if model_path not in _workers_state:
+        from transformers import AutoTokenizer
+
+        from financial_data.utils.text_processer import TextProcesser
+
+        _workers_state[model_path] = (
+            AutoTokenizer.from_pretrained(model_path),
+            TextProcesser(),
+        )
+    return _workers_state[model_path]
+
+
+def _init_worker() -> None:
+    # Workers already run in parallel, threads of the Rust tokenizer
+    # would only compete with each other
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    return None
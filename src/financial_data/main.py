@@ -1,45 +1,56 @@
-from .collect import parse_bcs_courses, parse_tinkoff_courses
-from .evaluate import collect_data_quality_metrics, collect_eda_metrics
-from .preprocessing import (
-    clear_txt,
-    create_configs,
-    html2txt,
-    index_chunks,
-    pdf2txt,
-    process_3d_party_data,
-    split_documents,
-)
-
-
-def collect_data() -> None:
-    parse_bcs_courses()
-    parse_tinkoff_courses()
-    return None
+from typing import Optional, Tuple
 
+import click
 
-def transform_data() -> None:
-    html2txt()
-    pdf2txt()
-    return None
+from .mongo_pool import log_pool_stats
+from .pipeline import STAGES, get_dependents, run_pipeline, select_stages
 
 
-def process_data() -> None:
-    create_configs()
-    clear_txt()
-    process_3d_party_data()
-    split_documents()
-    return None
-
-
-def collect_metrics() -> None:
-    collect_data_quality_metrics()
-    collect_eda_metrics()
+@click.command()
+@click.argument(
+    "stages", nargs=-1, type=click.Choice([stage.name for stage in STAGES])
+)
+@click.option(
+    "--from",
+    "from_stage",
+    type=click.Choice([stage.name for stage in STAGES]),
+    help="Run this stage and every stage which depends on it",
+)
+@click.option(
+    "--resume/--restart",
+    default=True,
+    show_default=True,
+    help="Skip stages finished by the previous unfinished run",
+)
+@click.option("--workers", type=int, help="Stages running at once")
+@click.option("--list", "list_stages", is_flag=True, help="Show stage graph")
+def main(
+    stages: Tuple[str, ...],
+    from_stage: Optional[str],
+    resume: bool,
+    workers: Optional[int],
+    list_stages: bool,
+) -> None:
+    """
+    Run the pipeline, or only STAGES, as a graph of stages.
+    """
+    selected = select_stages(stages, from_stage)
+    if list_stages:
+        for stage in selected:
+            depends_on = ", ".join(stage.depends_on) or "-"
+            click.echo(f"{stage.name:<32}{depends_on}")
+        return None
+    # Named stages are run even if the resumed run has finished them,
+    # and so are stages after from_stage, which depend on its new output
+    rerun = set(stages)
+    if from_stage is not None:
+        rerun |= {from_stage} | get_dependents(from_stage)
+    try:
+        run_pipeline(selected, resume=resume, workers=workers, rerun=rerun)
+    finally:
+        log_pool_stats()
     return None
 
 
 if __name__ == "__main__":
-    collect_data()
-    transform_data()
-    process_data()
-    collect_metrics()
-    index_chunks()
+    main()
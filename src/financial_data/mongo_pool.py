@@ -0,0 +1,222 @@
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+from pymongo import MongoClient, monitoring
+
+from .utils.log import get_logger
+from .utils.telemetry import record_round_trips
+
+
+log = get_logger(__name__)
+
+DEFAULT_MAX_POOL_SIZE = 100
+DEFAULT_MIN_POOL_SIZE = 0
+DEFAULT_SERVER_SELECTION_TIMEOUT_MS = 30000
+DEFAULT_CONNECT_TIMEOUT_MS = 20000
+DEFAULT_WAIT_QUEUE_TIMEOUT_MS = 0
+
+_clients: Dict[Tuple[str, int], MongoClient] = {}
+_listeners: Dict[Tuple[str, int], "PoolStatsListener"] = {}
+_clients_lock = threading.Lock()
+_owner_pid = os.getpid()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Collects connection pool usage of one client: currently checked-out
+    connections, peak usage and time spent waiting for a connection.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "failed_checkouts": self.failed_checkouts,
+                "total_wait_time": round(self.total_wait_time, 6),
+                "max_wait_time": round(self.max_wait_time, 6),
+                "avg_wait_time": round(
+                    self.total_wait_time / self.checkouts
+                    if self.checkouts
+                    else 0.0,
+                    6,
+                ),
+            }
+
+    def connection_checked_out(self, event: Any) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self._add_wait_time(event)
+
+    def connection_checked_in(self, event: Any) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event: Any) -> None:
+        with self._lock:
+            self.failed_checkouts += 1
+            self._add_wait_time(event)
+
+    def connection_created(self, event: Any) -> None:
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event: Any) -> None:
+        with self._lock:
+            self.open_connections -= 1
+
+    def _add_wait_time(self, event: Any) -> None:
+        # duration is reported by pymongo>=4.7 in seconds
+        wait_time = getattr(event, "duration", 0.0) or 0.0
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def connection_check_out_started(self, event: Any) -> None:
+        pass
+
+    def connection_ready(self, event: Any) -> None:
+        pass
+
+    def pool_created(self, event: Any) -> None:
+        pass
+
+    def pool_ready(self, event: Any) -> None:
+        pass
+
+    def pool_cleared(self, event: Any) -> None:
+        pass
+
+    def pool_closed(self, event: Any) -> None:
+        pass
+
+
+class RoundTripListener(monitoring.CommandListener):
+    """
+    Counts every command sent to the server (find, getMore, insert,
+    update, ...) as a storage round-trip of the current pipeline stage.
+    """
+
+    def started(self, event: Any) -> None:
+        record_round_trips()
+
+    def succeeded(self, event: Any) -> None:
+        pass
+
+    def failed(self, event: Any) -> None:
+        pass
+
+
+def get_client(host: str, port: int) -> MongoClient:
+    """
+    Return the process-wide client for host and port, creating it
+    on first use. Pool size and timeouts are read from environment:
+    MongoMaxPoolSize, MongoMinPoolSize, MongoServerSelectionTimeoutMS,
+    MongoConnectTimeoutMS and MongoWaitQueueTimeoutMS.
+    """
+    key = (host, port)
+    with _clients_lock:
+        _reset_after_fork()
+        client = _clients.get(key)
+        if client is None:
+            listener = PoolStatsListener()
+            client = MongoClient(
+                host,
+                port,
+                event_listeners=[listener, RoundTripListener()],
+                **_client_options(),
+            )
+            _clients[key] = client
+            _listeners[key] = listener
+        return client
+
+
+def get_pool_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Pool usage per client, keyed by "host:port".
+    """
+    with _clients_lock:
+        _reset_after_fork()
+        return {
+            f"{host}:{port}": listener.stats()
+            for (host, port), listener in _listeners.items()
+        }
+
+
+def log_pool_stats() -> None:
+    for address, stats in get_pool_stats().items():
+        log.info(f"Mongo pool {address}: {stats}")
+    return None
+
+
+def close_clients() -> None:
+    with _clients_lock:
+        _reset_after_fork()
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _listeners.clear()
+    return None
+
+
+def _reset_after_fork() -> None:
+    """
+    MongoClient is not fork-safe: a forked worker must not reuse sockets
+    inherited from the parent, so it drops them and builds own clients.
+    """
+    global _owner_pid
+    if os.getpid() != _owner_pid:
+        _clients.clear()
+        _listeners.clear()
+        _owner_pid = os.getpid()
+    return None
+
+
+def _reinit_lock_after_fork() -> None:
+    # The parent may have forked while another thread held the lock.
+    global _clients_lock
+    _clients_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_lock_after_fork)
+
+
+def _client_options() -> Dict[str, int]:
+    options = {
+        "maxPoolSize": int(
+            os.getenv("MongoMaxPoolSize", DEFAULT_MAX_POOL_SIZE)
+        ),
+        "minPoolSize": int(
+            os.getenv("MongoMinPoolSize", DEFAULT_MIN_POOL_SIZE)
+        ),
+        "serverSelectionTimeoutMS": int(
+            os.getenv(
+                "MongoServerSelectionTimeoutMS",
+                DEFAULT_SERVER_SELECTION_TIMEOUT_MS,
+            )
+        ),
+        "connectTimeoutMS": int(
+            os.getenv("MongoConnectTimeoutMS", DEFAULT_CONNECT_TIMEOUT_MS)
+        ),
+    }
+    wait_queue_timeout = int(
+        os.getenv("MongoWaitQueueTimeoutMS", DEFAULT_WAIT_QUEUE_TIMEOUT_MS)
+    )
+    if wait_queue_timeout > 0:
+        options["waitQueueTimeoutMS"] = wait_queue_timeout
+    return options
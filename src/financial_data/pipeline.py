@@ -0,0 +1,268 @@
+"""
+Stage graph of the pipeline and its scheduler.
+
+Stages run as soon as all their dependencies are done, so independent
+stages (the two collectors, html2txt, codex ingest and the split
+branch) run concurrently. Stages with process pools run alone: forking
+workers while threads of other stages hold locks is unsafe, and their
+telemetry would count the workers of other stages. Every finished
+stage is written to a checkpoint file, a failed run is resumed by the
+next one: stages that already finished are skipped.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import contextvars
+from dataclasses import dataclass
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .collect import parse_bcs_courses, parse_tinkoff_courses
+from .evaluate import collect_data_quality_metrics, collect_eda_metrics
+from .preprocessing import (
+    clear_txt,
+    create_configs,
+    dedup_chunks,
+    html2txt,
+    index_chunks,
+    pdf2txt,
+    process_3d_party_data,
+    split_documents,
+)
+from .utils.log import get_logger
+from .utils.telemetry import new_run_id, track_stage
+
+
+log = get_logger(__name__)
+
+CHECKPOINT_PATH = Path("./data/pipeline/checkpoint.json")
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    function: Callable[[], None]
+    depends_on: Tuple[str, ...] = ()
+    # Runs with no other stage of the pipeline
+    exclusive: bool = False
+
+
+STAGES = [
+    Stage("parse_bcs_courses", parse_bcs_courses),
+    Stage("parse_tinkoff_courses", parse_tinkoff_courses),
+    Stage(
+        "html2txt",
+        html2txt,
+        depends_on=("parse_bcs_courses", "parse_tinkoff_courses"),
+    ),
+    Stage("pdf2txt", pdf2txt, exclusive=True),
+    Stage("create_configs", create_configs, depends_on=("html2txt", "pdf2txt")),
+    Stage(
+        "clear_txt", clear_txt, depends_on=("create_configs",), exclusive=True
+    ),
+    Stage("split_documents", split_documents, depends_on=("clear_txt",)),
+    Stage("process_3d_party_data", process_3d_party_data),
+    Stage(
+        "dedup_chunks",
+        dedup_chunks,
+        depends_on=("split_documents", "process_3d_party_data"),
+    ),
+    Stage(
+        "collect_data_quality_metrics",
+        collect_data_quality_metrics,
+        depends_on=("html2txt", "pdf2txt"),
+        exclusive=True,
+    ),
+    Stage(
+        "collect_eda_metrics",
+        collect_eda_metrics,
+        depends_on=("dedup_chunks",),
+        exclusive=True,
+    ),
+    Stage("index_chunks", index_chunks, depends_on=("dedup_chunks",)),
+]
+
+
+class Checkpoint:
+    """
+    Completion markers of the current run. The run is finished when all
+    its stages are done, until then the next run resumes it.
+    """
+
+    def __init__(self, path: Path = CHECKPOINT_PATH) -> None:
+        self.path = Path(path)
+        self.run_id: Optional[str] = None
+        self.completed: Dict[str, str] = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                state = json.load(f)
+            if not state.get("finished"):
+                self.run_id = state["run_id"]
+                self.completed = state["completed"]
+
+    def start(self, resume: bool) -> str:
+        if not resume or self.run_id is None:
+            self.run_id = new_run_id()
+            self.completed = {}
+        self._save(finished=False)
+        return self.run_id
+
+    def mark_completed(self, stage: str) -> None:
+        self.completed[stage] = datetime.now().isoformat()
+        self._save(finished=False)
+        return None
+
+    def invalidate(self, stages: Iterable[str]) -> None:
+        """
+        Forget that stages are done, so that a resumed run runs them again.
+        """
+        for stage in stages:
+            self.completed.pop(stage, None)
+        self._save(finished=False)
+        return None
+
+    def finish(self) -> None:
+        self._save(finished=True)
+        return None
+
+    def _save(self, finished: bool) -> None:
+        os.makedirs(self.path.parent, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "run_id": self.run_id,
+                    "completed": self.completed,
+                    "finished": finished,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+        return None
+
+
+def select_stages(
+    names: Iterable[str] = (),
+    from_stage: Optional[str] = None,
+    stages: List[Stage] = STAGES,
+) -> List[Stage]:
+    """
+    Stages to run: the given names, or from_stage and every stage which
+    depends on it, or the whole graph. Order of the graph is kept.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    selected = set(names)
+    if from_stage is not None:
+        selected |= {from_stage} | get_dependents(from_stage, stages)
+    unknown = selected - by_name.keys()
+    if unknown:
+        raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+    if not selected:
+        return list(stages)
+    return [stage for stage in stages if stage.name in selected]
+
+
+def get_dependents(name: str, stages: List[Stage] = STAGES) -> Set[str]:
+    dependents: Set[str] = set()
+    frontier = {name}
+    while frontier:
+        frontier = {
+            stage.name
+            for stage in stages
+            if frontier & set(stage.depends_on) and stage.name not in dependents
+        }
+        dependents |= frontier
+    return dependents
+
+
+def run_pipeline(
+    stages: Optional[List[Stage]] = None,
+    resume: bool = True,
+    workers: Optional[int] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    rerun: Iterable[str] = (),
+    graph: Optional[List[Stage]] = None,
+) -> None:
+    """
+    Run stages of the graph concurrently as their dependencies finish.
+    Dependencies outside of stages are considered done.
+
+    With resume, stages finished by the previous unfinished run are
+    skipped, except for rerun, and the run keeps its run id. The run is
+    finished only when all stages of graph (STAGES by default) are done,
+    so a run of some stages can be resumed by the next one. An
+    exclusive stage starts when no other stage is running, and no stage
+    starts while it runs. A failed stage doesn't stop independent
+    stages, its dependents are not started, and the run raises
+    RuntimeError after all other stages are done. At most workers
+    stages run at once (PipelineWorkers env variable, all by default).
+    """
+    stages = STAGES if stages is None else stages
+    graph = STAGES if graph is None else graph
+    workers = workers or int(os.getenv("PipelineWorkers", len(stages) or 1))
+    checkpoint = checkpoint or Checkpoint()
+    run_id = checkpoint.start(resume)
+    checkpoint.invalidate(rerun)
+    selected = {stage.name for stage in stages}
+    done = {name for name in checkpoint.completed if name in selected}
+    if done:
+        log.info(f"Resuming run {run_id}, done: {', '.join(sorted(done))}")
+    pending = [stage for stage in stages if stage.name not in done]
+    failed: Set[str] = set()
+
+    with track_stage("pipeline", run_id=run_id), ThreadPoolExecutor(
+        max_workers=workers
+    ) as pool:
+        running: Dict[Future, Stage] = {}
+        while pending or running:
+            blocked = any(stage.exclusive for stage in running.values())
+            for stage in list(pending):
+                dependencies = set(stage.depends_on) & selected
+                if dependencies & failed:
+                    log.error(f"Stage {stage.name} skipped, dependency failed")
+                    failed.add(stage.name)
+                    pending.remove(stage)
+                elif dependencies <= done and not blocked:
+                    if stage.exclusive and running:
+                        # Wait for running stages without starting others
+                        blocked = True
+                        continue
+                    # Stages of a run are tracked as sub-steps of pipeline
+                    context = contextvars.copy_context()
+                    running[pool.submit(context.run, stage.function)] = stage
+                    pending.remove(stage)
+                    blocked = stage.exclusive
+            if not running:
+                if pending:
+                    raise ValueError(
+                        "Stages with cyclic dependencies: "
+                        + ", ".join(stage.name for stage in pending)
+                    )
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    log.error(f"Stage {stage.name} failed: {e!r}")
+                    failed.add(stage.name)
+                    continue
+                done.add(stage.name)
+                checkpoint.mark_completed(stage.name)
+
+        if failed:
+            raise RuntimeError(
+                f"Run {run_id} failed: {', '.join(sorted(failed))}, "
+                "run again to resume"
+            )
+    remaining = [
+        stage.name for stage in graph if stage.name not in checkpoint.completed
+    ]
+    if remaining:
+        log.info(f"Run {run_id} is not finished: {', '.join(remaining)}")
+    else:
+        checkpoint.finish()
+    return None
@@ -1,5 +1,6 @@
 from .clear_txt import clear_txt
 from .create_config import create_configs
+from .dedup import dedup_chunks
 from .html2txt import html2txt
 from .index import index_chunks
 from .pdf2txt import pdf2txt
@@ -9,6 +10,7 @@ from .split import split_documents
 __all__ = [
     clear_txt,
     create_configs,
+    dedup_chunks,
     html2txt,
     index_chunks,
     pdf2txt,
@@ -1,8 +1,20 @@
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+import os
 import re
-from typing import Dict, List, Optional, Pattern, Tuple, Union
+import time
+from typing import Any, Dict, Iterator, List, Optional, Pattern, Tuple, Union
 
 from ..storages import initialize_storage
+from ..utils.batch import batched
+from ..utils.hashing import config_fingerprint, content_digest
+from ..utils.log import get_logger
+from ..utils.telemetry import record_items, tracked
+
+
+log = get_logger(__name__)
+
+DEFAULT_WRITE_BATCH_SIZE = 100
 
 
 @dataclass
@@ -58,12 +70,61 @@ class TextProcessingPatterns:
         )
 
 
+class MultiPatternMatcher:
+    """
+    Checks whether any of the patterns is found in a line with a single
+    scan: patterns are joined into one alternation, which the C regex
+    engine matches in one pass over the line. Literal patterns such as
+    "Поделиться" or "www." need no special treatment, they are just
+    alternatives of the same pattern.
+
+    Patterns which change meaning inside an alternation (numbered
+    backreferences, conditional group references, global inline flags,
+    non-default flags) are checked one by one after the combined pattern.
+    """
+
+    _UNSAFE_PATTERN = re.compile(r"\\[1-9]|\(\?P=|\(\?\(|^\(\?[aiLmsux]+\)")
+
+    def __init__(self, patterns: List[Optional[Pattern]]) -> None:
+        unique_patterns = list(
+            {pattern: None for pattern in patterns if pattern}.keys()
+        )
+        default_flags = re.compile("").flags
+        combinable = [
+            pattern
+            for pattern in unique_patterns
+            if pattern.flags == default_flags
+            and not self._UNSAFE_PATTERN.search(pattern.pattern)
+        ]
+        self.separate = [
+            pattern for pattern in unique_patterns if pattern not in combinable
+        ]
+        self.combined = None
+        if combinable:
+            try:
+                self.combined = re.compile(
+                    "|".join(f"(?:{pattern.pattern})" for pattern in combinable)
+                )
+            except re.error:
+                # e.g. duplicate group names, fall back to separate checks
+                self.separate = unique_patterns
+
+    def search(self, line: str) -> bool:
+        if self.combined is not None and self.combined.search(line):
+            return True
+        return any(pattern.search(line) for pattern in self.separate)
+
+
 class TextLineProcessor:
     def __init__(self, patterns: TextProcessingPatterns):
         self.patterns = patterns
         self.before_first_chapter_passed = False
         self.ignore_text = False
         self.current_chapter = None
+        self.inline_matcher = MultiPatternMatcher(patterns.inline_patterns)
+        self.in_chapters_from_matcher = MultiPatternMatcher(
+            [pattern["from"] for pattern in patterns.in_chapters]
+        )
 
     def should_process_line(self, line: str) -> bool:
         if self.current_chapter:
@@ -78,7 +139,7 @@ class TextLineProcessor:
         if self.ignore_text:
             return False
 
-        return not self._check_inline_patterns(line) and len(line.strip()) > 0
+        return len(line.strip()) > 0 and not self._check_inline_patterns(line)
 
     def check_before_first_chapter(self, line: str) -> bool:
         return (
@@ -102,14 +163,15 @@ class TextLineProcessor:
         )
 
     def _check_inline_patterns(self, line: str) -> bool:
-        return any(
-            pattern and pattern.search(line)
-            for pattern in self.patterns.inline_patterns
-        )
+        return self.inline_matcher.search(line)
 
     def _check_in_chapters_from(
         self, line: str
     ) -> Tuple[bool, Optional[Dict[str, Pattern]]]:
+        # Most lines start no chapter: one combined scan rules them out,
+        # the ordered loop below only picks which chapter matched first
+        if not self.in_chapters_from_matcher.search(line):
+            return False, None
         for pattern in self.patterns.in_chapters:
             if pattern["from"] and pattern["from"].search(line):
                 return True, pattern
@@ -148,30 +210,139 @@ class TextFileProcessor:
         return result
 
 
-def clear_txt() -> None:
+@tracked
+def clear_txt(
+    workers: Optional[int] = None, batch_size: int = DEFAULT_WRITE_BATCH_SIZE
+) -> None:
     """
     Preprocess text data from raw txt files with cleaning configuration,
     which is specified in the meta.json file in each textbook directory.
     After processing, save the processed text to the processed directory.
+
+    Documents whose raw content and cleaning config haven't changed
+    since the previous run are skipped.
+
+    Cleaning config of a source is fetched once per run and compiled once
+    per process. With more than one worker (ClearTxtWorkers env variable,
+    CPU count by default) documents are cleaned in a process pool.
+    Results are written back batch_size documents at a time in the order
+    of raw documents.
     """
+    workers = workers or int(os.getenv("ClearTxtWorkers", os.cpu_count() or 1))
     document_storage = initialize_storage("document")
     config_storage = initialize_storage("config")
-    raw_documents = document_storage.get_raw_documents()
-
-    for raw_document in raw_documents:
-        raw_doc_id = str(raw_document["_id"])
-        source_name = raw_document["source_name"]
-        processing_config = config_storage.get_config(source_name)
-        patterns = TextProcessingPatterns.from_config(processing_config)
-        processor = TextFileProcessor(patterns)
-        processed_document = processor.process_document(
-            raw_document["content"]
+    processed_fingerprints = {
+        str(document["_id"]): document.get("fingerprint")
+        for document in document_storage.iter_processed_documents(
+            projection=["fingerprint"]
         )
-        document_storage.set_processed_document(
-            source_name, processed_document, raw_doc_id
+    }
+    configs: Dict[str, Tuple[Optional[Dict[str, Any]], str]] = {}
+    skipped = 0
+
+    def iter_tasks() -> Iterator[CleaningTask]:
+        nonlocal skipped
+        for raw_document in document_storage.iter_raw_documents():
+            raw_doc_id = str(raw_document["_id"])
+            source_name = raw_document["source_name"]
+            if source_name not in configs:
+                config = config_storage.get_config(source_name)
+                configs[source_name] = (config, get_config_key(config))
+            processing_config, config_key = configs[source_name]
+            fingerprint = get_document_fingerprint(
+                raw_document, processing_config
+            )
+            if processed_fingerprints.get(raw_doc_id) == fingerprint:
+                skipped += 1
+                continue
+            yield CleaningTask(
+                _id=raw_doc_id,
+                source_name=source_name,
+                content=raw_document["content"],
+                config=processing_config,
+                config_key=config_key,
+                fingerprint=fingerprint,
+            )
+
+    start = time.perf_counter()
+    written = 0
+    if workers <= 1:
+        written = document_storage.set_processed_documents(
+            map(clean_document, iter_tasks()), batch_size
         )
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for batch in batched(iter_tasks(), batch_size):
+                chunksize = max(1, len(batch) // (workers * 4))
+                processed = list(
+                    pool.map(clean_document, batch, chunksize=chunksize)
+                )
+                written += document_storage.set_processed_documents(
+                    processed, batch_size
+                )
+    record_items(items_in=written + skipped, items_out=written)
+    log.info(
+        f"Cleaned {written} documents in {time.perf_counter() - start:.1f}s "
+        f"({len(configs)} sources), skipped {skipped} unchanged documents"
+    )
     return None
 
 
+@dataclass
+class CleaningTask:
+    _id: str
+    source_name: str
+    content: str
+    config: Optional[Dict[str, Any]]
+    config_key: str
+    fingerprint: str
+
+
+# Compiled patterns of the current process keyed by config fingerprint,
+# so every pool worker compiles a source config once.
+_patterns_cache: Dict[str, TextProcessingPatterns] = {}
+
+
+def clean_document(task: CleaningTask) -> Dict[str, Any]:
+    patterns = _patterns_cache.get(task.config_key)
+    if patterns is None:
+        patterns = TextProcessingPatterns.from_config(task.config or {})
+        _patterns_cache[task.config_key] = patterns
+    processor = TextFileProcessor(patterns)
+    return {
+        "_id": task._id,
+        "source_name": task.source_name,
+        "content": processor.process_document(task.content),
+        "fingerprint": task.fingerprint,
+    }
+
+
+def get_config_key(processing_config: Optional[Dict[str, Any]]) -> str:
+    return config_fingerprint(
+        {
+            key: value
+            for key, value in (processing_config or {}).items()
+            if key != "_id"
+        }
+    )
+
+
+def get_document_fingerprint(
+    raw_document: Dict[str, Any], processing_config: Dict[str, Any]
+) -> str:
+    """
+    Fingerprint of cleaning inputs: raw content and cleaning config.
+    """
+    content_hash = raw_document.get("digest") or content_digest(
+        raw_document["content"]
+    )
+    config = {
+        key: value
+        for key, value in (processing_config or {}).items()
+        if key != "_id"
+    }
+    return config_fingerprint(content_hash, config)
+
+
 if __name__ == "__main__":
     clear_txt()
@@ -5,6 +5,7 @@ from typing import Any, Dict, List
 import requests
 
 from ..storages import initialize_storage
+from ..utils.telemetry import record_items, tracked
 
 
 LLM_API_URL = "https://api.mistral.ai/v1/chat/completions"
@@ -53,10 +54,13 @@ DEFAULT_TEXTBOOK_CONFIG = {
 }
 
 
+@tracked
 def create_configs() -> None:
     document_storage = initialize_storage("document")
     config_storage = initialize_storage("config")
-    raw_documents = document_storage.get_raw_documents()
+    raw_documents = document_storage.iter_raw_documents(
+        projection=["source_name"]
+    )
     source_names = set(
         [raw_document["source_name"] for raw_document in raw_documents]
     )
@@ -68,6 +72,7 @@ def create_configs() -> None:
         else:
             config = DEFAULT_TEXTBOOK_CONFIG
         config_storage.set_config(source_name, config)
+    record_items(items_in=len(source_names), items_out=len(source_names))
     return None
 
 
@@ -97,7 +102,7 @@ def generate(
             "temperature": temperature,
             "random_seed": random_seed,
         },
-        headers={"Authorization": f"Bearer {os.getenv("MISTRAL_API_KEY")}"},
+        headers={"Authorization": f"Bearer {os.getenv('MISTRAL_API_KEY')}"},
     )
     try:
         model_output = response.json()["choices"][0]["message"]["content"]
@@ -0,0 +1,230 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+import os
+import re
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+import zlib
+
+import click
+
+from ..storages import initialize_storage
+from ..utils.log import get_logger
+from ..utils.telemetry import record_items, tracked
+
+# numpy is imported when an LSH index is created, so that importing
+# the pipeline doesn't load it
+if TYPE_CHECKING:
+    import numpy as np
+
+
+log = get_logger(__name__)
+
+DEFAULT_THRESHOLD = 0.9
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+SEED = 1
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+WORD = re.compile(r"\w+")
+
+
+class MinHashLSH:
+    """
+    Near-duplicate index of texts: MinHash signatures over word shingles
+    bucketed by LSH bands. Band count and size are chosen so that texts
+    with Jaccard similarity around the threshold become candidates,
+    candidates are then checked against the threshold by the share of
+    equal signature values.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        num_perm: int = NUM_PERM,
+        shingle_size: int = SHINGLE_SIZE,
+    ) -> None:
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        import numpy as np
+
+        self.prime = np.uint64(MERSENNE_PRIME)
+        self.max_hash = np.uint64(MAX_HASH)
+        generator = np.random.RandomState(SEED)
+        self.a = generator.randint(
+            1, self.prime, size=num_perm, dtype=np.uint64
+        )
+        self.b = generator.randint(
+            0, self.prime, size=num_perm, dtype=np.uint64
+        )
+        self.buckets: List[Dict[bytes, List[str]]] = [
+            defaultdict(list) for _ in range(self.bands)
+        ]
+        self.signatures: Dict[str, "np.ndarray"] = {}
+
+    def signature(self, text: str) -> Optional["np.ndarray"]:
+        import numpy as np
+
+        words = WORD.findall(text.lower())
+        if not words:
+            return None
+        size = min(self.shingle_size, len(words))
+        hashes = np.fromiter(
+            (
+                zlib.crc32(" ".join(words[i : i + size]).encode())
+                for i in range(len(words) - size + 1)
+            ),
+            dtype=np.uint64,
+        )
+        # Universal hashing a * x + b, uint64 overflow is part of the hash
+        permuted = (np.outer(hashes, self.a) + self.b) % self.prime
+        return (permuted & self.max_hash).min(axis=0).astype(np.uint32)
+
+    def find_duplicate(self, signature: "np.ndarray") -> Optional[str]:
+        """
+        Id of an indexed text similar to signature above the threshold.
+        """
+        checked = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            for candidate in self.buckets[band].get(key, []):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                similarity = (self.signatures[candidate] == signature).mean()
+                if similarity >= self.threshold:
+                    return candidate
+        return None
+
+    def insert(self, key: str, signature: "np.ndarray") -> None:
+        self.signatures[key] = signature
+        for band, band_key in enumerate(self._band_keys(signature)):
+            self.buckets[band][band_key].append(key)
+        return None
+
+    def _band_keys(self, signature: "np.ndarray") -> Iterable[bytes]:
+        for band in range(self.bands):
+            yield signature[band * self.rows : (band + 1) * self.rows].tobytes()
+
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Bands and rows per band (bands * rows == num_perm) whose S-curve
+    threshold (1 / bands) ** (1 / rows) is closest to threshold.
+    """
+    options = [
+        (num_perm // rows, rows)
+        for rows in range(1, num_perm + 1)
+        if num_perm % rows == 0
+    ]
+    return min(
+        options,
+        key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold),
+    )
+
+
+@tracked
+def dedup_chunks(
+    threshold: Optional[float] = None, drop: Optional[bool] = None
+) -> None:
+    """
+    Find near-duplicate chunks across all sources before indexing.
+
+    A chunk whose estimated Jaccard similarity of word shingles with an
+    already kept chunk is at least threshold is a duplicate. Chunks are
+    visited in chunk id order, so the same chunk is kept on every run.
+    Duplicates are marked with metadata.duplicate_of and skipped by
+    index_chunks, or deleted with drop. Split fingerprints of documents
+    with dropped chunks are reset, so split_documents restores the
+    chunks once their originals change. Defaults are taken from
+    DedupThreshold (0.9) and DedupDrop env variables.
+
+    Dedup ratio of every source is saved as a "dedup" metric.
+    """
+    if threshold is None:
+        threshold = float(os.getenv("DedupThreshold", DEFAULT_THRESHOLD))
+    if drop is None:
+        drop = os.getenv("DedupDrop", "false").lower() == "true"
+    chunk_storage = initialize_storage("chunk")
+    document_storage = initialize_storage("document")
+    metric_storage = initialize_storage("metric")
+    lsh = MinHashLSH(threshold)
+
+    # Signatures are small, texts are not kept after hashing
+    signatures = []
+    document_ids: Dict[str, str] = {}
+    for chunk in chunk_storage.iter_chunks(
+        projection=["page_content", "metadata"]
+    ):
+        signatures.append(
+            (
+                chunk.metadata["id"],
+                chunk.metadata["source_name"],
+                lsh.signature(chunk.page_content),
+            )
+        )
+        document_ids[chunk.metadata["id"]] = chunk.metadata.get("document_id")
+    signatures.sort(key=lambda item: item[0])
+
+    duplicates: Dict[str, str] = {}
+    totals: Counter = Counter()
+    duplicated: Counter = Counter()
+    for chunk_id, source_name, signature in signatures:
+        totals[source_name] += 1
+        if signature is None:
+            continue
+        original_id = lsh.find_duplicate(signature)
+        if original_id is None:
+            lsh.insert(chunk_id, signature)
+            continue
+        duplicates[chunk_id] = original_id
+        duplicated[source_name] += 1
+
+    if drop:
+        # Fingerprints go first, so an interrupted drop is re-split
+        document_storage.reset_split_fingerprints(
+            {
+                document_ids[chunk_id]
+                for chunk_id in duplicates
+                if document_ids[chunk_id] is not None
+            }
+        )
+        chunk_storage.delete_chunks(duplicates)
+    else:
+        chunk_storage.set_duplicates(duplicates)
+    record_items(
+        items_in=len(signatures), items_out=len(signatures) - len(duplicates)
+    )
+    metric_storage.replace_metrics(
+        "dedup",
+        (
+            {
+                "source_name": source_name,
+                "metric_type": "dedup",
+                "timestamp": datetime.now(),
+                "threshold": threshold,
+                "chunks": total,
+                "duplicates": duplicated[source_name],
+                "dedup_ratio": round(duplicated[source_name] / total, 3),
+            }
+            for source_name, total in totals.items()
+        ),
+    )
+    log.info(
+        f"{'Dropped' if drop else 'Marked'} {len(duplicates)} near-duplicate "
+        f"chunks of {len(signatures)} (Jaccard >= {threshold}, "
+        f"{lsh.bands} bands x {lsh.rows} rows)"
+    )
+    return None
+
+
+@click.command()
+@click.option("--threshold", type=float, default=None, help="Jaccard threshold")
+@click.option("--drop/--mark", default=None, help="Delete or mark duplicates")
+def main(threshold: Optional[float], drop: Optional[bool]) -> None:
+    dedup_chunks(threshold, drop)
+
+
+if __name__ == "__main__":
+    main()
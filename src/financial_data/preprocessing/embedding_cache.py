@@ -0,0 +1,190 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+import numpy as np
+
+from ..utils.hashing import config_fingerprint, content_digest
+from ..utils.log import get_logger
+
+
+log = get_logger(__name__)
+
+CACHE_DIR = Path("./data/embedding_cache")
+DEFAULT_MAX_ENTRIES = 200_000
+EVICTION_FRACTION = 0.1
+INITIAL_CAPACITY = 1024
+
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed cache of embedding vectors.
+
+    Every (model name, normalization flag) pair gets its own directory
+    with a memory-mapped float32 matrix of vectors and a small json
+    index from text hash to matrix row. When max_entries is reached,
+    the least recently used rows are evicted and reused once the index
+    without them is saved.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        normalize: bool,
+        cache_dir: Path = CACHE_DIR,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        namespace = config_fingerprint(model_name, normalize)[:16]
+        self.cache_dir = Path(cache_dir) / namespace
+        self.max_entries = max_entries
+        self.index_path = self.cache_dir / "index.json"
+        self.vectors_path = self.cache_dir / "vectors.f32"
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        meta = self._load_index()
+        self.dim: Optional[int] = meta.get("dim")
+        self.capacity: int = meta.get("capacity", 0)
+        self.tick: int = meta.get("tick", 0)
+        # text hash -> [row, last used tick]
+        self.entries: Dict[str, List[int]] = meta.get("entries", {})
+        self.free_rows: List[int] = sorted(
+            set(range(self.capacity))
+            - {row for row, _ in self.entries.values()},
+            reverse=True,
+        )
+        self.vectors: Optional[np.memmap] = None
+        if self.dim is not None and self.capacity:
+            self.vectors = np.memmap(
+                self.vectors_path,
+                dtype=np.float32,
+                mode="r+",
+                shape=(self.capacity, self.dim),
+            )
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        self.tick += 1
+        vectors = []
+        for text in texts:
+            entry = self.entries.get(content_digest(text))
+            if entry is None:
+                self.misses += 1
+                vectors.append(None)
+                continue
+            self.hits += 1
+            entry[1] = self.tick
+            vectors.append(self.vectors[entry[0]].tolist())
+        return vectors
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]) -> None:
+        if not texts:
+            return None
+        self.tick += 1
+        if self.dim is None:
+            self.dim = len(vectors[0])
+        for text, vector in zip(texts, vectors):
+            key = content_digest(text)
+            entry = self.entries.get(key)
+            row = entry[0] if entry is not None else self._allocate_row()
+            self.vectors[row] = np.asarray(vector, dtype=np.float32)
+            self.entries[key] = [row, self.tick]
+        return None
+
+    def save(self) -> None:
+        """
+        Flush vectors and atomically replace the key index.
+        """
+        if self.vectors is not None:
+            self.vectors.flush()
+        tmp_path = self.index_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "dim": self.dim,
+                    "capacity": self.capacity,
+                    "tick": self.tick,
+                    "entries": self.entries,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.index_path)
+        return None
+
+    def _load_index(self) -> Dict:
+        if not self.index_path.exists():
+            return {}
+        with open(self.index_path, "r") as f:
+            return json.load(f)
+
+    def _allocate_row(self) -> int:
+        if not self.free_rows:
+            if self.capacity < self.max_entries:
+                capacity = max(INITIAL_CAPACITY, 2 * self.capacity)
+                self._grow(min(self.max_entries, capacity))
+            else:
+                self._evict()
+        return self.free_rows.pop()
+
+    def _grow(self, capacity: int) -> None:
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * np.dtype(np.float32).itemsize)
+        self.vectors = np.memmap(
+            self.vectors_path,
+            dtype=np.float32,
+            mode="r+",
+            shape=(capacity, self.dim),
+        )
+        self.free_rows.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+        return None
+
+    def _evict(self) -> None:
+        evict_count = max(1, int(self.capacity * EVICTION_FRACTION))
+        oldest = sorted(self.entries.items(), key=lambda item: item[1][1])
+        evicted_rows = []
+        for key, (row, _) in oldest[:evict_count]:
+            del self.entries[key]
+            evicted_rows.append(row)
+        # The saved index must not map evicted keys to rows which are
+        # about to get other vectors, so it is written before the reuse
+        self.save()
+        self.free_rows.extend(evicted_rows)
+        log.info(f"Evicted {evict_count} embeddings from cache")
+        return None
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper which computes vectors only for texts
+    missing from the cache.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache) -> None:
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_documents(
+                [texts[i] for i in missing]
+            )
+            self.cache.put_many([texts[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
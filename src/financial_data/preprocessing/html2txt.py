@@ -3,8 +3,11 @@ from pathlib import Path
 import html2text
 
 from ..storages import initialize_storage, DocumentStorage
+from ..utils.hashing import content_digest
+from ..utils.telemetry import record_items, tracked
 
 
+@tracked
 def html2txt() -> None:
     """
     Convert html files to txt with md format
@@ -17,6 +20,7 @@ def html2txt() -> None:
     h.ignore_images = True
 
     for data_dir in html_data_dirs.iterdir():
+        digests = set()
         for file in data_dir.iterdir():
             if not (file.suffix == ".html" or file.suffix == ".txt"):
                 continue
@@ -25,6 +29,11 @@ def html2txt() -> None:
             transformed = h.handle(content)
             source_name = data_dir.name
             save_to_storage(document_storage, source_name, transformed)
+            digests.add(content_digest(transformed))
+            record_items(items_in=1, items_out=1)
+        if digests:
+            # Lessons changed or removed since the previous run
+            document_storage.delete_raw_documents(data_dir.name, digests)
 
 
 def save_to_storage(
@@ -1,35 +1,180 @@
 import os
 from pathlib import Path
+import shutil
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
 
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.vectorstores.faiss import DistanceStrategy
+from langchain_core.documents import Document
 
-from ..storages import initialize_storage
+from ..storages import ChunkStorage, initialize_storage
+from ..utils.batch import batched
+from ..utils.log import get_logger
+from ..utils.telemetry import record_items, tracked
 
+# FAISS, the embedding model (torch) and the embedding cache (numpy)
+# are imported when indexing starts
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import Embeddings
+
+
+log = get_logger(__name__)
 
 MODEL_PATH = "intfloat/multilingual-e5-small"
+NORMALIZE_EMBEDDINGS = True
+INDEX_BATCH_SIZE = 1000
+INDEX_DIR = Path("./data/index")
 
 
-def index_chunks() -> None:
+@tracked
+def index_chunks(rebuild: bool = False) -> None:
     """
-    Indexing chunks in directory and save it to FAISS database
+    Indexing chunks in directory and save it to FAISS database.
+
+    If an index is already saved, it is updated: only chunks that are
+    missing from the index are embedded and chunks removed from storage
+    are deleted from it. Set rebuild to build the index from scratch.
+    Vectors come from the on-disk embedding cache, only cache misses
+    are embedded by the model.
     """
-    output_dir = Path("./data/index")
-    os.makedirs(output_dir, exist_ok=True)
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.faiss import DistanceStrategy
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    from .embedding_cache import CachedEmbeddings, EmbeddingCache
 
-    embeddings = HuggingFaceEmbeddings(
-        model_name=MODEL_PATH,
-        multi_process=True,
-        encode_kwargs={"normalize_embeddings": True},
+    restore_index(INDEX_DIR)
+    os.makedirs(INDEX_DIR, exist_ok=True)
+
+    embedding_cache = EmbeddingCache(MODEL_PATH, NORMALIZE_EMBEDDINGS)
+    embeddings = CachedEmbeddings(
+        HuggingFaceEmbeddings(
+            model_name=MODEL_PATH,
+            multi_process=True,
+            encode_kwargs={"normalize_embeddings": NORMALIZE_EMBEDDINGS},
+        ),
+        embedding_cache,
     )
 
     chunk_storage = initialize_storage("chunk")
-    chunks = chunk_storage.get_chunks()
-    faiss_cosine = FAISS.from_documents(
-        chunks, embeddings, distance_strategy=DistanceStrategy.COSINE
+    faiss_cosine = None
+    if not rebuild and (INDEX_DIR / "index.faiss").exists():
+        faiss_cosine = FAISS.load_local(
+            str(INDEX_DIR),
+            embeddings,
+            allow_dangerous_deserialization=True,
+            distance_strategy=DistanceStrategy.COSINE,
+        )
+    faiss_cosine, changed = update_index(
+        faiss_cosine, chunk_storage, embeddings
+    )
+    embedding_cache.save()
+    log.info(
+        f"Embedding cache: {embedding_cache.hits} hits, "
+        f"{embedding_cache.misses} misses, "
+        f"hit rate {embedding_cache.hit_rate:.1%}"
+    )
+    if faiss_cosine is None or not changed:
+        return None
+    save_index(faiss_cosine, INDEX_DIR)
+    return None
+
+
+@tracked
+def update_index(
+    faiss_cosine: Optional["FAISS"],
+    chunk_storage: ChunkStorage,
+    embeddings: "Embeddings",
+) -> Tuple[Optional["FAISS"], bool]:
+    """
+    Bring index in line with chunk storage: delete ids which are
+    not stored anymore or marked as near-duplicates and embed only
+    new chunks.
+    Returns the index and whether it was changed.
+    """
+    indexed_ids = (
+        set(faiss_cosine.index_to_docstore_id.values())
+        if faiss_cosine is not None
+        else set()
+    )
+    stored_ids = set(chunk_storage.iter_chunk_ids(skip_duplicates=True))
+    removed_ids = indexed_ids - stored_ids
+    new_ids = stored_ids - indexed_ids
+    if removed_ids:
+        faiss_cosine.delete(list(removed_ids))
+    record_items(items_in=len(stored_ids), items_out=len(new_ids))
+    log.info(
+        f"Index update: {len(new_ids)} new chunks, "
+        f"{len(removed_ids)} removed chunks, "
+        f"{len(indexed_ids) - len(removed_ids)} kept"
+    )
+
+    new_chunks = (
+        chunk
+        for chunk in chunk_storage.iter_chunks(batch_size=INDEX_BATCH_SIZE)
+        if chunk.metadata["id"] in new_ids
     )
-    faiss_cosine.save_local(str(output_dir))
+    for batch in batched(new_chunks, INDEX_BATCH_SIZE):
+        faiss_cosine = add_chunks(faiss_cosine, batch, embeddings)
+    return faiss_cosine, bool(new_ids or removed_ids)
+
+
+def add_chunks(
+    faiss_cosine: Optional["FAISS"],
+    chunks: List[Document],
+    embeddings: "Embeddings",
+) -> "FAISS":
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.faiss import DistanceStrategy
+
+    # Index ids are chunk ids, so the next update can diff against storage
+    ids = [chunk.metadata["id"] for chunk in chunks]
+    if faiss_cosine is None:
+        return FAISS.from_documents(
+            chunks,
+            embeddings,
+            ids=ids,
+            distance_strategy=DistanceStrategy.COSINE,
+        )
+    faiss_cosine.add_documents(chunks, ids=ids)
+    return faiss_cosine
+
+
+@tracked
+def save_index(faiss_cosine: "FAISS", output_dir: Path) -> None:
+    """
+    Save index next to output_dir and swap directories, so readers never
+    see a half-written index.
+    """
+    tmp_dir = output_dir.with_name(output_dir.name + ".tmp")
+    old_dir = output_dir.with_name(output_dir.name + ".old")
+    restore_index(output_dir)
+    _remove_dirs([tmp_dir, old_dir])
+    faiss_cosine.save_local(str(tmp_dir))
+    if output_dir.exists():
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    _remove_dirs([old_dir])
+    return None
+
+
+def restore_index(output_dir: Path) -> None:
+    """
+    Move the previous index back if the process stopped between the
+    two renames of save_index and output_dir has no index.
+    """
+    old_dir = output_dir.with_name(output_dir.name + ".old")
+    if (output_dir / "index.faiss").exists() or not old_dir.exists():
+        return None
+    log.warning(f"Index swap was interrupted, restoring {old_dir}")
+    _remove_dirs([output_dir])
+    os.replace(old_dir, output_dir)
+    return None
+
+
+def _remove_dirs(dirs: Iterable[Path]) -> None:
+    for directory in dirs:
+        if directory.exists():
+            shutil.rmtree(directory)
     return None
 
 
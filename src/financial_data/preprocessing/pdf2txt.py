@@ -1,30 +1,99 @@
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+import os
 from pathlib import Path
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-import pymupdf4llm
+import click
 
 from ..storages import DocumentStorage, initialize_storage
+from ..utils.hashing import content_digest
 from ..utils.log import get_logger
+from ..utils.telemetry import record_items, tracked
 
 
 log = get_logger(__name__)
 
+PDF_DIR = Path("./data/pdf_textbooks")
+DEFAULT_SHARD_SIZE = 50
 
-def pdf2txt() -> None:
+
+@tracked
+def pdf2txt(
+    workers: Optional[int] = None, shard_size: Optional[int] = None
+) -> None:
     """
-    Convert PDF files to text files.
+    Convert PDF files to text files. pymupdf and pymupdf4llm are
+    imported by the conversion functions, so that importing the module
+    stays cheap.
+
+    With more than one worker, textbooks are converted in a process
+    pool and every textbook is split into shard_size page ranges which
+    are converted in parallel and joined in page order. Defaults are
+    taken from PdfWorkers (CPU count) and PdfShardSize env variables.
+
+    A textbook which fails to convert doesn't stop the others,
+    RuntimeError is raised after all textbooks are done.
     """
-    pdf_dir: Path = Path("./data/pdf_textbooks")
+    workers = workers or int(os.getenv("PdfWorkers", os.cpu_count() or 1))
+    shard_size = shard_size or int(
+        os.getenv("PdfShardSize", DEFAULT_SHARD_SIZE)
+    )
     document_storage = initialize_storage("document")
+    pdf_files = get_pdf_files(PDF_DIR)
+    record_items(items_in=len(pdf_files))
+
+    failed: List[Path] = []
+    if workers <= 1:
+        for source_name, pdf_file in pdf_files:
+            start = time.perf_counter()
+            try:
+                md_data = convert_pdf_to_txt(pdf_file)
+                page_count = get_page_count(pdf_file)
+            except Exception as e:
+                log.error(f"Can't convert {pdf_file}: {e}")
+                failed.append(pdf_file)
+                continue
+            log_conversion_speed(
+                pdf_file, page_count, time.perf_counter() - start
+            )
+            save_to_storage(document_storage, source_name, md_data)
+            record_items(items_out=1)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            converted = convert_pdfs_in_pool(
+                pool, pdf_files, shard_size, failed
+            )
+            for source_name, md_data in converted:
+                save_to_storage(document_storage, source_name, md_data)
+                record_items(items_out=1)
+    if failed:
+        raise RuntimeError(
+            f"Failed to convert {len(failed)} of {len(pdf_files)} "
+            f"textbooks: {', '.join(str(pdf_file) for pdf_file in failed)}"
+        )
+    return None
 
+
+def get_pdf_files(pdf_dir: Path) -> List[Tuple[str, Path]]:
+    """
+    Pairs of (source name, pdf file) for every textbook directory.
+    """
+    pdf_files = []
     for textbook_dir in pdf_dir.iterdir():
         if not textbook_dir.is_dir():
             continue
         pdf_file = get_pdf_file(textbook_dir)
         if pdf_file is None:
             continue
-        md_data = convert_pdf_to_txt(pdf_file)
-        save_to_storage(document_storage, str(textbook_dir.name), md_data)
-    return None
+        pdf_files.append((str(textbook_dir.name), pdf_file))
+    return pdf_files
 
 
 def get_pdf_file(textbook_dir: Path) -> Path | None:
@@ -44,20 +113,175 @@ def convert_pdf_to_txt(pdf_file_path: Path) -> str:
     """
     Convert PDF file to text file in markdown format via pymupdf4llm.
     """
+    import pymupdf4llm
+
     log.info(f"Converting {pdf_file_path}")
     md_data = pymupdf4llm.to_markdown(pdf_file_path)
     return md_data
 
 
+@dataclass
+class TextbookConversion:
+    pdf_file: Path
+    page_count: int = 0
+    # Markdown of converted shards, in page order
+    shards: List[Optional[str]] = field(default_factory=list)
+    remaining: int = 0
+    # Wall clock time when the first shard started in a worker
+    started: float = float("inf")
+
+
+def convert_pdfs_in_pool(
+    pool: ProcessPoolExecutor,
+    pdf_files: List[Tuple[str, Path]],
+    shard_size: int,
+    failed: Optional[List[Path]] = None,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Convert all textbooks page shard by page shard in the pool.
+    Header levels are detected once per textbook, so that every
+    shard marks headers the same way as a whole-book conversion.
+
+    A textbook is yielded as soon as its last shard is converted, so
+    only markdown of textbooks in progress is kept in memory. Its speed
+    is measured from the start of its first shard. Textbooks which fail
+    to convert are logged and added to failed.
+    """
+    failed = failed if failed is not None else []
+    textbooks: Dict[str, TextbookConversion] = {}
+    # Future -> (source name, shard number), None is the layout
+    futures: Dict[Future, Tuple[str, Optional[int]]] = {}
+    for source_name, pdf_file in pdf_files:
+        log.info(f"Converting {pdf_file}")
+        textbooks[source_name] = TextbookConversion(pdf_file)
+        futures[pool.submit(read_pdf_layout, pdf_file)] = (source_name, None)
+
+    while futures:
+        finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in finished:
+            source_name, shard = futures.pop(future)
+            textbook = textbooks.get(source_name)
+            if textbook is None:
+                # Another shard of the textbook has failed
+                continue
+            try:
+                result = future.result()
+            except Exception as e:
+                action = "read" if shard is None else "convert"
+                log.error(f"Can't {action} {textbook.pdf_file}: {e}")
+                failed.append(textbook.pdf_file)
+                del textbooks[source_name]
+                for other, (name, _) in list(futures.items()):
+                    if name == source_name and other.cancel():
+                        del futures[other]
+                continue
+            if shard is None:
+                textbook.page_count, hdr_info = result
+                page_shards = get_page_shards(textbook.page_count, shard_size)
+                textbook.shards = [None] * len(page_shards)
+                textbook.remaining = len(page_shards)
+                for number, pages in enumerate(page_shards):
+                    shard_future = pool.submit(
+                        convert_pdf_shard, textbook.pdf_file, pages, hdr_info
+                    )
+                    futures[shard_future] = (source_name, number)
+            else:
+                started, md_data = result
+                textbook.started = min(textbook.started, started)
+                textbook.shards[shard] = md_data
+                textbook.remaining -= 1
+            if textbook.remaining == 0:
+                del textbooks[source_name]
+                elapsed = (
+                    time.time() - textbook.started if textbook.shards else 0.0
+                )
+                log_conversion_speed(
+                    textbook.pdf_file, textbook.page_count, elapsed
+                )
+                yield source_name, "".join(
+                    md_data or "" for md_data in textbook.shards
+                )
+
+
+def get_page_shards(page_count: int, shard_size: int) -> List[List[int]]:
+    return [
+        list(range(start, min(start + shard_size, page_count)))
+        for start in range(0, page_count, shard_size)
+    ]
+
+
+def read_pdf_layout(pdf_file_path: Path) -> Tuple[int, Any]:
+    """
+    Page count and header levels of the whole textbook.
+    """
+    import pymupdf
+    import pymupdf4llm
+
+    with pymupdf.open(pdf_file_path) as doc:
+        return doc.page_count, pymupdf4llm.IdentifyHeaders(doc)
+
+
+def convert_pdf_pages(
+    pdf_file_path: Path, pages: List[int], hdr_info: Any
+) -> str:
+    """
+    Convert page range of PDF file to markdown.
+    """
+    import pymupdf
+    import pymupdf4llm
+
+    with pymupdf.open(pdf_file_path) as doc:
+        return pymupdf4llm.to_markdown(doc, pages=pages, hdr_info=hdr_info)
+
+
+def convert_pdf_shard(
+    pdf_file_path: Path, pages: List[int], hdr_info: Any
+) -> Tuple[float, str]:
+    """
+    Time when the conversion started in the worker and markdown
+    of the page range.
+    """
+    return time.time(), convert_pdf_pages(pdf_file_path, pages, hdr_info)
+
+
+def get_page_count(pdf_file_path: Path) -> int:
+    import pymupdf
+
+    with pymupdf.open(pdf_file_path) as doc:
+        return doc.page_count
+
+
+def log_conversion_speed(
+    pdf_file_path: Path, page_count: int, elapsed: float
+) -> None:
+    pages_per_second = page_count / elapsed if elapsed > 0 else 0.0
+    log.info(
+        f"Converted {pdf_file_path}: {page_count} pages in {elapsed:.1f}s "
+        f"({pages_per_second:.2f} pages/s)"
+    )
+    return None
+
+
 def save_to_storage(
     document_storage: DocumentStorage, source_name: str, document: str
 ) -> None:
     """
-    Save txt data to document storage
+    Save txt data to document storage, the previous version of the
+    textbook is deleted
     """
     document_storage.set_raw_document(source_name, document)
+    document_storage.delete_raw_documents(
+        source_name, [content_digest(document)]
+    )
     return None
 
 
+@click.command()
+@click.option("--workers", type=int, default=None, help="Process pool size")
+@click.option("--shard-size", type=int, default=None, help="Pages per shard")
+def main(workers: Optional[int], shard_size: Optional[int]) -> None:
+    pdf2txt(workers, shard_size)
+
+
 if __name__ == "__main__":
-    pdf2txt()
+    main()
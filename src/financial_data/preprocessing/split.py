@@ -1,15 +1,21 @@
-from typing import Any, Dict, List
-import uuid
+from bisect import bisect_left, bisect_right
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
 
 from langchain_core.documents import Document
-from langchain_text_splitters import (
-    MarkdownHeaderTextSplitter,
-    RecursiveCharacterTextSplitter,
-)
 
 from ..storages import ChunkStorage, initialize_storage
+from ..utils.hashing import config_fingerprint, content_digest, make_chunk_id
+from ..utils.log import get_logger
+from ..utils.telemetry import record_items, tracked
+
 
+log = get_logger(__name__)
 
+TOKENIZER_PATH = "intfloat/multilingual-e5-small"
+# e5 takes 512 tokens including [CLS], [SEP] and the "passage: " prefix
+CHUNK_TOKENS = 480
+OVERLAP_TOKENS = 72
 SPLIT_CONFIG = {
     "headers_to_split_on": [
         ["#", "H1"],
@@ -23,70 +29,317 @@ SPLIT_CONFIG = {
     ]
 }
 
+# Header and code fence lines, the only lines the splitter looks at
+MARKDOWN_MARKER = re.compile(
+    r"^[^\S\n]*(```|~~~|#{1,8}(?=[^\S\n]|$))[^\n]*$", re.MULTILINE
+)
+# A chunk may end after a sentence or a line
+SENTENCE_END = re.compile(r"[.!?…]+[\"'»)\]]*(?=\s)|\n")
+
+
+class MarkdownTokenSplitter:
+    """
+    Markdown splitter with a token budget.
+
+    The text is walked once: only header and code fence lines are
+    visited, text between headers is a section with the header path
+    as metadata (H1-H8, like MarkdownHeaderTextSplitter). Sections
+    of a document are tokenized in one batch, chunks are cut on
+    sentence or line ends so that they fit chunk_tokens tokens of the
+    tokenizer, a sentence longer than that is cut between tokens.
+    The next chunk starts at the first sentence within overlap_tokens
+    before the cut, or overlap_tokens before the cut of a sentence.
+    Chunks are slices of the section found by token offsets, so the
+    text is copied only once per chunk.
+    """
 
-class ChunkSplitter:
     def __init__(
         self,
-        chunk_size: int,
+        tokenizer: Any,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = OVERLAP_TOKENS,
+        headers_to_split_on: List[List[str]] = SPLIT_CONFIG[
+            "headers_to_split_on"
+        ],
     ) -> None:
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            separators=["."],
-            chunk_size=chunk_size,
-            chunk_overlap=int(0.15 * chunk_size),
+        if not getattr(tokenizer, "is_fast", False):
+            raise ValueError("Token offsets need a fast tokenizer")
+        if not 0 <= overlap_tokens < chunk_tokens:
+            raise ValueError("overlap_tokens must be less than chunk_tokens")
+        self.tokenizer = tokenizer
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.header_names = {
+            len(separator): name for separator, name in headers_to_split_on
+        }
+
+    @classmethod
+    def from_pretrained(
+        cls, model_path: str = TOKENIZER_PATH, **kwargs: Any
+    ) -> "MarkdownTokenSplitter":
+        from transformers import AutoTokenizer
+
+        return cls(AutoTokenizer.from_pretrained(model_path), **kwargs)
+
+    def split(self, text: str) -> List[Document]:
+        sections = list(self.iter_sections(text))
+        encodings = self.tokenizer.backend_tokenizer.encode_batch(
+            [section for section, _ in sections], add_special_tokens=False
         )
+        chunks = []
+        for (section, metadata), encoding in zip(sections, encodings):
+            for start, end in self.iter_chunk_spans(section, encoding.offsets):
+                chunks.append(
+                    Document(
+                        page_content=section[start:end].strip(),
+                        metadata=dict(metadata),
+                    )
+                )
+        return chunks
 
-    def split(
-        self, text_data: str, splitter_config: Dict[str, Any]
-    ) -> List[Document]:
-        md_splitter = self._get_md_splitter(splitter_config)
-        documents = md_splitter.split_text(text_data)
-        documents = self.text_splitter.split_documents(documents)
-        return documents
+    def iter_sections(self, text: str) -> Iterator[Tuple[str, Dict[str, str]]]:
+        """
+        Non-empty texts between headers with their header path.
+        Header lines are not part of sections, lines inside code blocks
+        are never headers.
+        """
+        headers: Dict[int, str] = {}
+        section_start = 0
+        fence = None
+        for marker in MARKDOWN_MARKER.finditer(text):
+            line = marker.group(0).strip()
+            symbol = marker.group(1)
+            if fence is not None:
+                if line.startswith(fence):
+                    fence = None
+                continue
+            if symbol == "~~~" or (symbol == "```" and line.count("```") == 1):
+                fence = symbol
+                continue
+            level = len(symbol)
+            if symbol[0] != "#" or level not in self.header_names:
+                continue
+            section = text[section_start : marker.start()].strip()
+            if section:
+                yield section, self._header_path(headers)
+            headers = {
+                header_level: header
+                for header_level, header in headers.items()
+                if header_level < level
+            }
+            headers[level] = line[level:].strip()
+            section_start = marker.end()
+        section = text[section_start:].strip()
+        if section:
+            yield section, self._header_path(headers)
 
-    def _get_md_splitter(
-        self, splitter_config: Dict[str, Any]
-    ) -> MarkdownHeaderTextSplitter:
-        return MarkdownHeaderTextSplitter(**splitter_config)
+    def iter_chunk_spans(
+        self, text: str, offsets: List[Tuple[int, int]]
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        (start, end) character spans of chunks of text with the given
+        token offsets.
+        """
+        if not offsets:
+            yield 0, len(text)
+            return None
+        starts = [start for start, _ in offsets]
+        tokens = len(offsets)
+        # Token indexes at which a new sentence starts
+        boundaries = sorted(
+            {
+                bisect_left(starts, end.end())
+                for end in SENTENCE_END.finditer(text)
+            }
+            | {tokens}
+        )
+        start = 0
+        while start < tokens:
+            limit = start + self.chunk_tokens
+            cut_sentence = False
+            if limit >= tokens:
+                end = tokens
+            else:
+                index = bisect_right(boundaries, limit) - 1
+                if index >= 0 and boundaries[index] > start:
+                    end = boundaries[index]
+                else:
+                    end = limit
+                    cut_sentence = True
+            yield starts[start], offsets[end - 1][1]
+            if end == tokens:
+                break
+            index = bisect_left(boundaries, end - self.overlap_tokens)
+            if start < boundaries[index] < end:
+                start = boundaries[index]
+            elif cut_sentence:
+                # The rest of a cut sentence keeps its last tokens
+                start = max(end - self.overlap_tokens, start + 1)
+            else:
+                start = end
+        return None
+
+    def _header_path(self, headers: Dict[int, str]) -> Dict[str, str]:
+        return {
+            self.header_names[level]: headers[level]
+            for level in sorted(headers)
+        }
 
 
+@tracked
 def split_documents() -> None:
     """
     Split documents from /data/to_split directory to chunks
     and store it in /data/chunks
+
+    Only documents whose content or split config changed since the
+    previous run are re-split; their chunks that no longer exist
+    are deleted. Split fingerprints are recorded only after all chunks
+    are written. Processed documents whose raw document was superseded
+    by a new version are deleted with their chunks.
     """
     document_storage = initialize_storage("document")
     chunk_storage = initialize_storage("chunk")
-    processed_documents = document_storage.get_processed_documents()
-    chunks_meta: Dict[str, List[Document]] = get_chunks_with_metadata(
-        processed_documents
+    legacy_chunks = chunk_storage.delete_legacy_chunks()
+    if legacy_chunks:
+        log.info(f"Deleted {legacy_chunks} chunks without document id")
+
+    raw_ids = {
+        str(document["_id"])
+        for document in document_storage.iter_raw_documents(projection=["_id"])
+    }
+    superseded: List[str] = []
+    processed_documents = iter_current_documents(
+        document_storage.iter_processed_documents(), raw_ids, superseded
+    )
+    split_results: Dict[str, Tuple[str, List[str]]] = {}
+    chunks = iter_changed_chunks(processed_documents, split_results)
+    save_to_storage(chunk_storage, chunks)
+
+    stale_chunks = 0
+    for document_id, (fingerprint, chunk_ids) in split_results.items():
+        stale_chunks += chunk_storage.delete_stale_chunks(
+            document_id, chunk_ids
+        )
+        document_storage.set_split_fingerprint(document_id, fingerprint)
+    # Chunks go first, so an interrupted cleanup is repeated next run
+    for document_id in superseded:
+        stale_chunks += chunk_storage.delete_stale_chunks(document_id, [])
+    document_storage.delete_processed_documents(superseded)
+    record_items(
+        items_in=len(split_results),
+        items_out=sum(
+            len(chunk_ids) for _, chunk_ids in split_results.values()
+        ),
+    )
+    log.info(
+        f"Re-split {len(split_results)} documents, "
+        f"deleted {len(superseded)} superseded documents "
+        f"and {stale_chunks} stale chunks"
     )
-    for _, chunk_docs in chunks_meta.items():
-        save_to_storage(chunk_storage, chunk_docs)
     return None
 
 
+def iter_current_documents(
+    processed_documents: Iterable[Dict[str, Any]],
+    raw_ids: Set[str],
+    superseded: List[str],
+) -> Iterator[Dict[str, Any]]:
+    """
+    Processed documents whose raw document still exists, ids of the
+    others are added to superseded.
+    """
+    for document in processed_documents:
+        if str(document["_id"]) in raw_ids:
+            yield document
+        else:
+            superseded.append(str(document["_id"]))
+
+
+def get_split_fingerprint(
+    document: Dict[str, Any], chunk_tokens: int = CHUNK_TOKENS
+) -> str:
+    return config_fingerprint(
+        content_digest(document["content"]),
+        SPLIT_CONFIG,
+        TOKENIZER_PATH,
+        chunk_tokens,
+        OVERLAP_TOKENS,
+    )
+
+
+def iter_changed_chunks(
+    processed_documents: Iterable[Dict[str, Any]],
+    split_results: Dict[str, Tuple[str, List[str]]],
+    chunk_tokens: int = CHUNK_TOKENS,
+) -> Iterator[Document]:
+    """
+    Split only documents whose split fingerprint changed. For every
+    split document split_results gets its new fingerprint and chunk ids.
+    The tokenizer is loaded only if some document has to be split.
+    """
+    splitter = None
+    for document in processed_documents:
+        fingerprint = get_split_fingerprint(document, chunk_tokens)
+        if document.get("split_fingerprint") == fingerprint:
+            continue
+        if splitter is None:
+            splitter = MarkdownTokenSplitter.from_pretrained(
+                chunk_tokens=chunk_tokens
+            )
+        chunk_ids = []
+        for chunk in split_document(splitter, document):
+            chunk_ids.append(chunk.metadata["id"])
+            yield chunk
+        split_results[str(document["_id"])] = (fingerprint, chunk_ids)
+
+
 def get_chunks_with_metadata(
-    processed_documents: List[str],
-    chunk_size: int = 2500,
+    processed_documents: Iterable[Dict[str, Any]],
+    chunk_tokens: int = CHUNK_TOKENS,
 ) -> Dict[str, List[Document]]:
-    splitter = ChunkSplitter(chunk_size)
     chunks_meta = {}
-    for document in processed_documents:
-        if document["source_name"] not in chunks_meta:
-            chunks_meta[document["source_name"]] = []
-        chunks = splitter.split(document["content"], SPLIT_CONFIG)
-        for chunk in chunks:
-            chunk.metadata["source_name"] = document["source_name"]
-            chunk.metadata["id"] = str(uuid.uuid4())
-        chunks_meta[document["source_name"]].extend(chunks)
+    for chunk in iter_chunks_with_metadata(processed_documents, chunk_tokens):
+        source_name = chunk.metadata["source_name"]
+        chunks_meta.setdefault(source_name, []).append(chunk)
     return chunks_meta
 
 
+def iter_chunks_with_metadata(
+    processed_documents: Iterable[Dict[str, Any]],
+    chunk_tokens: int = CHUNK_TOKENS,
+) -> Iterator[Document]:
+    """
+    Split documents one by one as they arrive from storage,
+    so only the chunks of the current document are held in memory.
+    """
+    splitter = MarkdownTokenSplitter.from_pretrained(chunk_tokens=chunk_tokens)
+    for document in processed_documents:
+        yield from split_document(splitter, document)
+
+
+def split_document(
+    splitter: MarkdownTokenSplitter, document: Dict[str, Any]
+) -> List[Document]:
+    """
+    Split document and bind chunks to it. Chunk ids are derived
+    from document id, chunk position and text.
+    """
+    document_id = str(document["_id"])
+    chunks = splitter.split(document["content"])
+    for position, chunk in enumerate(chunks):
+        chunk.metadata["source_name"] = document["source_name"]
+        chunk.metadata["document_id"] = document_id
+        chunk.metadata["id"] = make_chunk_id(
+            document_id, position, chunk.page_content
+        )
+    return chunks
+
+
 def save_to_storage(
-    chunk_storage: ChunkStorage, chunks: List[Document]
+    chunk_storage: ChunkStorage, chunks: Iterable[Document]
 ) -> None:
-    for chunk in chunks:
-        chunk_storage.set_chunk(chunk.metadata["id"], chunk)
+    chunk_storage.set_chunks(chunks)
     return None
 
 
@@ -1,46 +1,114 @@
-import json
+import os
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
 import uuid
 
 from langchain_core.documents import Document
-from langchain_text_splitters import (
-    RecursiveCharacterTextSplitter,
-)
 
 from ..storages import (
     ChunkStorage,
     initialize_storage,
 )
+from ..utils.batch import batched
+from ..utils.hashing import make_chunk_id
+from ..utils.jsonl import iter_json_array
+from ..utils.log import get_logger
+from ..utils.telemetry import record_items, tracked
+
+
+log = get_logger(__name__)
 
+DATA_DIR = Path("./data/3d_party")
+DEFAULT_CODEXES = ["Уголовный кодекс (УК РФ)"]
+DEFAULT_ARTICLE_BATCH_SIZE = 500
 
-def process_3d_party_data() -> None:
-    data_dir: Path = Path("./data/3d_party")
+
+@tracked
+def process_3d_party_data(
+    codexes: Optional[Iterable[str]] = None,
+    batch_size: int = DEFAULT_ARTICLE_BATCH_SIZE,
+) -> None:
+    """
+    Split articles of the relevant codexes from JSON dumps in
+    ./data/3d_party and save them as chunks of the dump file.
+
+    Dumps are read as a stream: articles are filtered by name_codex
+    while parsing and are split and written batch_size articles at a
+    time, so memory depends on the batch size, not on the dump size.
+    Codexes are taken from RelevantCodexes env variable (names joined
+    with ";"), the Criminal Code by default.
+    """
+    codexes = set(codexes or get_codexes())
     chunk_storage = initialize_storage("chunk")
 
-    for file in data_dir.iterdir():
+    for file in sorted(DATA_DIR.iterdir()):
         if file.is_file() and file.suffix == ".json":
-            with open(file, "r") as f:
-                data = json.load(f)
-            actual_laws = get_relevant_laws(data)
-            documents = transform_to_documents(actual_laws)
-            for document in documents:
+            process_file(file, codexes, chunk_storage, batch_size)
+    return None
+
+
+def process_file(
+    file: Path,
+    codexes: Iterable[str],
+    chunk_storage: ChunkStorage,
+    batch_size: int = DEFAULT_ARTICLE_BATCH_SIZE,
+) -> None:
+    articles = 0
+    chunks = 0
+    # Every chunk of the file is rewritten with a new generation, chunks
+    # of the previous ones are stale
+    generation = uuid.uuid4().hex
+
+    def iter_articles(f: TextIO) -> Iterator[Dict[str, str]]:
+        nonlocal articles
+        for article in iter_json_array(f):
+            articles += 1
+            yield article
+
+    with open(file, "r") as f:
+        relevant_laws = get_relevant_laws(iter_articles(f), codexes)
+        for batch in batched(relevant_laws, batch_size):
+            documents = transform_to_documents(batch)
+            # Positions continue between batches, so chunk ids are
+            # the same as when the whole file is split at once
+            for position, document in enumerate(documents, chunks):
                 document.metadata["source_name"] = file.name
+                document.metadata["document_id"] = file.name
+                document.metadata["generation"] = generation
+                document.metadata["id"] = make_chunk_id(
+                    file.name, position, document.page_content
+                )
+            chunks += len(documents)
             save_to_storage(chunk_storage, documents)
+    record_items(items_in=articles, items_out=chunks)
+    stale_chunks = chunk_storage.delete_other_generations(file.name, generation)
+    log.info(
+        f"{file.name}: {chunks} chunks from {articles} articles, "
+        f"deleted {stale_chunks} stale chunks"
+    )
     return None
 
 
-def get_relevant_laws(data: List[Dict[str, str]]) -> List[Dict[str, str]]:
-    actual_codexes = ["Уголовный кодекс (УК РФ)"]
-    return list(
-        filter(lambda item: item["name_codex"] in actual_codexes, data)
-    )
+def get_codexes() -> List[str]:
+    codexes = os.getenv("RelevantCodexes")
+    if not codexes:
+        return DEFAULT_CODEXES
+    return [codex.strip() for codex in codexes.split(";") if codex.strip()]
+
+
+def get_relevant_laws(
+    data: Iterable[Dict[str, str]], codexes: Optional[Iterable[str]] = None
+) -> Iterator[Dict[str, str]]:
+    actual_codexes = set(DEFAULT_CODEXES if codexes is None else codexes)
+    return filter(lambda item: item["name_codex"] in actual_codexes, data)
 
 
 def transform_to_documents(
     data: List[Dict[str, str]],
     chunk_size: int = 1500,
 ) -> List[Document]:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     documents = []
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size, chunk_overlap=int(0.1 * chunk_size)
@@ -48,7 +116,6 @@ def transform_to_documents(
     for item in data:
         content = item.pop("content_article")
         item["source"] = item["name_article"]
-        item["id"] = str(uuid.uuid4())
         document = Document(content, metadata=item)
         documents.append(document)
     documents = splitter.split_documents(documents)
@@ -58,8 +125,7 @@ def transform_to_documents(
 def save_to_storage(
     chunk_storage: ChunkStorage, documents: List[Document]
 ) -> None:
-    for document in documents:
-        chunk_storage.set_chunk(document.metadata["id"], document)
+    chunk_storage.set_chunks(documents)
     return None
 
 
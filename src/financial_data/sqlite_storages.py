@@ -0,0 +1,820 @@
+"""
+Embedded SQLite implementation of the storages.py interfaces
+for single-node runs and CI, where a Mongo server is not needed.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import uuid
+
+from langchain_core.documents import Document
+
+from .utils.batch import batched
+from .utils.hashing import content_digest
+from .utils.log import get_logger
+from .utils.telemetry import record_round_trips
+
+
+log = get_logger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CURSOR_BATCH_SIZE = 100
+
+_local = threading.local()
+
+
+class CountingConnection(sqlite3.Connection):
+    """
+    Connection which counts executed statements as storage round-trips
+    of the current pipeline stage, like commands sent to Mongo.
+    """
+
+    def execute(self, *args: Any, **kwargs: Any) -> sqlite3.Cursor:
+        record_round_trips()
+        return super().execute(*args, **kwargs)
+
+    def executemany(self, *args: Any, **kwargs: Any) -> sqlite3.Cursor:
+        record_round_trips()
+        return super().executemany(*args, **kwargs)
+
+
+def get_connection(path: str) -> sqlite3.Connection:
+    """
+    Connection to the database file, one per thread and process.
+    WAL mode lets readers of one stage run alongside writers of another.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    connection = connections.get(path)
+    if connection is None:
+        connection = sqlite3.connect(
+            path, isolation_level=None, factory=CountingConnection
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=30000")
+        connections[path] = connection
+    return connection
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, default=_encode_value)
+
+
+def _loads(data: str) -> Dict[str, Any]:
+    return json.loads(data, object_hook=_decode_value)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return str(value)
+
+
+def _decode_value(value: Dict[str, Any]) -> Any:
+    if len(value) == 1 and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def _project(
+    data: Dict[str, Any], projection: Optional[List[str]]
+) -> Dict[str, Any]:
+    """
+    Keep only projected fields (dotted paths allowed) and _id,
+    like a Mongo projection does.
+    """
+    if projection is None:
+        return data
+    projected = {"_id": data["_id"]} if "_id" in data else {}
+    for field in projection:
+        source, target = data, projected
+        *parents, leaf = field.split(".")
+        for parent in parents:
+            source = source.get(parent)
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(parent, {})
+        else:
+            if leaf in source:
+                target[leaf] = source[leaf]
+    return projected
+
+
+def _iter_rows(
+    connection: sqlite3.Connection,
+    query: str,
+    params: Iterable[Any],
+    batch_size: int,
+) -> Iterator[sqlite3.Row]:
+    cursor = connection.execute(query, tuple(params))
+    try:
+        while rows := cursor.fetchmany(batch_size):
+            # A batch of rows stands for a getMore of a Mongo cursor
+            record_round_trips()
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def _source_filter(
+    column: str, source_name: Optional[str]
+) -> Tuple[str, List[str]]:
+    if source_name is None:
+        return "", []
+    return f" WHERE {column} = ?", [source_name]
+
+
+class SQLiteDocumentStorage:
+    def __init__(
+        self,
+        path: str,
+        raw_collection_name: str,
+        processed_collection_name: str,
+    ) -> None:
+        self.connection = get_connection(path)
+        self.raw_table = raw_collection_name
+        self.processed_table = processed_collection_name
+        for table in (self.raw_table, self.processed_table):
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "_id TEXT PRIMARY KEY, source_name TEXT NOT NULL, "
+                "content TEXT NOT NULL, digest TEXT, fingerprint TEXT, "
+                "split_fingerprint TEXT)"
+            )
+
+    def ensure_indexes(self) -> None:
+        self.connection.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS "
+            f"{self.raw_table}_source_digest "
+            f"ON {self.raw_table} (source_name, digest)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS "
+            f"{self.processed_table}_source_name "
+            f"ON {self.processed_table} (source_name)"
+        )
+        return None
+
+    def get_raw_document(self, source_name: str) -> Optional[Dict[str, Any]]:
+        return next(
+            self._iter_table(self.raw_table, 1, None, source_name), None
+        )
+
+    def get_processed_document(
+        self, source_name: str
+    ) -> Optional[Dict[str, Any]]:
+        return next(
+            self._iter_table(self.processed_table, 1, None, source_name),
+            None,
+        )
+
+    def get_raw_documents(self) -> List[Dict[str, Any]]:
+        return list(self.iter_raw_documents())
+
+    def get_processed_documents(self) -> List[Dict[str, Any]]:
+        return list(self.iter_processed_documents())
+
+    def iter_raw_documents(
+        self,
+        batch_size: int = DEFAULT_CURSOR_BATCH_SIZE,
+        projection: Optional[List[str]] = None,
+        source_name: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        return self._iter_table(
+            self.raw_table, batch_size, projection, source_name
+        )
+
+    def iter_processed_documents(
+        self,
+        batch_size: int = DEFAULT_CURSOR_BATCH_SIZE,
+        projection: Optional[List[str]] = None,
+        source_name: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        return self._iter_table(
+            self.processed_table, batch_size, projection, source_name
+        )
+
+    def set_raw_document(self, source_name: str, document: str) -> None:
+        self.connection.execute(
+            f"INSERT OR IGNORE INTO {self.raw_table} "
+            "(_id, source_name, content, digest) VALUES (?, ?, ?, ?)",
+            (
+                uuid.uuid4().hex,
+                source_name,
+                document,
+                content_digest(document),
+            ),
+        )
+        return None
+
+    def set_processed_document(
+        self,
+        source_name: str,
+        document: str,
+        _id: str,
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        self.connection.execute(
+            f"INSERT INTO {self.processed_table} "
+            "(_id, source_name, content, fingerprint) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(_id) DO UPDATE SET "
+            "source_name = excluded.source_name, content = excluded.content, "
+            "fingerprint = coalesce(excluded.fingerprint, fingerprint)",
+            (_id, source_name, document, fingerprint),
+        )
+        return None
+
+    def set_processed_documents(
+        self,
+        documents: Iterable[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> int:
+        """
+        Upsert processed documents in one transaction per batch. Every
+        document is a dict with _id, source_name, content and optional
+        fingerprint keys.
+
+        Returns the number of written documents.
+        """
+        written = 0
+        for batch_number, batch in enumerate(batched(documents, batch_size)):
+            rows = [
+                (
+                    str(document["_id"]),
+                    document["source_name"],
+                    document["content"],
+                    document.get("fingerprint"),
+                )
+                for document in batch
+            ]
+            try:
+                with _transaction(self.connection):
+                    self.connection.executemany(
+                        f"INSERT INTO {self.processed_table} "
+                        "(_id, source_name, content, fingerprint) "
+                        "VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(_id) DO UPDATE SET "
+                        "source_name = excluded.source_name, "
+                        "content = excluded.content, "
+                        "fingerprint = "
+                        "coalesce(excluded.fingerprint, fingerprint)",
+                        rows,
+                    )
+                written += len(rows)
+            except sqlite3.Error as e:
+                log.error(
+                    f"Processed document batch {batch_number} "
+                    f"({len(batch)} documents): {e}"
+                )
+        return written
+
+    def delete_raw_documents(
+        self, source_name: str, keep_digests: Iterable[str]
+    ) -> int:
+        """
+        Delete raw documents of the source whose digest is not in
+        keep_digests: versions superseded by the latest collection.
+        """
+        keep_digests = set(keep_digests)
+        stale_ids = [
+            (_id,)
+            for _id, digest in self.connection.execute(
+                f"SELECT _id, digest FROM {self.raw_table} "
+                "WHERE source_name = ?",
+                (source_name,),
+            )
+            if digest not in keep_digests
+        ]
+        with _transaction(self.connection):
+            self.connection.executemany(
+                f"DELETE FROM {self.raw_table} WHERE _id = ?", stale_ids
+            )
+        return len(stale_ids)
+
+    def delete_processed_documents(self, _ids: Iterable[str]) -> int:
+        deleted = 0
+        with _transaction(self.connection):
+            for batch in batched(_ids, DEFAULT_BATCH_SIZE):
+                cursor = self.connection.executemany(
+                    f"DELETE FROM {self.processed_table} WHERE _id = ?",
+                    [(_id,) for _id in batch],
+                )
+                deleted += cursor.rowcount
+        return deleted
+
+    def set_split_fingerprint(self, _id: str, fingerprint: str) -> None:
+        self.connection.execute(
+            f"UPDATE {self.processed_table} SET split_fingerprint = ? "
+            "WHERE _id = ?",
+            (fingerprint, _id),
+        )
+        return None
+
+    def reset_split_fingerprints(self, _ids: Iterable[str]) -> int:
+        """
+        Make split_documents split the documents again. Ids which are
+        not processed documents (chunks of 3d party dumps) are skipped.
+        """
+        reset = 0
+        with _transaction(self.connection):
+            for batch in batched(_ids, DEFAULT_BATCH_SIZE):
+                cursor = self.connection.executemany(
+                    f"UPDATE {self.processed_table} "
+                    "SET split_fingerprint = NULL WHERE _id = ?",
+                    [(_id,) for _id in batch],
+                )
+                reset += cursor.rowcount
+        return reset
+
+    def _iter_table(
+        self,
+        table: str,
+        batch_size: int,
+        projection: Optional[List[str]],
+        source_name: Optional[str],
+    ) -> Iterator[Dict[str, Any]]:
+        columns = [
+            "_id",
+            "source_name",
+            "content",
+            "digest",
+            "fingerprint",
+            "split_fingerprint",
+        ]
+        if projection is not None:
+            columns = ["_id"] + [c for c in columns[1:] if c in projection]
+        where, params = _source_filter("source_name", source_name)
+        rows = _iter_rows(
+            self.connection,
+            f"SELECT {', '.join(columns)} FROM {table}{where}",
+            params,
+            batch_size,
+        )
+        for row in rows:
+            yield {
+                column: value
+                for column, value in zip(columns, row)
+                if value is not None
+            }
+
+
+class SQLiteChunkStorage:
+    def __init__(self, path: str, collection_name: str) -> None:
+        self.connection = get_connection(path)
+        self.table = collection_name
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "chunk_id TEXT PRIMARY KEY, source_name TEXT, document_id TEXT, "
+            "data TEXT NOT NULL)"
+        )
+
+    def ensure_indexes(self) -> None:
+        for column in ("source_name", "document_id"):
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_{column} "
+                f"ON {self.table} ({column})"
+            )
+        return None
+
+    def get_chunk(self, chunk_id: str) -> Optional[Document]:
+        row = self.connection.execute(
+            f"SELECT data FROM {self.table} WHERE chunk_id = ?", (chunk_id,)
+        ).fetchone()
+        return Document(**_loads(row[0])) if row else None
+
+    def get_chunks(self) -> List[Document]:
+        return list(self.iter_chunks())
+
+    def iter_chunks(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        projection: Optional[List[str]] = None,
+        source_name: Optional[str] = None,
+    ) -> Iterator[Document]:
+        where, params = _source_filter("source_name", source_name)
+        rows = _iter_rows(
+            self.connection,
+            f"SELECT data FROM {self.table}{where}",
+            params,
+            batch_size,
+        )
+        for row in rows:
+            yield Document(**_project(_loads(row[0]), projection))
+
+    def iter_chunk_ids(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        skip_duplicates: bool = False,
+    ) -> Iterator[str]:
+        where = (
+            " WHERE json_extract(data, '$.metadata.duplicate_of') IS NULL"
+            if skip_duplicates
+            else ""
+        )
+        rows = _iter_rows(
+            self.connection,
+            f"SELECT chunk_id FROM {self.table}{where}",
+            (),
+            batch_size,
+        )
+        for row in rows:
+            yield row[0]
+
+    def get_chunks_by_source(self, source_name: str) -> List[Document]:
+        return list(self.iter_chunks(source_name=source_name))
+
+    def set_chunk(self, chunk_id: str, chunk: Document) -> None:
+        self.connection.execute(
+            self._upsert_query(), self._to_row(chunk_id, chunk)
+        )
+        return None
+
+    def set_chunks(
+        self,
+        chunks: Iterable[Document],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> int:
+        """
+        Upsert chunks in one transaction per batch. Chunk id is taken
+        from chunk.metadata["id"]. A failed batch is rolled back and
+        logged without stopping the following batches, RuntimeError is
+        raised when all batches are done.
+
+        Returns the number of written chunks.
+        """
+        written = 0
+        failed_batches = 0
+        start = time.perf_counter()
+        for batch_number, batch in enumerate(batched(chunks, batch_size)):
+            rows = [
+                self._to_row(chunk.metadata["id"], chunk) for chunk in batch
+            ]
+            try:
+                with _transaction(self.connection):
+                    self.connection.executemany(self._upsert_query(), rows)
+                written += len(rows)
+            except sqlite3.Error as e:
+                failed_batches += 1
+                log.error(
+                    f"Chunk batch {batch_number} ({len(batch)} chunks): {e}"
+                )
+        elapsed = time.perf_counter() - start
+        rate = written / elapsed if elapsed > 0 else 0.0
+        log.info(
+            f"Written {written} chunks in {elapsed:.2f}s ({rate:.0f} rows/s), "
+            f"failed batches: {failed_batches}"
+        )
+        if failed_batches:
+            raise RuntimeError(
+                f"Failed to write {failed_batches} chunk batches"
+            )
+        return written
+
+    def delete_stale_chunks(
+        self, document_id: str, keep_ids: Iterable[str]
+    ) -> int:
+        """
+        Delete chunks of the document which are not in keep_ids.
+        """
+        keep_ids = set(keep_ids)
+        stale_ids = [
+            (chunk_id,)
+            for (chunk_id,) in self.connection.execute(
+                f"SELECT chunk_id FROM {self.table} WHERE document_id = ?",
+                (document_id,),
+            )
+            if chunk_id not in keep_ids
+        ]
+        with _transaction(self.connection):
+            self.connection.executemany(
+                f"DELETE FROM {self.table} WHERE chunk_id = ?", stale_ids
+            )
+        return len(stale_ids)
+
+    def delete_other_generations(
+        self, document_id: str, generation: str
+    ) -> int:
+        """
+        Delete chunks of the document which were not written with
+        metadata.generation, the filter doesn't grow with the document.
+        """
+        with _transaction(self.connection):
+            cursor = self.connection.execute(
+                f"DELETE FROM {self.table} WHERE document_id = ? "
+                "AND json_extract(data, '$.metadata.generation') IS NOT ?",
+                (document_id, generation),
+            )
+        return cursor.rowcount
+
+    def set_duplicates(
+        self,
+        duplicates: Dict[str, str],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> int:
+        """
+        Replace near-duplicate marks: chunk id -> id of the kept chunk
+        is stored in metadata.duplicate_of, marks of other chunks
+        are removed. New marks are written first with a generation and
+        only then older marks are removed, so that chunks are never
+        left unmarked. Returns the number of marked chunks.
+        """
+        generation = uuid.uuid4().hex
+        marked = 0
+        with _transaction(self.connection):
+            for batch in batched(duplicates.items(), batch_size):
+                cursor = self.connection.executemany(
+                    f"UPDATE {self.table} SET data = json_set(data, "
+                    "'$.metadata.duplicate_of', ?, "
+                    "'$.metadata.duplicate_generation', ?) "
+                    "WHERE chunk_id = ?",
+                    [
+                        (original_id, generation, chunk_id)
+                        for chunk_id, original_id in batch
+                    ],
+                )
+                marked += cursor.rowcount
+            self.connection.execute(
+                f"UPDATE {self.table} SET data = json_remove(data, "
+                "'$.metadata.duplicate_of', '$.metadata.duplicate_generation') "
+                "WHERE json_extract(data, '$.metadata.duplicate_of') "
+                "IS NOT NULL AND "
+                "json_extract(data, '$.metadata.duplicate_generation') IS NOT ?",
+                (generation,),
+            )
+        return marked
+
+    def delete_chunks(self, chunk_ids: Iterable[str]) -> int:
+        deleted = 0
+        with _transaction(self.connection):
+            for batch in batched(chunk_ids, DEFAULT_BATCH_SIZE):
+                cursor = self.connection.executemany(
+                    f"DELETE FROM {self.table} WHERE chunk_id = ?",
+                    [(chunk_id,) for chunk_id in batch],
+                )
+                deleted += cursor.rowcount
+        return deleted
+
+    def delete_legacy_chunks(self) -> int:
+        """
+        Delete chunks written before chunks were bound to their document.
+        """
+        cursor = self.connection.execute(
+            f"DELETE FROM {self.table} WHERE document_id IS NULL"
+        )
+        return cursor.rowcount
+
+    def _upsert_query(self) -> str:
+        return (
+            f"INSERT INTO {self.table} (chunk_id, source_name, document_id, "
+            "data) VALUES (?, ?, ?, ?) ON CONFLICT(chunk_id) DO UPDATE SET "
+            "source_name = excluded.source_name, "
+            "document_id = excluded.document_id, data = excluded.data"
+        )
+
+    def _to_row(self, chunk_id: str, chunk: Document) -> Tuple[str, ...]:
+        chunk_data = chunk.model_dump(mode="python")
+        chunk_data["chunk_id"] = chunk_id
+        return (
+            chunk_id,
+            chunk.metadata.get("source_name"),
+            chunk.metadata.get("document_id"),
+            _dumps(chunk_data),
+        )
+
+
+class SQLiteMetricStorage:
+    def __init__(self, path: str, collection_name: str) -> None:
+        self.connection = get_connection(path)
+        self.table = collection_name
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "_id TEXT PRIMARY KEY, source_name TEXT, metric_type TEXT, "
+            "data TEXT NOT NULL)"
+        )
+
+    def ensure_indexes(self) -> None:
+        for column in ("source_name", "metric_type"):
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_{column} "
+                f"ON {self.table} ({column})"
+            )
+        return None
+
+    def set_metric(self, metric: Dict[str, Any]) -> None:
+        # Same semantics as the Mongo upsert with $set: fields of the
+        # first metric with this source_name are updated in place.
+        with _transaction(self.connection):
+            row = self.connection.execute(
+                f"SELECT _id, data FROM {self.table} WHERE source_name = ? "
+                "LIMIT 1",
+                (metric["source_name"],),
+            ).fetchone()
+            if row is None:
+                _id, data = uuid.uuid4().hex, {}
+            else:
+                _id, data = row[0], _loads(row[1])
+            data.update(metric)
+            data["_id"] = _id
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} "
+                "(_id, source_name, metric_type, data) VALUES (?, ?, ?, ?)",
+                (
+                    _id,
+                    data.get("source_name"),
+                    data.get("metric_type"),
+                    _dumps(data),
+                ),
+            )
+        return None
+
+    def set_metrics(
+        self,
+        metrics: Iterable[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> int:
+        """
+        Insert metrics as new records, one transaction per batch.
+        Unlike set_metric, records of the same source are not merged.
+
+        Returns the number of inserted metrics.
+        """
+        inserted = 0
+        for batch_number, batch in enumerate(batched(metrics, batch_size)):
+            rows = []
+            for metric in batch:
+                data = {"_id": uuid.uuid4().hex, **metric}
+                rows.append(
+                    (
+                        data["_id"],
+                        data.get("source_name"),
+                        data.get("metric_type"),
+                        _dumps(data),
+                    )
+                )
+            try:
+                with _transaction(self.connection):
+                    self.connection.executemany(
+                        f"INSERT INTO {self.table} "
+                        "(_id, source_name, metric_type, data) "
+                        "VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+                inserted += len(rows)
+            except sqlite3.Error as e:
+                log.error(f"Metric batch {batch_number} ({len(batch)}): {e}")
+        return inserted
+
+    def replace_metrics(
+        self,
+        metric_type: str,
+        metrics: Iterable[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Tuple[int, int]:
+        """
+        Replace metrics of metric_type with metrics, which may be
+        computed lazily. New metrics are written as a new generation
+        and the previous ones are deleted only after all of them are
+        written, a failure deletes the new generation and keeps the
+        previous metrics.
+
+        Returns the numbers of inserted and deleted metrics.
+        """
+        generation = uuid.uuid4().hex
+        total = 0
+
+        def iter_generation() -> Iterator[Dict[str, Any]]:
+            nonlocal total
+            for metric in metrics:
+                total += 1
+                yield {**metric, "generation": generation}
+
+        try:
+            inserted = self.set_metrics(iter_generation(), batch_size)
+            if inserted != total:
+                raise RuntimeError(
+                    f"Written {inserted} of {total} {metric_type} metrics"
+                )
+        except BaseException:
+            self._delete_generations(metric_type, generation, keep=False)
+            raise
+        deleted = self._delete_generations(metric_type, generation, keep=True)
+        return inserted, deleted
+
+    def _delete_generations(
+        self, metric_type: str, generation: str, keep: bool
+    ) -> int:
+        """
+        Delete metrics of the generation, or with keep all other
+        generations of metric_type.
+        """
+        operator = "IS NOT" if keep else "IS"
+        with _transaction(self.connection):
+            cursor = self.connection.execute(
+                f"DELETE FROM {self.table} WHERE metric_type = ? "
+                f"AND json_extract(data, '$.generation') {operator} ?",
+                (metric_type, generation),
+            )
+        return cursor.rowcount
+
+    def delete_metrics(
+        self, metric_type: str, source_name: Optional[str] = None
+    ) -> int:
+        query = f"DELETE FROM {self.table} WHERE metric_type = ?"
+        params = [metric_type]
+        if source_name is not None:
+            query += " AND source_name = ?"
+            params.append(source_name)
+        with _transaction(self.connection):
+            cursor = self.connection.execute(query, params)
+        return cursor.rowcount
+
+    def get_metrics(self) -> List[Dict[str, Any]]:
+        return list(self.iter_metrics())
+
+    def iter_metrics(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        projection: Optional[List[str]] = None,
+        source_name: Optional[str] = None,
+        metric_type: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        conditions, params = [], []
+        if source_name is not None:
+            conditions.append("source_name = ?")
+            params.append(source_name)
+        if metric_type is not None:
+            conditions.append("metric_type = ?")
+            params.append(metric_type)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = _iter_rows(
+            self.connection,
+            f"SELECT data FROM {self.table}{where}",
+            params,
+            batch_size,
+        )
+        for row in rows:
+            yield _project(_loads(row[0]), projection)
+
+    def get_metric_by_source_name(
+        self, source_name: str
+    ) -> Optional[Dict[str, Any]]:
+        return next(self.iter_metrics(source_name=source_name), None)
+
+    def get_metrics_by_type(self, metric_type: str) -> List[Dict[str, Any]]:
+        return list(self.iter_metrics(metric_type=metric_type))
+
+
+class SQLiteConfigStorage:
+    def __init__(self, path: str, collection_name: str) -> None:
+        self.connection = get_connection(path)
+        self.table = collection_name
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "source_name TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+
+    def ensure_indexes(self) -> None:
+        # source_name is the primary key
+        return None
+
+    def get_config(self, source_name: str) -> Optional[Dict[str, Any]]:
+        row = self.connection.execute(
+            f"SELECT data FROM {self.table} WHERE source_name = ?",
+            (source_name,),
+        ).fetchone()
+        return _loads(row[0]) if row else None
+
+    def set_config(self, source_name: str, config: Dict[str, Any]) -> None:
+        with _transaction(self.connection):
+            data = self.get_config(source_name) or {"source_name": source_name}
+            data.update(config)
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (source_name, data) "
+                "VALUES (?, ?)",
+                (source_name, _dumps(data)),
+            )
+        return None
+
+
+@contextmanager
+def _transaction(connection: sqlite3.Connection) -> Iterator[None]:
+    """
+    Explicit BEGIN/COMMIT for autocommit connections, so a batch of
+    statements is written with a single WAL commit.
+    """
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
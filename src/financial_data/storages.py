@@ -1,9 +1,41 @@
 import os
-from typing import Any, Dict, List, Optional, Union
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+import uuid
 
 from bson import ObjectId
 from langchain_core.documents import Document
-from pymongo import MongoClient, collection
+from pymongo import ASCENDING, UpdateOne, collection
+from pymongo.errors import BulkWriteError
+
+from .mongo_pool import get_client
+from .sqlite_storages import (
+    SQLiteChunkStorage,
+    SQLiteConfigStorage,
+    SQLiteDocumentStorage,
+    SQLiteMetricStorage,
+)
+from .utils.batch import batched
+from .utils.hashing import content_digest
+from .utils.log import get_logger
+
+
+log = get_logger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CURSOR_BATCH_SIZE = 100
+
+_indexed_storage_types: Set[Tuple[str, str]] = set()
 
 
 class DocumentStorage:
@@ -15,11 +47,23 @@ class DocumentStorage:
         raw_collection_name: str,
         processed_collection_name: str,
     ) -> None:
-        self.client = MongoClient(host, port)
+        self.client = get_client(host, port)
         self.db = self.client[db_name]
         self.raw_collection = self.db[raw_collection_name]
         self.processed_collection = self.db[processed_collection_name]
 
+    def ensure_indexes(self) -> None:
+        # Raw documents stored before digests were introduced have no
+        # digest field, so they are left out of the uniqueness constraint.
+        self.raw_collection.create_index(
+            [("source_name", ASCENDING), ("digest", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"digest": {"$exists": True}},
+        )
+        self.raw_collection.create_index("source_name")
+        self.processed_collection.create_index("source_name")
+        return None
+
     def get_raw_document(self, source_name: str) -> Optional[str]:
         return self._get_document_by_name_and_collection(
             source_name, self.raw_collection
@@ -36,44 +80,186 @@ class DocumentStorage:
     def get_processed_documents(self) -> List[str]:
         return list(self.processed_collection.find({}))
 
+    def iter_raw_documents(
+        self,
+        batch_size: int = DEFAULT_CURSOR_BATCH_SIZE,
+        projection: Optional[List[str]] = None,
+        source_name: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        return _iter_collection(
+            self.raw_collection,
+            _source_query("source_name", source_name),
+            projection,
+            batch_size,
+        )
+
+    def iter_processed_documents(
+        self,
+        batch_size: int = DEFAULT_CURSOR_BATCH_SIZE,
+        projection: Optional[List[str]] = None,
+        source_name: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        return _iter_collection(
+            self.processed_collection,
+            _source_query("source_name", source_name),
+            projection,
+            batch_size,
+        )
+
     def _get_document_by_name_and_collection(
         self, source_name: str, collection: collection.Collection
     ) -> Optional[str]:
         return collection.find_one({"source_name": source_name})
 
-    def set_raw_document(
+    def set_raw_document(self, source_name: str, document: str) -> None:
+        """
+        Insert raw document unless the same content is already stored
+        for the source. Duplicates are detected by content digest.
+        """
+        digest = content_digest(document)
+        self.raw_collection.update_one(
+            {"source_name": source_name, "digest": digest},
+            {
+                "$setOnInsert": {
+                    "source_name": source_name,
+                    "content": document,
+                    "digest": digest,
+                }
+            },
+            upsert=True,
+        )
+        return None
+
+    def set_processed_document(
         self,
         source_name: str,
         document: str,
-        collection: collection.Collection,
+        _id: str,
+        fingerprint: Optional[str] = None,
     ) -> None:
-        if not collection.find_one(
-            {"source_name": source_name, "content": document}
-        ):
-            collection.insert_one(
-                {"source_name": source_name, "content": document},
-            )
+        processed = {"source_name": source_name, "content": document}
+        if fingerprint is not None:
+            processed["fingerprint"] = fingerprint
+        self.processed_collection.update_one(
+            {"_id": ObjectId(_id)},
+            {"$set": processed},
+            upsert=True,
+        )
         return None
 
-    def set_processed_document(
-        self, source_name: str, document: str, _id: str
-    ) -> None:
+    def set_processed_documents(
+        self,
+        documents: Iterable[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> int:
+        """
+        Upsert processed documents with unordered bulk writes, batch_size
+        documents per round-trip. Every document is a dict with _id,
+        source_name, content and optional fingerprint keys.
+
+        Returns the number of written documents.
+        """
+        written = 0
+        for batch_number, batch in enumerate(batched(documents, batch_size)):
+            operations = []
+            for document in batch:
+                processed = {
+                    "source_name": document["source_name"],
+                    "content": document["content"],
+                }
+                if document.get("fingerprint") is not None:
+                    processed["fingerprint"] = document["fingerprint"]
+                operations.append(
+                    UpdateOne(
+                        {"_id": ObjectId(document["_id"])},
+                        {"$set": processed},
+                        upsert=True,
+                    )
+                )
+            try:
+                result = self.processed_collection.bulk_write(
+                    operations, ordered=False
+                )
+                written += result.upserted_count + result.matched_count
+            except BulkWriteError as e:
+                details = e.details
+                write_errors = details.get("writeErrors", [])
+                written += details.get("nUpserted", 0) + details.get(
+                    "nMatched", 0
+                )
+                log.error(
+                    f"Processed document batch {batch_number} "
+                    f"({len(batch)} documents): {len(write_errors)} write "
+                    f"errors, first: "
+                    f"{write_errors[0]['errmsg'] if write_errors else e}"
+                )
+        return written
+
+    def delete_raw_documents(
+        self, source_name: str, keep_digests: Iterable[str]
+    ) -> int:
+        """
+        Delete raw documents of the source whose digest is not in
+        keep_digests: versions superseded by the latest collection.
+        """
+        result = self.raw_collection.delete_many(
+            {"source_name": source_name, "digest": {"$nin": list(keep_digests)}}
+        )
+        return result.deleted_count
+
+    def delete_processed_documents(self, _ids: Iterable[str]) -> int:
+        deleted = 0
+        for batch in batched(_ids, DEFAULT_BATCH_SIZE):
+            result = self.processed_collection.delete_many(
+                {"_id": {"$in": [ObjectId(_id) for _id in batch]}}
+            )
+            deleted += result.deleted_count
+        return deleted
+
+    def set_split_fingerprint(self, _id: str, fingerprint: str) -> None:
         self.processed_collection.update_one(
             {"_id": ObjectId(_id)},
-            {"$set": {"source_name": source_name, "content": document}},
-            upsert=True,
+            {"$set": {"split_fingerprint": fingerprint}},
         )
         return None
 
+    def reset_split_fingerprints(self, _ids: Iterable[str]) -> int:
+        """
+        Make split_documents split the documents again. Ids which are
+        not processed documents (chunks of 3d party dumps) are skipped.
+        """
+        reset = 0
+        for batch in batched(_ids, DEFAULT_BATCH_SIZE):
+            result = self.processed_collection.update_many(
+                {
+                    "_id": {
+                        "$in": [
+                            ObjectId(_id)
+                            for _id in batch
+                            if ObjectId.is_valid(_id)
+                        ]
+                    }
+                },
+                {"$unset": {"split_fingerprint": ""}},
+            )
+            reset += result.modified_count
+        return reset
+
 
 class ChunkStorage:
     def __init__(
         self, host: str, port: int, db_name: str, collection_name: str
     ) -> None:
-        self.client = MongoClient(host, port)
+        self.client = get_client(host, port)
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
 
+    def ensure_indexes(self) -> None:
+        self.collection.create_index("chunk_id", unique=True)
+        self.collection.create_index("metadata.source_name")
+        self.collection.create_index("metadata.document_id")
+        return None
+
     def get_chunk(self, chunk_id: str) -> Optional[Document]:
         doc_obj = self.collection.find_one({"chunk_id": chunk_id})
         return Document(**doc_obj) if doc_obj else None
@@ -82,6 +268,41 @@ class ChunkStorage:
         chunks = list(self.collection.find({}))
         return [Document(**chunk) for chunk in chunks]
 
+    def iter_chunks(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        projection: Optional[List[str]] = None,
+        source_name: Optional[str] = None,
+    ) -> Iterator[Document]:
+        """
+        Lazily iterate over chunks. Projection must keep page_content,
+        otherwise the chunk can't be converted to Document.
+        """
+        chunks = _iter_collection(
+            self.collection,
+            _source_query("metadata.source_name", source_name),
+            projection,
+            batch_size,
+        )
+        for chunk in chunks:
+            yield Document(**chunk)
+
+    def iter_chunk_ids(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        skip_duplicates: bool = False,
+    ) -> Iterator[str]:
+        query = (
+            {"metadata.duplicate_of": {"$exists": False}}
+            if skip_duplicates
+            else {}
+        )
+        chunks = _iter_collection(
+            self.collection, query, ["chunk_id"], batch_size
+        )
+        for chunk in chunks:
+            yield chunk["chunk_id"]
+
     def get_chunks_by_source(self, source_name: str) -> List[Document]:
         chunks = list(
             self.collection.find({"metadata.source_name": source_name})
@@ -89,22 +310,173 @@ class ChunkStorage:
         return [Document(**chunk) for chunk in chunks]
 
     def set_chunk(self, chunk_id: str, chunk: Document) -> None:
-        chunk_data = chunk.model_dump(mode="python")
-        chunk_data["chunk_id"] = chunk_id
+        chunk_data = self._to_chunk_data(chunk_id, chunk)
         self.collection.update_one(
             {"chunk_id": chunk_id}, {"$set": chunk_data}, upsert=True
         )
         return None
 
+    def set_chunks(
+        self,
+        chunks: Iterable[Document],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> int:
+        """
+        Upsert chunks with unordered bulk writes, batch_size chunks per
+        round-trip. Chunk id is taken from chunk.metadata["id"].
+        A failed batch is logged and does not stop the following batches,
+        RuntimeError is raised when all batches are done.
+
+        Returns the number of written chunks.
+        """
+        written = 0
+        failed_batches = 0
+        start = time.perf_counter()
+        for batch_number, batch in enumerate(batched(chunks, batch_size)):
+            operations = [
+                UpdateOne(
+                    {"chunk_id": chunk.metadata["id"]},
+                    {"$set": self._to_chunk_data(chunk.metadata["id"], chunk)},
+                    upsert=True,
+                )
+                for chunk in batch
+            ]
+            try:
+                result = self.collection.bulk_write(operations, ordered=False)
+                written += result.upserted_count + result.matched_count
+            except BulkWriteError as e:
+                failed_batches += 1
+                details = e.details
+                write_errors = details.get("writeErrors", [])
+                written += details.get("nUpserted", 0) + details.get(
+                    "nMatched", 0
+                )
+                log.error(
+                    f"Chunk batch {batch_number} ({len(batch)} chunks): "
+                    f"{len(write_errors)} write errors, first: "
+                    f"{write_errors[0]['errmsg'] if write_errors else e}"
+                )
+        elapsed = time.perf_counter() - start
+        rate = written / elapsed if elapsed > 0 else 0.0
+        log.info(
+            f"Written {written} chunks in {elapsed:.2f}s ({rate:.0f} rows/s), "
+            f"failed batches: {failed_batches}"
+        )
+        if failed_batches:
+            raise RuntimeError(
+                f"Failed to write {failed_batches} chunk batches"
+            )
+        return written
+
+    def delete_stale_chunks(
+        self, document_id: str, keep_ids: Iterable[str]
+    ) -> int:
+        """
+        Delete chunks of the document which are not in keep_ids.
+        """
+        result = self.collection.delete_many(
+            {
+                "metadata.document_id": document_id,
+                "chunk_id": {"$nin": list(keep_ids)},
+            }
+        )
+        return result.deleted_count
+
+    def delete_other_generations(
+        self, document_id: str, generation: str
+    ) -> int:
+        """
+        Delete chunks of the document which were not written with
+        metadata.generation, the filter doesn't grow with the document.
+        """
+        result = self.collection.delete_many(
+            {
+                "metadata.document_id": document_id,
+                "metadata.generation": {"$ne": generation},
+            }
+        )
+        return result.deleted_count
+
+    def delete_legacy_chunks(self) -> int:
+        """
+        Delete chunks written before chunks were bound to their document.
+        """
+        result = self.collection.delete_many(
+            {"metadata.document_id": {"$exists": False}}
+        )
+        return result.deleted_count
+
+    def set_duplicates(
+        self,
+        duplicates: Dict[str, str],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> int:
+        """
+        Replace near-duplicate marks: chunk id -> id of the kept chunk
+        is stored in metadata.duplicate_of, marks of other chunks
+        are removed. New marks are written first with a generation and
+        only then older marks are removed, so that chunks are never
+        left unmarked. Returns the number of marked chunks.
+        """
+        generation = uuid.uuid4().hex
+        marked = 0
+        for batch in batched(duplicates.items(), batch_size):
+            result = self.collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"chunk_id": chunk_id},
+                        {
+                            "$set": {
+                                "metadata.duplicate_of": original_id,
+                                "metadata.duplicate_generation": generation,
+                            }
+                        },
+                    )
+                    for chunk_id, original_id in batch
+                ],
+                ordered=False,
+            )
+            marked += result.matched_count
+        self.collection.update_many(
+            {
+                "metadata.duplicate_of": {"$exists": True},
+                "metadata.duplicate_generation": {"$ne": generation},
+            },
+            {
+                "$unset": {
+                    "metadata.duplicate_of": "",
+                    "metadata.duplicate_generation": "",
+                }
+            },
+        )
+        return marked
+
+    def delete_chunks(self, chunk_ids: Iterable[str]) -> int:
+        deleted = 0
+        for batch in batched(chunk_ids, DEFAULT_BATCH_SIZE):
+            result = self.collection.delete_many({"chunk_id": {"$in": batch}})
+            deleted += result.deleted_count
+        return deleted
+
+    def _to_chunk_data(self, chunk_id: str, chunk: Document) -> Dict[str, Any]:
+        chunk_data = chunk.model_dump(mode="python")
+        chunk_data["chunk_id"] = chunk_id
+        return chunk_data
+
 
 class MetricStorage:
     def __init__(
         self, host: str, port: int, db_name: str, collection_name: str
     ) -> None:
-        self.client = MongoClient(host, port)
+        self.client = get_client(host, port)
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
 
+    def ensure_indexes(self) -> None:
+        self.collection.create_index("source_name")
+        self.collection.create_index("metric_type")
+        return None
+
     def set_metric(self, metric: Dict[str, Any]) -> None:
         self.collection.update_one(
             {"source_name": metric["source_name"]},
@@ -113,9 +485,90 @@ class MetricStorage:
         )
         return None
 
+    def set_metrics(
+        self,
+        metrics: Iterable[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> int:
+        """
+        Insert metrics as new records with unordered bulk inserts,
+        batch_size metrics per round-trip. Unlike set_metric, records
+        of the same source are not merged.
+
+        Returns the number of inserted metrics.
+        """
+        inserted = 0
+        for batch_number, batch in enumerate(batched(metrics, batch_size)):
+            try:
+                result = self.collection.insert_many(batch, ordered=False)
+                inserted += len(result.inserted_ids)
+            except BulkWriteError as e:
+                inserted += e.details.get("nInserted", 0)
+                log.error(f"Metric batch {batch_number} ({len(batch)}): {e}")
+        return inserted
+
+    def replace_metrics(
+        self,
+        metric_type: str,
+        metrics: Iterable[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Tuple[int, int]:
+        """
+        Replace metrics of metric_type with metrics, which may be
+        computed lazily. New metrics are written as a new generation
+        and the previous ones are deleted only after all of them are
+        written, a failure deletes the new generation and keeps the
+        previous metrics.
+
+        Returns the numbers of inserted and deleted metrics.
+        """
+        generation = uuid.uuid4().hex
+        total = 0
+
+        def iter_generation() -> Iterator[Dict[str, Any]]:
+            nonlocal total
+            for metric in metrics:
+                total += 1
+                yield {**metric, "generation": generation}
+
+        try:
+            inserted = self.set_metrics(iter_generation(), batch_size)
+            if inserted != total:
+                raise RuntimeError(
+                    f"Written {inserted} of {total} {metric_type} metrics"
+                )
+        except BaseException:
+            self.collection.delete_many(
+                {"metric_type": metric_type, "generation": generation}
+            )
+            raise
+        deleted = self.collection.delete_many(
+            {"metric_type": metric_type, "generation": {"$ne": generation}}
+        ).deleted_count
+        return inserted, deleted
+
+    def delete_metrics(
+        self, metric_type: str, source_name: Optional[str] = None
+    ) -> int:
+        query = _source_query("source_name", source_name)
+        query["metric_type"] = metric_type
+        return self.collection.delete_many(query).deleted_count
+
     def get_metrics(self) -> List[Dict[str, Any]]:
         return list(self.collection.find({}))
 
+    def iter_metrics(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        projection: Optional[List[str]] = None,
+        source_name: Optional[str] = None,
+        metric_type: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        query = _source_query("source_name", source_name)
+        if metric_type is not None:
+            query["metric_type"] = metric_type
+        return _iter_collection(self.collection, query, projection, batch_size)
+
     def get_metric_by_source_name(
         self, source_name: str
     ) -> Optional[Dict[str, Any]]:
@@ -129,10 +582,14 @@ class ConfigStorage:
     def __init__(
         self, host: str, port: int, db_name: str, collection_name: str
     ) -> None:
-        self.client = MongoClient(host, port)
+        self.client = get_client(host, port)
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
 
+    def ensure_indexes(self) -> None:
+        self.collection.create_index("source_name", unique=True)
+        return None
+
     def get_config(self, source_name: str) -> Optional[Dict[str, Any]]:
         return self.collection.find_one({"source_name": source_name})
 
@@ -145,8 +602,50 @@ class ConfigStorage:
         return None
 
 
+def _source_query(field: str, source_name: Optional[str]) -> Dict[str, str]:
+    return {field: source_name} if source_name is not None else {}
+
+
+def _iter_collection(
+    collection: collection.Collection,
+    query: Dict[str, Any],
+    projection: Optional[List[str]],
+    batch_size: int,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Cursor over collection which fetches documents from the server
+    batch_size at a time instead of loading the whole result.
+    """
+    cursor = collection.find(query, projection).batch_size(batch_size)
+    with cursor:
+        yield from cursor
+
+
 def initialize_storage(
     storage_type: str,
+) -> Union[DocumentStorage, ChunkStorage, MetricStorage, ConfigStorage]:
+    """
+    Create storage by type. Backend is chosen by StorageBackend
+    environment variable: "mongo" (default) or "sqlite", the latter
+    keeps all collections in the SQLitePath database file.
+    Indexes are provisioned on the first initialization of each
+    storage type in the process.
+    """
+    backend = os.getenv("StorageBackend", "mongo")
+    if backend == "mongo":
+        storage = _create_storage(storage_type)
+    elif backend == "sqlite":
+        storage = _create_sqlite_storage(storage_type)
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    if (backend, storage_type) not in _indexed_storage_types:
+        storage.ensure_indexes()
+        _indexed_storage_types.add((backend, storage_type))
+    return storage
+
+
+def _create_storage(
+    storage_type: str,
 ) -> Union[DocumentStorage, ChunkStorage, MetricStorage, ConfigStorage]:
     if storage_type == "document":
         return DocumentStorage(
@@ -179,3 +678,28 @@ def initialize_storage(
         )
     else:
         raise ValueError("This storage type doesn't exists!")
+
+
+def _create_sqlite_storage(
+    storage_type: str,
+) -> Union[
+    SQLiteDocumentStorage,
+    SQLiteChunkStorage,
+    SQLiteMetricStorage,
+    SQLiteConfigStorage,
+]:
+    path = os.getenv("SQLitePath", "./data/storage.sqlite3")
+    if storage_type == "document":
+        return SQLiteDocumentStorage(
+            path,
+            os.getenv("RawDocumentCollectionName"),
+            os.getenv("ProcessedDocumentCollectionName"),
+        )
+    elif storage_type == "chunk":
+        return SQLiteChunkStorage(path, os.getenv("ChunkCollectionName"))
+    elif storage_type == "metric":
+        return SQLiteMetricStorage(path, os.getenv("MetricsCollectionName"))
+    elif storage_type == "config":
+        return SQLiteConfigStorage(path, os.getenv("ConfigCollectionName"))
+    else:
+        raise ValueError("This storage type doesn't exists!")
@@ -0,0 +1,16 @@
+from itertools import islice
+from typing import Iterable, Iterator, List, TypeVar
+
+
+T = TypeVar("T")
+
+
+def batched(iterable: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """
+    Split iterable into lists of at most batch_size items.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
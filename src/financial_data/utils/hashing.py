@@ -0,0 +1,27 @@
+import hashlib
+import json
+from typing import Any
+
+
+def content_digest(content: str) -> str:
+    """
+    Stable sha256 hex digest of text content.
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def make_chunk_id(document_id: str, position: int, content: str) -> str:
+    """
+    Deterministic chunk id: the same text at the same position
+    of the same document always gets the same id.
+    """
+    return content_digest(f"{document_id}\x00{position}\x00{content}")
+
+
+def config_fingerprint(*configs: Any) -> str:
+    """
+    Digest of JSON-serializable configs, independent of key order.
+    """
+    return content_digest(
+        json.dumps(configs, sort_keys=True, ensure_ascii=False, default=str)
+    )
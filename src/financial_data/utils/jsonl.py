@@ -1,8 +1,15 @@
 import json
-from typing import List
+import re
+from typing import Any, Iterator, List, TextIO
 from langchain_core.documents import Document
 
 
+DEFAULT_READ_SIZE = 1 << 20
+
+WHITESPACE = re.compile(r"\s*")
+NUMBER_CHARS = "0123456789.eE+-"
+
+
 def save_documents_to_jsonl(documents: List[Document], file_path: str) -> None:
     with open(file_path, "w", encoding="utf-8") as jsonl_file:
         for doc in documents:
@@ -18,3 +25,58 @@ def load_documents_from_jsonl(file_path: str) -> List[Document]:
             document = Document(**data)
             documents.append(document)
     return documents
+
+
+def iter_json_array(
+    file: TextIO, read_size: int = DEFAULT_READ_SIZE
+) -> Iterator[Any]:
+    """
+    Items of a JSON array file one at a time. The file is read
+    read_size characters at a time, so only the current item and
+    one block are held in memory, whatever the file size.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+
+    def refill() -> None:
+        nonlocal buffer, position, eof
+        if eof:
+            raise ValueError("Unexpected end of JSON array")
+        block = file.read(read_size)
+        eof = not block
+        buffer, position = buffer[position:] + block, 0
+
+    expected = "["
+    while True:
+        position = WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            refill()
+            continue
+        char = buffer[position]
+        if expected == "[":
+            if char != "[":
+                raise ValueError(f"Expected JSON array, got {char!r}")
+            position += 1
+            expected = "item or ]"
+        elif char == "]" and expected != "item":
+            return None
+        elif expected == ", or ]":
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']', got {char!r}")
+            position += 1
+            expected = "item"
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                refill()
+                continue
+            # A number cut by the block end looks like a shorter number
+            if not eof and (end == len(buffer) or buffer[end] in NUMBER_CHARS):
+                refill()
+                continue
+            yield item
+            position = end
+            expected = ", or ]"
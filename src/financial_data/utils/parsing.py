@@ -1,9 +1,72 @@
-from bs4 import BeautifulSoup
+from typing import Dict, List, Tuple
+
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree
 from requests import Response
 
 
+Selector = Tuple[str, Dict[str, str]]
+
+
 def load_content(response: Response) -> BeautifulSoup:
     response.encoding = "utf-8"
     course_content = response.content
     soup = BeautifulSoup(course_content, "html.parser")
     return soup
+
+
+def load_elements(
+    response: Response, selectors: List[Selector]
+) -> BeautifulSoup:
+    """
+    Parse with lxml only the subtrees matching selectors, the rest
+    of the page is skipped by the parser and never becomes a tree.
+
+    Every selector is (tag name, attributes). Several selectors are
+    combined into one filter, so they must use the same attribute names.
+    """
+    names = [name for name, _ in selectors]
+    attrs_names = {tuple(sorted(attrs)) for _, attrs in selectors}
+    if len(attrs_names) > 1:
+        raise ValueError("Selectors must filter on the same attributes")
+    attrs = {
+        attr_name: [attrs[attr_name] for _, attrs in selectors]
+        for attr_name in next(iter(attrs_names))
+    }
+    strainer = SoupStrainer(names, attrs)
+    return BeautifulSoup(
+        response.content, "lxml", parse_only=strainer, from_encoding="utf-8"
+    )
+
+
+class _HrefCollector:
+    """
+    lxml parser target which keeps only href of links.
+    """
+
+    def __init__(self) -> None:
+        self.hrefs: List[str] = []
+
+    def start(self, tag: str, attrib: Dict[str, str]) -> None:
+        if tag == "a" and "href" in attrib:
+            self.hrefs.append(attrib["href"])
+
+    def end(self, tag: str) -> None:
+        pass
+
+    def data(self, data: str) -> None:
+        pass
+
+    def close(self) -> List[str]:
+        return self.hrefs
+
+
+def extract_hrefs(response: Response) -> List[str]:
+    """
+    All link hrefs of the page in document order. Parser events go
+    straight to a collector, no tree is built.
+    """
+    if not response.content:
+        return []
+    parser = etree.HTMLParser(target=_HrefCollector(), encoding="utf-8")
+    return etree.fromstring(response.content, parser)
@@ -0,0 +1,226 @@
+"""
+Run telemetry of pipeline stages.
+
+Every tracked stage is saved as a "pipeline_run" metric with the id
+of the run it belongs to: wall and CPU time, peak RSS, items in and
+out and storage round-trips. A resumed run keeps its run id, every
+call of a top-level stage is a new attempt of the run. Stages nest,
+a sub-step is saved with its parent stage. Round-trips of a sub-step
+also count in all stages it is nested in, items are counted by the
+innermost stage only, since the output of one sub-step is the input
+of the next. CPU time and peak RSS are process-wide, stages which ran
+alongside other stages are saved as overlapped.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+import functools
+import resource
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+import uuid
+
+from .log import get_logger
+
+
+log = get_logger(__name__)
+
+METRIC_TYPE = "pipeline_run"
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class StageRun:
+    stage: str
+    run_id: str
+    attempt_id: str
+    parent: Optional[str] = None
+    started_at: datetime = field(default_factory=datetime.now)
+    status: str = "running"
+    error: Optional[str] = None
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    peak_rss_mb: float = 0.0
+    rss_growth_mb: float = 0.0
+    items_in: int = 0
+    items_out: int = 0
+    storage_round_trips: int = 0
+    overlapped: bool = False
+
+    def to_metric(self) -> Dict[str, Any]:
+        return {
+            "source_name": self.stage,
+            "metric_type": METRIC_TYPE,
+            "timestamp": self.started_at,
+            "run_id": self.run_id,
+            "attempt_id": self.attempt_id,
+            "stage": self.stage,
+            "parent": self.parent,
+            "status": self.status,
+            "error": self.error,
+            "wall_time": round(self.wall_time, 4),
+            "cpu_time": round(self.cpu_time, 4),
+            "peak_rss_mb": round(self.peak_rss_mb, 1),
+            "rss_growth_mb": round(self.rss_growth_mb, 1),
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "storage_round_trips": self.storage_round_trips,
+            "overlapped": self.overlapped,
+        }
+
+
+# Stages open in the current thread or task, innermost last. Threads
+# started with a copy of the context share their enclosing stages.
+_active_stages: ContextVar[Tuple[StageRun, ...]] = ContextVar(
+    "active_stages", default=()
+)
+_counters_lock = threading.Lock()
+# Stages open in all threads, by id
+_open_runs: Dict[int, StageRun] = {}
+
+
+def new_run_id() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+
+
+def current_run_id() -> Optional[str]:
+    active = _active_stages.get()
+    return active[-1].run_id if active else None
+
+
+@contextmanager
+def track_stage(stage: str, run_id: Optional[str] = None) -> Iterator[StageRun]:
+    """
+    Measure the block as stage and save it when the block exits,
+    failed stages are saved with status "failed" and re-raised.
+
+    The run and attempt ids are taken from the enclosing stage, a
+    top-level stage starts a new attempt, and a new run unless run_id
+    is given. CPU time includes pool workers which exited during the
+    stage. Peak RSS is the high-water mark of the process and its exited
+    workers at the end of the stage, rss_growth_mb is how much the stage
+    raised it. Both are measured for the whole process, so a stage which
+    overlapped with stages of other threads includes their work, and is
+    saved with overlapped set.
+    """
+    active = _active_stages.get()
+    parent = active[-1] if active else None
+    run = StageRun(
+        stage=stage,
+        run_id=run_id or (parent.run_id if parent else new_run_id()),
+        attempt_id=parent.attempt_id if parent else uuid.uuid4().hex[:8],
+        parent=parent.stage if parent else None,
+    )
+    _open(run, active)
+    token = _active_stages.set(active + (run,))
+    start_rss = _peak_rss_mb()
+    start_cpu = _cpu_time()
+    start = time.perf_counter()
+    try:
+        yield run
+        run.status = "success"
+    except BaseException as e:
+        run.status = "failed"
+        run.error = repr(e)
+        raise
+    finally:
+        run.wall_time = time.perf_counter() - start
+        run.cpu_time = _cpu_time() - start_cpu
+        run.peak_rss_mb = _peak_rss_mb()
+        run.rss_growth_mb = run.peak_rss_mb - start_rss
+        _active_stages.reset(token)
+        with _counters_lock:
+            del _open_runs[id(run)]
+        save_stage_run(run)
+        log.info(
+            f"Stage {stage} {run.status} in {run.wall_time:.2f}s "
+            f"(cpu {run.cpu_time:.2f}s, peak RSS {run.peak_rss_mb:.0f} MB, "
+            f"items {run.items_in} -> {run.items_out}, "
+            f"{run.storage_round_trips} storage round-trips)"
+        )
+
+
+def tracked(function: F) -> F:
+    """
+    Decorator which tracks every call of function as a stage
+    named after the function.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with track_stage(function.__name__):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def record_items(items_in: int = 0, items_out: int = 0) -> None:
+    """
+    Add items read and produced by the current stage.
+    """
+    active = _active_stages.get()
+    if not active:
+        return None
+    with _counters_lock:
+        active[-1].items_in += items_in
+        active[-1].items_out += items_out
+    return None
+
+
+def record_round_trips(count: int = 1) -> None:
+    """
+    Called by the storage backends on every request to the database.
+    """
+    active = _active_stages.get()
+    if not active:
+        return None
+    with _counters_lock:
+        for run in active:
+            run.storage_round_trips += count
+    return None
+
+
+def _open(run: StageRun, enclosing: Tuple[StageRun, ...]) -> None:
+    # Stages open in other threads share the process with run, the
+    # stages it is nested in measure its work anyway
+    nested_in = {id(stage) for stage in enclosing}
+    with _counters_lock:
+        for key, other in _open_runs.items():
+            if key not in nested_in:
+                other.overlapped = True
+                run.overlapped = True
+        _open_runs[id(run)] = run
+    return None
+
+
+def save_stage_run(run: StageRun) -> None:
+    # Telemetry must not fail the pipeline, and its own writes are not
+    # counted as round-trips of the enclosing stages
+    from ..storages import initialize_storage
+
+    token = _active_stages.set(())
+    try:
+        initialize_storage("metric").set_metrics([run.to_metric()])
+    except Exception as e:
+        log.error(f"Failed to save telemetry of stage {run.stage}: {e}")
+    finally:
+        _active_stages.reset(token)
+    return None
+
+
+def _cpu_time() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def _peak_rss_mb() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return max(own, children) / scale
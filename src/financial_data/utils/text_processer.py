@@ -1,4 +1,6 @@
-from typing import List
+from functools import lru_cache
+import re
+from typing import Dict, Iterable, List, Optional
 
 import nltk
 from nltk.tokenize import word_tokenize
@@ -6,8 +8,25 @@ from nltk.corpus import stopwords
 import pymorphy3
 
 
-nltk.download("stopwords")
-nltk.download("punkt_tab")
+DEFAULT_LEMMA_CACHE_SIZE = 100_000
+NLTK_RESOURCES = {
+    "stopwords": "corpora/stopwords",
+    "punkt_tab": "tokenizers/punkt_tab",
+}
+
+_CYRILLIC = re.compile("[\u0400-\u04ff]")
+
+
+def ensure_nltk_resources() -> None:
+    """
+    Download NLTK resources which are not found locally.
+    """
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(name, quiet=True)
+    return None
 
 
 class TextProcesser:
@@ -15,15 +34,48 @@ class TextProcesser:
     Text handler for analyze and processing data
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self, lemma_cache_size: Optional[int] = DEFAULT_LEMMA_CACHE_SIZE
+    ) -> None:
+        """
+        Parameters
+        ----------
+        lemma_cache_size: Optional[int]
+            How many token lemmas to memoize (least recently used are
+            evicted), None for an unbounded cache, 0 to disable it
+        """
+        ensure_nltk_resources()
         self.morph = pymorphy3.MorphAnalyzer()
         self.stop_words_ru = set(stopwords.words("russian"))
         self.stop_words_en = set(stopwords.words("english"))
         self.all_stopwords = self.stop_words_en | self.stop_words_ru
+        self._stop_words = {"ru": self.stop_words_ru, "en": self.stop_words_en}
+        self._lemmatize = lru_cache(maxsize=lemma_cache_size)(self._parse)
+
+    @property
+    def lemma_cache_hits(self) -> int:
+        return self._lemmatize.cache_info().hits
+
+    @property
+    def lemma_cache_misses(self) -> int:
+        return self._lemmatize.cache_info().misses
+
+    @property
+    def lemma_cache_hit_rate(self) -> float:
+        info = self._lemmatize.cache_info()
+        total = info.hits + info.misses
+        return info.hits / total if total else 0.0
+
+    @staticmethod
+    def detect_language(token: str) -> str:
+        """
+        "ru" for tokens with Cyrillic letters, "en" otherwise.
+        """
+        return "ru" if _CYRILLIC.search(token) else "en"
 
     def process_text(self, text: str) -> List[str]:
         """
-        Auto detect language (en or ru) and apply:
+        Detect language (en or ru) of every token by its script and apply:
         - tokenization
         - lematization
         - delete stop words
@@ -38,16 +90,55 @@ class TextProcesser:
         List[str]
             Tokens without stop words in normal form
         """
-        tokens = word_tokenize(text)
-        processed_tokens = []
-        for token in tokens:
+        return [self._lemmatize(token) for token in self._tokenize(text)]
+
+    def process_texts(self, texts: Iterable[str]) -> List[List[str]]:
+        """
+        Vocabulary-level mode of process_text for a batch of texts:
+        every unique token of the batch is lemmatized once.
+
+        Parameters
+        ----------
+        texts: Iterable[str]
+            Input data in russian or english language
+
+        Returns
+        -------
+        List[List[str]]
+            Result of process_text for every text
+        """
+        tokenized = [self._tokenize(text) for text in texts]
+        vocabulary: Dict[str, str] = {}
+        for tokens in tokenized:
+            for token in tokens:
+                if token not in vocabulary:
+                    vocabulary[token] = self._lemmatize(token)
+        return [[vocabulary[token] for token in tokens] for tokens in tokenized]
+
+    def _tokenize(self, text: str) -> List[str]:
+        """
+        Lowercase word tokens without stop words of their language.
+        Lemmas don't depend on case, so lowercase tokens make better
+        cache keys.
+        """
+        tokens = []
+        for token in word_tokenize(text):
             token_lower = token.lower()
             if not (
                 token_lower.isalpha()
-                and any(c.isalpha() for c in token_lower)
-                and token_lower not in self.all_stopwords
+                and token_lower
+                not in self._stop_words[self.detect_language(token_lower)]
             ):
                 continue
-            lemma = self.morph.parse(token)[0].normal_form
-            processed_tokens.append(lemma)
-        return processed_tokens
+            tokens.append(token_lower)
+        return tokens
+
+    def _parse(self, token: str) -> str:
+        """
+        Russian tokens are lemmatized by pymorphy3. For other tokens
+        its analyzer only returns the lowercase token, so they are
+        normalized without it.
+        """
+        if self.detect_language(token) == "en":
+            return token
+        return self.morph.parse(token)[0].normal_form
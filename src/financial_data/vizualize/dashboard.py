@@ -74,6 +74,21 @@ def main():
     )
     st.plotly_chart(fig_sentences)
 
+    # Доля русских и английских слов по источникам
+    if {"words_ru", "words_en"} <= set(filtered_df.columns):
+        languages_df = (
+            filtered_df.groupby("source_name")[["words_ru", "words_en"]]
+            .sum()
+            .reset_index()
+        )
+        fig_languages = px.bar(
+            languages_df,
+            x="source_name",
+            y=["words_ru", "words_en"],
+            title="Words by Language and Source",
+        )
+        st.plotly_chart(fig_languages)
+
     # Тепловая карта по времени
     daily_stats = (
         filtered_df.groupby(filtered_df["timestamp"].dt.date)["tokens"]
@@ -0,0 +1,142 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+
+from financial_data.storages import initialize_storage
+from financial_data.utils.telemetry import METRIC_TYPE
+
+
+def load_runs_to_dataframe():
+    metrics_storage = initialize_storage("metric")
+    metrics = metrics_storage.get_metrics_by_type(METRIC_TYPE)
+    df = pd.DataFrame(metrics)
+    if df.empty:
+        return df
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df = keep_last_attempts(df)
+    # Время запуска - начало его первого этапа
+    df["run_started_at"] = df.groupby("run_id")["timestamp"].transform("min")
+    return df.sort_values(["run_started_at", "timestamp"])
+
+
+def keep_last_attempts(df):
+    """
+    Продолженный запуск сохраняет свой run_id, для каждого этапа
+    запуска остаются только строки последней попытки, в которой он
+    выполнялся.
+    """
+    if "attempt_id" not in df:
+        df["attempt_id"] = df["run_id"]
+    # Запуски без attempt_id записаны до их появления, одной попыткой
+    df["attempt_id"] = df["attempt_id"].fillna(df["run_id"])
+    attempt_started_at = df.groupby(["run_id", "attempt_id"])[
+        "timestamp"
+    ].transform("min")
+    last_attempt = attempt_started_at.groupby(
+        [df["run_id"], df["stage"]]
+    ).transform("max")
+    return df[attempt_started_at == last_attempt]
+
+
+def compare_with_previous_runs(df, last_run_id):
+    """
+    Время этапов последнего запуска против медианы предыдущих запусков.
+    Вложенный шаг, вызванный несколько раз, суммируется по запуску.
+    """
+    last = df[df["run_id"] == last_run_id].groupby("stage")["wall_time"].sum()
+    previous = (
+        df[(df["run_id"] != last_run_id) & (df["status"] == "success")]
+        .groupby(["run_id", "stage"])["wall_time"]
+        .sum()
+        .groupby("stage")
+        .median()
+    )
+    comparison = pd.DataFrame(
+        {"last_run, s": last, "previous_median, s": previous}
+    ).dropna(subset=["last_run, s"])
+    comparison["change, %"] = (
+        (comparison["last_run, s"] / comparison["previous_median, s"] - 1) * 100
+    ).round(1)
+    return comparison.sort_values("change, %", ascending=False)
+
+
+def main():
+    st.title("Pipeline Runs")
+
+    df = load_runs_to_dataframe()
+    if df.empty:
+        st.info("No pipeline runs recorded yet")
+        return
+
+    # Боковая панель с фильтрами
+    st.sidebar.header("Filters")
+    runs = df["run_id"].unique()
+    last_runs = st.sidebar.slider(
+        "Last Runs",
+        min_value=1,
+        max_value=len(runs),
+        value=min(len(runs), 20),
+    )
+    stages = st.sidebar.multiselect(
+        "Select Stages",
+        options=df["stage"].unique(),
+        default=df["stage"].unique(),
+    )
+    filtered_df = df[
+        df["run_id"].isin(runs[-last_runs:]) & df["stage"].isin(stages)
+    ]
+    last_run_id = runs[-1]
+    last_run_df = filtered_df[filtered_df["run_id"] == last_run_id]
+
+    # Последний запуск
+    st.header("Last Run")
+    col1, col2, col3 = st.columns(3)
+    top_level = df[(df["run_id"] == last_run_id) & df["parent"].isna()]
+    with col1:
+        st.metric("Run", last_run_id)
+    with col2:
+        st.metric("Wall Time, s", round(top_level["wall_time"].sum(), 1))
+    with col3:
+        failed = (df[df["run_id"] == last_run_id]["status"] == "failed").sum()
+        st.metric("Failed Stages", int(failed))
+
+    # Время этапов по запускам
+    st.header("Stage Timings Across Runs")
+    fig_timings = px.line(
+        filtered_df,
+        x="run_started_at",
+        y="wall_time",
+        color="stage",
+        markers=True,
+        hover_data=["run_id", "status", "cpu_time", "items_in", "items_out"],
+        title="Wall Time by Stage",
+    )
+    st.plotly_chart(fig_timings)
+
+    # Сравнение с предыдущими запусками
+    st.header("Regressions")
+    st.dataframe(compare_with_previous_runs(filtered_df, last_run_id))
+
+    # Память и обращения к хранилищу в последнем запуске
+    fig_memory = px.bar(
+        last_run_df,
+        x="stage",
+        y="peak_rss_mb",
+        title="Peak RSS by Stage, MB",
+    )
+    st.plotly_chart(fig_memory)
+    fig_round_trips = px.bar(
+        last_run_df,
+        x="stage",
+        y="storage_round_trips",
+        title="Storage Round-Trips by Stage",
+    )
+    st.plotly_chart(fig_round_trips)
+
+    # Детальная таблица
+    st.header("Detailed Data")
+    st.dataframe(filtered_df.drop("_id", axis=1, errors="ignore"))
+
+
+if __name__ == "__main__":
+    main()
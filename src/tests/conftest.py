@@ -0,0 +1,90 @@
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import pytest
+
+
+# (status, headers, body) of a response to a request with headers
+Route = Callable[[Dict[str, str]], Tuple[int, Dict[str, str], bytes]]
+
+
+class FixtureServer:
+    """
+    Local HTTP server for collector tests. Every path is answered by
+    its route, received requests are recorded as (path, headers).
+    """
+
+    def __init__(self) -> None:
+        self.routes: Dict[str, Route] = {}
+        self.requests: List[Tuple[str, Dict[str, str]]] = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+
+    def page(self, path: str, body: str, etag: bool = True) -> None:
+        self.routes[path] = static_page(body, etag)
+        return None
+
+    def requests_to(self, path: str) -> List[Dict[str, str]]:
+        with self._lock:
+            return [headers for p, headers in self.requests if p == path]
+
+    def _handler(self) -> type:
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                headers = dict(self.headers.items())
+                with fixture._lock:
+                    fixture.requests.append((self.path, headers))
+                route = fixture.routes.get(self.path)
+                if route is None:
+                    status, response_headers, body = 404, {}, b""
+                else:
+                    status, response_headers, body = route(headers)
+                self.send_response(status)
+                for name, value in response_headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: object) -> None:
+                return None
+
+        return Handler
+
+
+def static_page(body: str, etag: bool = True) -> Route:
+    """
+    Route with a fixed body which answers 304 to a matching
+    If-None-Match, like a server with ETags does.
+    """
+    content = body.encode("utf-8")
+    tag = f'"{hashlib.sha256(content).hexdigest()[:16]}"'
+
+    def route(headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        if etag and headers.get("If-None-Match") == tag:
+            return 304, {"ETag": tag}, b""
+        response_headers = {"Content-Type": "text/html; charset=utf-8"}
+        if etag:
+            response_headers["ETag"] = tag
+        return 200, response_headers, content
+
+    return route
+
+
+@pytest.fixture
+def http_server() -> Iterator[FixtureServer]:
+    server = FixtureServer()
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
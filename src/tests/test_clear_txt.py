@@ -0,0 +1,43 @@
+import re
+
+import pytest
+
+from financial_data.preprocessing.clear_txt import (
+    MultiPatternMatcher,
+    TextFileProcessor,
+    TextProcessingPatterns,
+)
+
+
+@pytest.mark.parametrize(
+    "patterns",
+    [
+        # Group numbers shift once patterns are joined into one alternation
+        ["(x)", r"(y)\1"],
+        ["(x)", "(y)(?(1)y|z)"],
+        ["(?P<a>x)", "(?P<a>y)"],
+        ["(?i)word", "other"],
+    ],
+)
+def test_matcher_is_same_as_separate_patterns(patterns):
+    compiled = [re.compile(pattern) for pattern in patterns]
+    matcher = MultiPatternMatcher(compiled)
+    for line in ["yz", "yy", "x", "WORD", "other", "ok"]:
+        expected = any(pattern.search(line) for pattern in compiled)
+        assert matcher.search(line) == expected, line
+
+
+def test_inline_patterns_remove_lines():
+    patterns = TextProcessingPatterns.from_config(
+        {
+            "remove_patterns": {
+                "inline_patterns": [
+                    {"pattern": "(x)"},
+                    {"pattern": "(y)(?(1)y|z)"},
+                    {"pattern": "www."},
+                ]
+            }
+        }
+    )
+    document = "yz\nyy\nsee www.site.ru\nok"
+    assert TextFileProcessor(patterns).process_document(document) == "yz\nok"
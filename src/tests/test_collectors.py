@@ -0,0 +1,229 @@
+import json
+
+import pytest
+
+from financial_data.collect import bcs, tinkoff
+
+
+BCS_PART_ATTRS = (
+    f'data-id="{bcs.COURSE_DATA_ID}" class="{bcs.COURSE_DATA_CLASS}"'
+)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Collectors write to ./data, telemetry goes to a SQLite file
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("StorageBackend", "sqlite")
+    monkeypatch.setenv("SQLitePath", str(tmp_path / "storage.sqlite3"))
+    monkeypatch.setenv("MetricsCollectionName", "metrics")
+    return tmp_path
+
+
+def serve_tinkoff(server, courses):
+    """
+    Courses page, course pages and lessons of the Tinkoff layout.
+    courses: course path -> list of (lesson path, lesson text)
+    """
+    server.page(
+        "/about/",
+        f'<div><h2 class="{tinkoff.COURSES_CLASS}">{tinkoff.COURSES_TEXT}'
+        "</h2></div><div>"
+        + "".join(f'<a href="{course}">{course}</a>' for course in courses)
+        + "</div>",
+    )
+    for course, lessons in courses.items():
+        server.page(
+            course,
+            "".join(
+                f'<div class="{tinkoff.LESSON_CARD_CLASS}">'
+                f'<a href="{path}">{path}</a></div>'
+                for path, _ in lessons
+            ),
+        )
+        for path, text in lessons:
+            title, subtitle, article = tinkoff.COURSE_DATA_CLASSES
+            server.page(
+                path,
+                f'<h1 class="{title}">{path}</h1>'
+                f'<div class="{subtitle}">subtitle</div>'
+                f'<div class="{article}">{text}</div>',
+            )
+
+
+@pytest.fixture
+def tinkoff_site(http_server, workdir, monkeypatch):
+    monkeypatch.setattr(tinkoff, "BASE_URL", http_server.url)
+    monkeypatch.setattr(tinkoff, "COURSES_URL", http_server.url + "/about/")
+    tinkoff.OUTPUT_DIR.mkdir(parents=True)
+    return http_server
+
+
+def read_outputs(output_dir):
+    return {
+        path.stem: path.read_text() for path in sorted(output_dir.iterdir())
+    }
+
+
+def parse_tinkoff():
+    tinkoff.parse_tinkoff_courses(rps=100)
+    return read_outputs(tinkoff.OUTPUT_DIR)
+
+
+def test_tinkoff_outputs_by_position(tinkoff_site):
+    serve_tinkoff(
+        tinkoff_site,
+        {
+            "/a/": [("/a/1/", "lesson a1"), ("/a/2/", "lesson a2")],
+            "/b/": [("/b/1/", "lesson b1")],
+        },
+    )
+    outputs = parse_tinkoff()
+
+    assert list(outputs) == ["0_0", "0_1", "1_0"]
+    assert "lesson a1" in outputs["0_0"]
+    assert "lesson a2" in outputs["0_1"]
+    assert "lesson b1" in outputs["1_0"]
+
+
+def test_tinkoff_unchanged_pages_are_not_rewritten(tinkoff_site):
+    courses = {"/a/": [("/a/1/", "lesson a1"), ("/a/2/", "lesson a2")]}
+    serve_tinkoff(tinkoff_site, courses)
+    parse_tinkoff()
+    mtimes = {p: p.stat().st_mtime_ns for p in tinkoff.OUTPUT_DIR.iterdir()}
+
+    serve_tinkoff(tinkoff_site, courses)
+    parse_tinkoff()
+
+    assert tinkoff_site.requests_to("/a/1/")[-1]["If-None-Match"]
+    assert {
+        p: p.stat().st_mtime_ns for p in tinkoff.OUTPUT_DIR.iterdir()
+    } == mtimes
+
+
+def test_tinkoff_inserted_lesson_shifts_outputs(tinkoff_site):
+    serve_tinkoff(
+        tinkoff_site,
+        {"/a/": [("/a/1/", "lesson a1"), ("/a/2/", "lesson a2")]},
+    )
+    parse_tinkoff()
+
+    # A new first lesson: a1 and a2 are not modified, but move to 0_1, 0_2
+    serve_tinkoff(
+        tinkoff_site,
+        {
+            "/a/": [
+                ("/a/0/", "lesson a0"),
+                ("/a/1/", "lesson a1"),
+                ("/a/2/", "lesson a2"),
+            ]
+        },
+    )
+    outputs = parse_tinkoff()
+
+    assert "lesson a0" in outputs["0_0"]
+    assert "lesson a1" in outputs["0_1"]
+    assert "lesson a2" in outputs["0_2"]
+
+
+def test_tinkoff_crash_before_outputs_are_written(tinkoff_site, monkeypatch):
+    lessons = [("/a/1/", "lesson a1"), ("/a/2/", "lesson a2")]
+    serve_tinkoff(tinkoff_site, {"/a/": lessons})
+    parse_tinkoff()
+
+    serve_tinkoff(
+        tinkoff_site,
+        {"/a/": [(path, text + " v2") for path, text in lessons]},
+    )
+    parse_course_part = tinkoff.parse_course_part
+
+    def crash_on_second(response):
+        if response.url.endswith("/a/2/"):
+            raise RuntimeError("crash")
+        return parse_course_part(response)
+
+    monkeypatch.setattr(tinkoff, "parse_course_part", crash_on_second)
+    with pytest.raises(RuntimeError):
+        tinkoff.parse_tinkoff_courses(rps=100)
+    monkeypatch.setattr(tinkoff, "parse_course_part", parse_course_part)
+    outputs = parse_tinkoff()
+
+    assert "lesson a1 v2" in outputs["0_0"]
+    assert "lesson a2 v2" in outputs["0_1"]
+
+
+def test_tinkoff_edited_output_is_restored(tinkoff_site):
+    serve_tinkoff(tinkoff_site, {"/a/": [("/a/1/", "lesson a1")]})
+    parse_tinkoff()
+    (tinkoff.OUTPUT_DIR / "0_0.html").write_text("something else")
+
+    serve_tinkoff(tinkoff_site, {"/a/": [("/a/1/", "lesson a1")]})
+    outputs = parse_tinkoff()
+
+    assert "lesson a1" in outputs["0_0"]
+
+
+@pytest.fixture
+def bcs_site(http_server, workdir, monkeypatch):
+    params_path = workdir / "bks_params.json"
+    params_path.write_text(json.dumps({"cookies": {}, "headers": {}}))
+    monkeypatch.setattr(bcs, "REQUEST_PARAMS_PATH", params_path)
+    monkeypatch.setattr(bcs, "BASE_URL", http_server.url)
+    monkeypatch.setattr(
+        bcs, "COURSES_DATA_URL", http_server.url + "/api/courses"
+    )
+    bcs.OUTPUT_DIR.mkdir(parents=True)
+    return http_server
+
+
+def serve_bcs(server, courses):
+    """
+    courses: course path -> list of (lesson path, lesson text)
+    """
+    server.page(
+        "/api/courses",
+        json.dumps({"data": [{"url": server.url + c} for c in courses]}),
+    )
+    for course, lessons in courses.items():
+        server.page(
+            course,
+            "".join(
+                f'<a href="{server.url}{path}">{path}</a>'
+                for path, _ in lessons
+            )
+            + '<a href="https://elsewhere.example/">external</a>',
+        )
+        for path, text in lessons:
+            server.page(path, f"<div {BCS_PART_ATTRS}><p>{text}</p></div>")
+
+
+def test_bcs_outputs_by_position(bcs_site):
+    serve_bcs(
+        bcs_site,
+        {
+            "/course-a": [("/a/1", "part a1"), ("/a/2", "part a2")],
+            "/course-b": [("/b/1", "part b1")],
+        },
+    )
+    bcs.parse_bcs_courses(rps=100)
+    outputs = read_outputs(bcs.OUTPUT_DIR)
+
+    assert list(outputs) == ["0_0", "0_1", "1_0"]
+    assert "part a1" in outputs["0_0"]
+    assert "part a2" in outputs["0_1"]
+    assert "part b1" in outputs["1_0"]
+
+    # Course b moves first: its unchanged part now belongs in 0_0
+    serve_bcs(
+        bcs_site,
+        {
+            "/course-b": [("/b/1", "part b1")],
+            "/course-a": [("/a/1", "part a1"), ("/a/2", "part a2")],
+        },
+    )
+    bcs.parse_bcs_courses(rps=100)
+    outputs = read_outputs(bcs.OUTPUT_DIR)
+
+    assert "part b1" in outputs["0_0"]
+    assert "part a1" in outputs["1_0"]
+    assert "part a2" in outputs["1_1"]
@@ -0,0 +1,97 @@
+from langchain_core.documents import Document
+import pytest
+
+from financial_data.preprocessing.dedup import dedup_chunks
+from financial_data.storages import initialize_storage
+
+
+LESSON = (
+    "Облигация это долговая ценная бумага, по которой эмитент обязуется "
+    "выплатить владельцу номинал и купоны в установленные сроки"
+)
+
+
+@pytest.fixture
+def storages(tmp_path, monkeypatch):
+    monkeypatch.setenv("StorageBackend", "sqlite")
+    monkeypatch.setenv("SQLitePath", str(tmp_path / "storage.sqlite3"))
+    monkeypatch.setenv("ChunkCollectionName", "chunks")
+    monkeypatch.setenv("MetricsCollectionName", "metrics")
+    monkeypatch.setenv("RawDocumentCollectionName", "raw")
+    monkeypatch.setenv("ProcessedDocumentCollectionName", "processed")
+    return initialize_storage("chunk"), initialize_storage("metric")
+
+
+def make_chunk(chunk_id, source_name, content):
+    return Document(
+        content,
+        metadata={
+            "id": chunk_id,
+            "source_name": source_name,
+            "document_id": f"{source_name}-document",
+        },
+    )
+
+
+def test_failed_metrics_write_keeps_previous(storages, monkeypatch):
+    chunk_storage, metric_storage = storages
+    chunk_storage.set_chunks(
+        [make_chunk("a", "bcs", LESSON), make_chunk("b", "tinkoff", LESSON)]
+    )
+    dedup_chunks(threshold=0.9, drop=False)
+    previous = metric_storage.get_metrics_by_type("dedup")
+    assert {metric["source_name"] for metric in previous} == {"bcs", "tinkoff"}
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(type(metric_storage), "set_metrics", fail)
+    with pytest.raises(RuntimeError):
+        dedup_chunks(threshold=0.9, drop=False)
+
+    assert metric_storage.get_metrics_by_type("dedup") == previous
+
+
+def test_drop_resets_split_fingerprints(storages):
+    chunk_storage, _ = storages
+    document_storage = initialize_storage("document")
+    for source_name in ("bcs", "tinkoff"):
+        _id = f"{source_name}-document"
+        document_storage.set_processed_document(source_name, LESSON, _id)
+        document_storage.set_split_fingerprint(_id, "fingerprint")
+    chunk_storage.set_chunks(
+        [make_chunk("a", "bcs", LESSON), make_chunk("b", "tinkoff", LESSON)]
+    )
+    dedup_chunks(threshold=0.9, drop=True)
+
+    assert list(chunk_storage.iter_chunk_ids()) == ["a"]
+    fingerprints = {
+        document["_id"]: document.get("split_fingerprint")
+        for document in document_storage.iter_processed_documents()
+    }
+    assert fingerprints == {
+        "bcs-document": "fingerprint",
+        "tinkoff-document": None,
+    }
+
+
+def test_set_duplicates_replaces_marks(storages):
+    chunk_storage, _ = storages
+    chunk_storage.set_chunks(
+        [make_chunk(chunk_id, "bcs", LESSON) for chunk_id in "abc"]
+    )
+    assert chunk_storage.set_duplicates({"b": "a", "c": "a"}) == 2
+    assert chunk_storage.set_duplicates({"c": "b"}) == 1
+
+    metadata = {
+        chunk.metadata["id"]: chunk.metadata
+        for chunk in chunk_storage.iter_chunks()
+    }
+    assert "duplicate_of" not in metadata["a"]
+    assert "duplicate_of" not in metadata["b"]
+    assert "duplicate_generation" not in metadata["b"]
+    assert metadata["c"]["duplicate_of"] == "b"
+    assert list(chunk_storage.iter_chunk_ids(skip_duplicates=True)) == [
+        "a",
+        "b",
+    ]
@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import threading
+import time
+
+import pytest
+import requests
+
+from financial_data.collect.fetch import Fetcher, TokenBucket, get_retry_after
+from financial_data.collect.http_cache import HttpCache
+
+
+def test_retry_after_429(http_server):
+    attempts = []
+
+    def rate_limited(headers):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            return 429, {"Retry-After": "1"}, b""
+        return 200, {}, b"done"
+
+    http_server.routes["/limited"] = rate_limited
+    with Fetcher(rps=100) as fetcher:
+        response = fetcher.get(http_server.url + "/limited")
+
+    assert response.status_code == 200
+    assert response.text == "done"
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.9
+
+
+def test_retry_after_gives_up(http_server):
+    http_server.routes["/down"] = lambda headers: (
+        503,
+        {"Retry-After": "0"},
+        b"",
+    )
+    with Fetcher(rps=100, max_retries=2) as fetcher:
+        response = fetcher.get(http_server.url + "/down")
+        assert fetcher.get_many([http_server.url + "/down"]) == [None]
+
+    assert response.status_code == 503
+    assert len(http_server.requests_to("/down")) == 6
+
+
+def test_retry_after_header_formats():
+    response = requests.Response()
+    assert get_retry_after(response) is None
+    response.headers["Retry-After"] = "3"
+    assert get_retry_after(response) == 3.0
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    response.headers["Retry-After"] = format_datetime(retry_at, usegmt=True)
+    assert 25 < get_retry_after(response) <= 30
+    response.headers["Retry-After"] = "soon"
+    assert get_retry_after(response) is None
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(rate=20, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.45
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket(rate=100)
+    bucket.pause(0.3)
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.25
+
+
+def test_fetcher_rate_limit(http_server):
+    http_server.page("/page", "body", etag=False)
+    urls = [http_server.url + "/page"] * 6
+    with Fetcher(rps=10, concurrency=4) as fetcher:
+        start = time.monotonic()
+        responses = fetcher.get_many(urls)
+        elapsed = time.monotonic() - start
+
+    assert [response.text for response in responses] == ["body"] * 6
+    # A burst of 10 tokens, then 10 per second: 6 pages fit in the burst
+    assert elapsed < 0.5
+
+    with Fetcher(rps=5, concurrency=4) as fetcher:
+        start = time.monotonic()
+        fetcher.get_many(urls * 2)
+        elapsed = time.monotonic() - start
+    # 5 pages in the burst, the other 7 at 5 per second
+    assert elapsed >= 1.2
+
+
+def test_conditional_request_not_modified(http_server, tmp_path):
+    http_server.page("/lesson", "<p>lesson</p>")
+    url = http_server.url + "/lesson"
+
+    cache = HttpCache(tmp_path)
+    with Fetcher(cache=cache) as fetcher:
+        first = fetcher.get(url)
+    cache.save()
+    assert not first.unchanged
+    assert "If-None-Match" not in http_server.requests_to("/lesson")[0]
+
+    cache = HttpCache(tmp_path)
+    with Fetcher(cache=cache) as fetcher:
+        second = fetcher.get(url)
+    request_headers = http_server.requests_to("/lesson")[1]
+    assert request_headers["If-None-Match"] == first.headers["ETag"]
+    assert second.status_code == 304
+    assert second.unchanged
+    assert second.text == "<p>lesson</p>"
+    assert cache.revalidated == 1
+
+
+def test_conditional_request_modified(http_server, tmp_path):
+    http_server.page("/lesson", "<p>old</p>")
+    url = http_server.url + "/lesson"
+    cache = HttpCache(tmp_path)
+    with Fetcher(cache=cache) as fetcher:
+        fetcher.get(url)
+        http_server.page("/lesson", "<p>new</p>")
+        response = fetcher.get(url)
+
+    assert response.status_code == 200
+    assert not response.unchanged
+    assert response.text == "<p>new</p>"
+    assert cache.load_body(url) == b"<p>new</p>"
+
+
+def test_same_body_without_validators(http_server, tmp_path):
+    http_server.page("/plain", "<p>same</p>", etag=False)
+    url = http_server.url + "/plain"
+    cache = HttpCache(tmp_path)
+    with Fetcher(cache=cache) as fetcher:
+        first = fetcher.get(url)
+        second = fetcher.get(url)
+
+    assert not first.unchanged
+    assert second.status_code == 200
+    assert second.unchanged
+    assert cache.conditional_headers(url) == {}
+
+
+@pytest.mark.parametrize("status", [404, 500])
+def test_error_is_not_cached(http_server, tmp_path, status):
+    http_server.routes["/error"] = lambda headers: (status, {}, b"error")
+    url = http_server.url + "/error"
+    cache = HttpCache(tmp_path)
+    with Fetcher(cache=cache, max_retries=0) as fetcher:
+        assert fetcher.get_many([url]) == [None]
+    assert url not in cache.entries
+
+
+def cached_response(url, body):
+    response = requests.Response()
+    response.url = url
+    response.status_code = 200
+    response._content = body
+    response.headers["ETag"] = f'"{len(body)}"'
+    return response
+
+
+def test_concurrent_caches_keep_each_others_entries(tmp_path):
+    bcs_cache, tinkoff_cache = HttpCache(tmp_path), HttpCache(tmp_path)
+    bcs_cache.store("https://bcs/1", cached_response("https://bcs/1", b"a"))
+    tinkoff_cache.store("https://t/1", cached_response("https://t/1", b"bb"))
+    tinkoff_cache.save()
+    bcs_cache.save()
+
+    assert set(HttpCache(tmp_path).entries) == {"https://bcs/1", "https://t/1"}
+
+
+def test_parallel_saves(tmp_path):
+    caches = [HttpCache(tmp_path) for _ in range(8)]
+    for i, cache in enumerate(caches):
+        url = f"https://site/{i}"
+        cache.store(url, cached_response(url, b"body"))
+    threads = [threading.Thread(target=cache.save) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(HttpCache(tmp_path).entries) == 8
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+from pathlib import Path
+import threading
+
+import pytest
+
+
+# The package exports the pdf2txt stage under the name of its module
+pdf2txt = importlib.import_module("financial_data.preprocessing.pdf2txt")
+
+
+PAGE_COUNTS = {"a.pdf": 3, "b.pdf": 4, "broken.pdf": 5}
+
+
+@pytest.fixture
+def fake_pdfs(monkeypatch):
+    """
+    Textbooks of PAGE_COUNTS, page i of a textbook is "<name>:<i>;".
+    Shards of b.pdf wait until a.pdf is received, shard 2-3 of
+    broken.pdf fails.
+    """
+    a_received = threading.Event()
+
+    def read_pdf_layout(pdf_file):
+        return PAGE_COUNTS[pdf_file.name], None
+
+    def convert_pdf_pages(pdf_file, pages, hdr_info):
+        if pdf_file.name == "b.pdf":
+            assert a_received.wait(timeout=5), "a.pdf was not yielded"
+        if pdf_file.name == "broken.pdf" and 2 in pages:
+            raise ValueError("broken page")
+        return "".join(f"{pdf_file.name}:{page};" for page in pages)
+
+    monkeypatch.setattr(pdf2txt, "read_pdf_layout", read_pdf_layout)
+    monkeypatch.setattr(pdf2txt, "convert_pdf_pages", convert_pdf_pages)
+    return a_received
+
+
+def test_textbooks_are_yielded_as_they_finish(fake_pdfs):
+    pdf_files = [(Path(name).stem, Path(name)) for name in PAGE_COUNTS]
+    failed = []
+    converted = {}
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for source_name, md_data in pdf2txt.convert_pdfs_in_pool(
+            pool, pdf_files, 2, failed
+        ):
+            converted[source_name] = md_data
+            if source_name == "a":
+                fake_pdfs.set()
+
+    assert converted == {
+        "a": "a.pdf:0;a.pdf:1;a.pdf:2;",
+        "b": "b.pdf:0;b.pdf:1;b.pdf:2;b.pdf:3;",
+    }
+    assert failed == [Path("broken.pdf")]
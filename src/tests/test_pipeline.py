@@ -0,0 +1,164 @@
+import threading
+import time
+
+from click.testing import CliRunner
+import pytest
+
+from financial_data import main
+from financial_data.pipeline import Checkpoint, Stage, run_pipeline
+from financial_data.storages import initialize_storage
+from financial_data.utils.telemetry import METRIC_TYPE, tracked
+
+
+@pytest.fixture
+def checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setenv("StorageBackend", "sqlite")
+    monkeypatch.setenv("SQLitePath", str(tmp_path / "storage.sqlite3"))
+    monkeypatch.setenv("MetricsCollectionName", "metrics")
+    return Checkpoint(tmp_path / "checkpoint.json")
+
+
+class Recorder:
+    """
+    Stage functions which record when they ran.
+    """
+
+    def __init__(self) -> None:
+        self.calls: list = []
+        self.lock = threading.Lock()
+
+    def stage(self, name, duration=0.0, fail=False):
+        def function():
+            start = time.monotonic()
+            time.sleep(duration)
+            with self.lock:
+                self.calls.append((name, start, time.monotonic()))
+            if fail:
+                raise RuntimeError(name)
+
+        function.__name__ = name
+        return tracked(function)
+
+    def ran(self):
+        return [name for name, _, _ in self.calls]
+
+    def overlapping(self, name):
+        _, start, end = next(call for call in self.calls if call[0] == name)
+        return {
+            other
+            for other, other_start, other_end in self.calls
+            if other != name and other_start < end and start < other_end
+        }
+
+
+def stage_runs():
+    metrics = initialize_storage("metric").get_metrics_by_type(METRIC_TYPE)
+    return {metric["stage"]: metric for metric in metrics}
+
+
+def test_exclusive_stage_runs_alone(checkpoint):
+    recorder = Recorder()
+    stages = [
+        Stage("a", recorder.stage("a", 0.2)),
+        Stage("b", recorder.stage("b", 0.2)),
+        Stage("pool", recorder.stage("pool", 0.2), exclusive=True),
+        Stage("c", recorder.stage("c", 0.2)),
+    ]
+    run_pipeline(stages, checkpoint=checkpoint)
+
+    assert sorted(recorder.ran()) == ["a", "b", "c", "pool"]
+    assert recorder.overlapping("a") == {"b"}
+    assert recorder.overlapping("pool") == set()
+    runs = stage_runs()
+    assert runs["a"]["overlapped"] and runs["b"]["overlapped"]
+    assert not runs["pool"]["overlapped"]
+    assert not runs["c"]["overlapped"]
+
+
+def test_resume_skips_finished_stages(checkpoint, tmp_path):
+    recorder = Recorder()
+    stages = [
+        Stage("a", recorder.stage("a")),
+        Stage("b", recorder.stage("b", fail=True), depends_on=("a",)),
+    ]
+    with pytest.raises(RuntimeError):
+        run_pipeline(stages, checkpoint=checkpoint)
+    stages[1] = Stage("b", recorder.stage("b"), depends_on=("a",))
+    run_pipeline(stages, checkpoint=Checkpoint(tmp_path / "checkpoint.json"))
+
+    assert recorder.ran() == ["a", "b", "b"]
+    attempts = {
+        metric["attempt_id"]
+        for metric in initialize_storage("metric").get_metrics_by_type(
+            METRIC_TYPE
+        )
+    }
+    assert len(attempts) == 2
+
+
+def test_rerun_invalidates_finished_stages(checkpoint, tmp_path):
+    recorder = Recorder()
+    stages = [
+        Stage("a", recorder.stage("a")),
+        Stage("b", recorder.stage("b"), depends_on=("a",)),
+        Stage("c", recorder.stage("c"), depends_on=("b",)),
+        Stage("d", recorder.stage("d", fail=True), depends_on=("a",)),
+    ]
+    with pytest.raises(RuntimeError):
+        run_pipeline(stages, checkpoint=checkpoint)
+    recorder.calls.clear()
+
+    # Like --from b: b and c run again in the resumed run
+    resumed = Checkpoint(tmp_path / "checkpoint.json")
+    assert set(resumed.completed) == {"a", "b", "c"}
+    run_pipeline(stages[1:3], checkpoint=resumed, rerun={"b", "c"})
+
+    assert recorder.ran() == ["b", "c"]
+
+
+def test_subset_keeps_partial_run_resumable(checkpoint, tmp_path):
+    recorder = Recorder()
+    stages = [
+        Stage("a", recorder.stage("a")),
+        Stage("b", recorder.stage("b"), depends_on=("a",)),
+        Stage("c", recorder.stage("c", fail=True), depends_on=("b",)),
+    ]
+    with pytest.raises(RuntimeError):
+        run_pipeline(stages, checkpoint=checkpoint, graph=stages)
+    run_id = checkpoint.run_id
+    recorder.calls.clear()
+
+    # Like "main b": b runs again, c is still to be done
+    subset = Checkpoint(tmp_path / "checkpoint.json")
+    run_pipeline(stages[1:2], checkpoint=subset, rerun={"b"}, graph=stages)
+    assert recorder.ran() == ["b"]
+    resumed = Checkpoint(tmp_path / "checkpoint.json")
+    assert resumed.run_id == run_id
+    assert set(resumed.completed) == {"a", "b"}
+
+    stages[2] = Stage("c", recorder.stage("c"), depends_on=("b",))
+    run_pipeline(stages, checkpoint=resumed, graph=stages)
+    assert recorder.ran() == ["b", "c"]
+    assert Checkpoint(tmp_path / "checkpoint.json").run_id is None
+
+
+@pytest.mark.parametrize(
+    "args, rerun",
+    [
+        (["clear_txt"], {"clear_txt"}),
+        (
+            ["--from", "dedup_chunks"],
+            {"dedup_chunks", "collect_eda_metrics", "index_chunks"},
+        ),
+        ([], set()),
+    ],
+)
+def test_main_reruns_named_stages(monkeypatch, args, rerun):
+    calls = []
+    monkeypatch.setattr(
+        main, "run_pipeline", lambda stages, **kwargs: calls.append(kwargs)
+    )
+    result = CliRunner().invoke(main.main, args)
+
+    assert result.exit_code == 0, result.output
+    assert calls[0]["rerun"] == rerun
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from financial_data.preprocessing import thrd_party
+from financial_data.storages import initialize_storage
+
+
+CODEX = thrd_party.DEFAULT_CODEXES[0]
+
+
+@pytest.fixture
+def chunk_storage(tmp_path, monkeypatch):
+    monkeypatch.setenv("StorageBackend", "sqlite")
+    monkeypatch.setenv("SQLitePath", str(tmp_path / "storage.sqlite3"))
+    monkeypatch.setenv("ChunkCollectionName", "chunks")
+    return initialize_storage("chunk")
+
+
+def write_dump(path, articles):
+    path.write_text(
+        json.dumps(
+            [
+                {
+                    "name_codex": CODEX,
+                    "name_article": name,
+                    "content_article": content,
+                }
+                for name, content in articles
+            ],
+            ensure_ascii=False,
+        )
+    )
+
+
+def chunk_contents(chunk_storage):
+    return sorted(chunk.page_content for chunk in chunk_storage.iter_chunks())
+
+
+def test_rewritten_dump_deletes_stale_chunks(chunk_storage, tmp_path):
+    dump = tmp_path / "codex.json"
+    articles = [(f"Статья {i}", f"Текст статьи {i}") for i in range(5)]
+    write_dump(dump, articles)
+    thrd_party.process_file(dump, [CODEX], chunk_storage, batch_size=2)
+    assert len(chunk_contents(chunk_storage)) == 5
+
+    # The first article is edited and the last one is repealed
+    articles = [("Статья 0", "Новая редакция")] + articles[1:4]
+    write_dump(dump, articles)
+    thrd_party.process_file(dump, [CODEX], chunk_storage, batch_size=2)
+
+    assert chunk_contents(chunk_storage) == sorted(
+        content for _, content in articles
+    )